@@ -0,0 +1,207 @@
+"""
+Approximate nearest-neighbour index backend
+IVFIndex partitions the vectors into nlist clusters with spherical k-means and, per
+query, only scores the rows of the nprobe clusters whose centroids are closest.
+Run this module to build the index offline for saved documents:
+
+    python ann_index.py processed/<document_id> [...] --nlist 1024
+"""
+import argparse
+import logging
+import os
+from typing import Optional, Set
+
+import numpy as np
+
+from vector_index import VectorIndex, RESCORE_FACTOR
+
+logger = logging.getLogger(__name__)
+
+IVF_FILE = 'ivf_centroids.npy'
+IVF_NPROBE = 8  # Clusters scored per query; higher is slower with better recall
+IVF_LISTS_PER_SQRT = 4  # Default nlist is this times the square root of the number of vectors
+IVF_MIN_TRAIN_SIZE = 4096  # Below this, searches stay exact and no clusters are trained
+IVF_TRAIN_SAMPLE = 32768  # Vectors k-means is trained on
+IVF_TRAIN_ITERATIONS = 10
+IVF_ASSIGN_BLOCK_ROWS = 16384  # Rows assigned to clusters at a time
+IVF_RESORT_ROWS = 1024  # Rows inserted after the last sort that are scanned before re-sorting
+IVF_RETRAIN_GROWTH = 4  # Retrain once the rows reach this multiple of the rows the clusters were trained with
+
+
+class IVFIndex(VectorIndex):
+    """
+    Inverted-file index over the same storage as VectorIndex
+    Each row records its cluster in the lists column; rows are kept grouped by cluster
+    through a sorted permutation, so probing a cluster is a slice. Rows inserted after
+    the clusters were trained are assigned to the nearest centroid and scanned from a
+    short tail until the next re-sort. Until min_train_size rows exist the index is exact.
+    Once the rows grow retrain_growth times past the last training (or load), the
+    clusters are retrained, so nlist and the centroids keep up with the corpus.
+    Removed rows, precision and rescoring work as in VectorIndex.
+    """
+
+    COLUMNS = VectorIndex.COLUMNS + (('_lists', np.int32),)
+
+    def __init__(self, dim: Optional[int] = None, initial_capacity: int = 1024,
+                 precision: str = 'float32', rescore_factor: int = RESCORE_FACTOR,
+                 nlist: Optional[int] = None, nprobe: int = IVF_NPROBE,
+                 min_train_size: int = IVF_MIN_TRAIN_SIZE,
+                 retrain_growth: Optional[float] = IVF_RETRAIN_GROWTH):
+        """
+        nlist: number of clusters; None picks IVF_LISTS_PER_SQRT * sqrt(rows) when trained
+        nprobe: clusters scored per query, the recall/latency knob
+        min_train_size: rows needed before clusters are trained automatically
+        retrain_growth: retrain when the rows reach this multiple of the trained rows; None never retrains
+        """
+        super().__init__(dim, initial_capacity, precision=precision, rescore_factor=rescore_factor)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.retrain_growth = retrain_growth
+        self.trained_size = 0  # Rows when the clusters were trained or loaded
+        # (centroids, row permutation grouped by cluster, cluster start offsets, rows covered),
+        # replaced as one so concurrent searches never mix clusters from two trainings
+        self._layout = (None, np.empty(0, dtype=np.int64), None, 0)
+
+    @property
+    def centroids(self) -> Optional[np.ndarray]:
+        return self._layout[0]
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def memory_bytes(self) -> int:
+        total = super().memory_bytes() + self._layout[1].nbytes
+        if self.centroids is not None:
+            total += self.centroids.nbytes
+        return total
+
+    def build(self, nlist: Optional[int] = None, iterations: int = IVF_TRAIN_ITERATIONS,
+              sample_size: int = IVF_TRAIN_SAMPLE, seed: int = 0) -> None:
+        """Train the clusters on a sample of the rows and assign every row, replacing earlier clusters"""
+        with self.lock:
+            if nlist is not None:
+                self.nlist = nlist
+            self._train(self.size, iterations, sample_size, seed)
+
+    def _train(self, size: int, iterations: int = IVF_TRAIN_ITERATIONS,
+               sample_size: int = IVF_TRAIN_SAMPLE, seed: int = 0) -> None:
+        rows = np.flatnonzero(self._live[:size])
+        if len(rows) == 0:
+            return
+        nlist = self.nlist or max(1, int(IVF_LISTS_PER_SQRT * np.sqrt(len(rows))))
+        rng = np.random.default_rng(seed)
+        if len(rows) > sample_size:
+            rows = np.sort(rng.choice(rows, sample_size, replace=False))
+        data = np.asarray(self._vectors[rows])
+        nlist = min(nlist, len(data))
+
+        centroids = data[rng.choice(len(data), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = np.argmax(data @ centroids.T, axis=1)
+            order = np.argsort(assignments, kind='stable')
+            clusters, starts = np.unique(assignments[order], return_index=True)
+            centroids[clusters] = np.add.reduceat(data[order], starts, axis=0)
+            # Clusters that lost every member restart from a random sample vector
+            empty = np.setdiff1d(np.arange(nlist), clusters)
+            centroids[empty] = data[rng.choice(len(data), len(empty))]
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids /= norms
+
+        centroids = centroids.astype(np.float32)
+        self._lists[:size] = self._assign(self._vectors[:size], centroids)
+        self._sort(size, centroids)
+        self.trained_size = size
+        logger.info(f"Trained {nlist} IVF clusters on {len(data)} of {size} vectors")
+
+    @staticmethod
+    def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        """Nearest centroid of each vector"""
+        assignments = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), IVF_ASSIGN_BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + IVF_ASSIGN_BLOCK_ROWS])
+            assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        return assignments
+
+    def _sort(self, size: int, centroids: np.ndarray) -> None:
+        lists = self._lists[:size]
+        order = np.argsort(lists, kind='stable')
+        offsets = np.searchsorted(lists[order], np.arange(len(centroids) + 1))
+        self._layout = (centroids, order, offsets, size)
+
+    def _added(self, start: int, end: int) -> None:
+        if self.centroids is None:
+            if end >= self.min_train_size:
+                self._train(end)
+            return
+        if self.retrain_growth is not None and end >= self.retrain_growth * self.trained_size:
+            # Clusters trained on a fraction of the rows grow too long and no longer fit the data
+            self._train(end)
+            return
+        self._lists[start:end] = self._assign(self._vectors[start:end], self.centroids)
+        sorted_size = self._layout[3]
+        if end - sorted_size > max(IVF_RESORT_ROWS, sorted_size // 10):
+            self._sort(end, self.centroids)
+
+    def _probe(self, query_vector: np.ndarray, size: int, top_k: int) -> Optional[np.ndarray]:
+        centroids, order, offsets, sorted_size = self._layout
+        if centroids is None:
+            return None
+        ranked = np.argsort(-(centroids @ query_vector))
+        # Probe further than nprobe when the nearest clusters hold fewer than top_k rows
+        enough = np.searchsorted(np.cumsum(np.diff(offsets)[ranked]), top_k) + 1
+        probes = ranked[:max(self.nprobe, enough)]
+        rows = [order[offsets[cluster]:offsets[cluster + 1]] for cluster in probes]
+        if size > sorted_size:
+            tail = np.arange(sorted_size, size)
+            rows.append(tail[np.isin(self._lists[sorted_size:size], probes)])
+        rows = np.sort(np.concatenate(rows))  # Ascending rows keep memory-mapped reads sequential
+        if sorted_size > size:
+            # Sorted by a concurrent add that has not published its rows yet
+            rows = rows[rows < size]
+        return rows
+
+    def _saved(self, output_dir: str) -> None:
+        path = os.path.join(output_dir, IVF_FILE)
+        if self.centroids is not None:
+            with open(path + '.tmp', 'wb') as f:
+                np.save(f, self.centroids)
+            os.replace(path + '.tmp', path)
+        elif os.path.exists(path):
+            os.remove(path)
+
+    def _loaded(self, input_dir: str, saved_columns: Set[str]) -> None:
+        path = os.path.join(input_dir, IVF_FILE)
+        if 'lists' in saved_columns and os.path.exists(path):
+            self._sort(self.size, np.load(path))
+            self.trained_size = self.size
+        elif self.size >= self.min_train_size:
+            # Saved by the exact index, or before it had enough rows
+            self._lists = np.zeros(self.size, dtype=np.int32)
+            self._train(self.size)
+
+
+INDEX_BACKENDS = {'exact': VectorIndex, 'ivf': IVFIndex}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build IVF indexes for saved documents')
+    parser.add_argument('store_dirs', nargs='+', help='directories written by save_results')
+    parser.add_argument('--nlist', type=int, default=None)
+    parser.add_argument('--iterations', type=int, default=IVF_TRAIN_ITERATIONS)
+    parser.add_argument('--sample', type=int, default=IVF_TRAIN_SAMPLE)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    for store_dir in args.store_dirs:
+        # Trained once, by build, rather than also on load
+        index = IVFIndex.load(store_dir, mmap=True, min_train_size=float('inf'))
+        index.build(args.nlist, iterations=args.iterations, sample_size=args.sample)
+        index.save(store_dir)
+        logger.info(f"Built IVF index for {store_dir}: {len(index)} vectors")
+
+
+if __name__ == '__main__':
+    main()
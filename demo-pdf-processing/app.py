@@ -1,13 +1,20 @@
-from flask import Flask, request, render_template, jsonify, url_for, send_from_directory
+from flask import Flask, request, render_template, jsonify, url_for, send_from_directory, send_file, Response, stream_with_context
 from werkzeug.utils import secure_filename
 import os
-from pathlib import Path
-from pdf_processor_cohere import PDFProcessorCohere
+from corpus import CorpusRegistry
+from ingestion_jobs import JobManager
+from uploads import UploadManager, UploadError
+from janitor import Janitor
+from pdf_processor_cohere import get_blob_store, get_bedrock_clients, get_embedding_cache, get_rate_limiter, EMBEDDING_CACHE_PATH
+import metrics
+from blob_store import mime_type
+from PIL import UnidentifiedImageError
 from dotenv import load_dotenv
 import logging
-import shutil
+import math
+from contextlib import nullcontext
 import tempfile
-import time
+import json
 from datetime import datetime
 
 # Load environment variables
@@ -26,58 +33,193 @@ app = Flask(__name__,
 app.config.update(
     UPLOAD_FOLDER='uploads',
     TEMP_FOLDER='temp_chunks',
+    PROCESSED_FOLDER='processed',
     CHUNK_SIZE=5 * 1024 * 1024,  # 5MB chunks
     MAX_CONTENT_LENGTH=300 * 1024 * 1024,  # 300MB max file size
     ALLOWED_EXTENSIONS={'pdf'},
-    SESSION_TIMEOUT=3600  # 1 hour
+    SESSION_TIMEOUT=3600,  # 1 hour
+    JANITOR_INTERVAL=60,  # Seconds between cleanup runs
+    INGESTION_WORKERS=1,  # PDFs processed at the same time; further uploads are queued
+    CORPUS_MAX_MEMORY=2 * 1024 * 1024 * 1024,  # 2GB of loaded documents
+    CORPUS_IDLE_TIMEOUT=1800,  # Evict documents unused for 30 minutes
+    BLOB_MAX_AGE=365 * 24 * 3600,  # Blobs are content-addressed, so they never change
+    # Run /search and /chat on the shared event loop with the async Bedrock clients;
+    # without aiobotocore installed they fall back to the blocking clients
+    ASYNC_QUERIES=True
 )
 
-# Ensure all required directories exist
-for folder in [app.config['UPLOAD_FOLDER'], app.config['TEMP_FOLDER']]:
-    os.makedirs(folder, exist_ok=True)
-
-# Initialize global variables
-processor = None
-processing_lock = False
+# Services behind the routes, created by create_app
+registry = None
+jobs = None
+blob_store = None
+uploads = None
+janitor = None
+
+def create_app():
+    """
+    Create the folders and services the routes use and start the janitor; returns the app
+    Not done at import: PDF extraction workers are spawned processes that re-import the
+    main module, and each would otherwise build its own services and janitor.
+    """
+    global registry, jobs, blob_store, uploads, janitor
+    if registry is not None:
+        return app
+
+    # Ensure all required directories exist
+    for folder in [app.config['UPLOAD_FOLDER'], app.config['TEMP_FOLDER'], app.config['PROCESSED_FOLDER']]:
+        os.makedirs(folder, exist_ok=True)
+
+    registry = CorpusRegistry(app.config['PROCESSED_FOLDER'],
+                              max_memory_bytes=app.config['CORPUS_MAX_MEMORY'],
+                              idle_timeout=app.config['CORPUS_IDLE_TIMEOUT'])
+    jobs = JobManager(registry, max_workers=app.config['INGESTION_WORKERS'])
+    blob_store = get_blob_store()
+    uploads = UploadManager(app.config['TEMP_FOLDER'],
+                            session_timeout=app.config['SESSION_TIMEOUT'],
+                            max_file_size=app.config['MAX_CONTENT_LENGTH'])
+    janitor = Janitor(uploads, registry,
+                      folders={
+                          'temp': app.config['TEMP_FOLDER'],
+                          'uploads': app.config['UPLOAD_FOLDER'],
+                          'processed': app.config['PROCESSED_FOLDER'],
+                          'blobs': blob_store.root,
+                          'embedding_cache': os.path.dirname(EMBEDDING_CACHE_PATH)
+                      },
+                      interval=app.config['JANITOR_INTERVAL'],
+                      orphan_age=app.config['SESSION_TIMEOUT'])
+    janitor.start()
+
+    # Point-in-time values, read when /metrics is scraped
+    metrics.REGISTRY.gauge('corpus_documents', 'Registered documents, by whether they are loaded in memory',
+                           lambda: {('true',): sum(1 for d in registry.list_documents() if d['loaded']),
+                                    ('false',): sum(1 for d in registry.list_documents() if not d['loaded'])},
+                           ('loaded',))
+    metrics.REGISTRY.gauge('corpus_memory_bytes', 'Approximate RAM held by loaded documents', registry.memory_usage)
+    metrics.REGISTRY.callback_counter('embedding_cache_lookups_total', 'Embedding cache lookups since start, by result',
+                                      lambda: {(result,): get_embedding_cache().stats()[result]
+                                               for result in ('memory_hits', 'disk_hits', 'misses')},
+                                      ('result',))
+    metrics.REGISTRY.gauge('rate_limit_rate_per_minute', 'Current adaptive request rate of each Bedrock budget',
+                           lambda: {(budget,): stats['rate_per_minute'] for budget, stats in get_rate_limiter().stats().items()},
+                           ('budget',))
+    return app
 
 def allowed_file(filename):
     """Check if the file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
-def cleanup_old_files():
-    """Clean up old temporary files"""
-    try:
-        current_time = time.time()
-        # Clean up temp folder
-        for item in os.listdir(app.config['TEMP_FOLDER']):
-            item_path = os.path.join(app.config['TEMP_FOLDER'], item)
-            if os.path.getctime(item_path) < (current_time - app.config['SESSION_TIMEOUT']):
-                if os.path.isdir(item_path):
-                    shutil.rmtree(item_path)
-                else:
-                    os.remove(item_path)
-
-        # Clean up upload folder
-        for item in os.listdir(app.config['UPLOAD_FOLDER']):
-            item_path = os.path.join(app.config['UPLOAD_FOLDER'], item)
-            if os.path.getctime(item_path) < (current_time - app.config['SESSION_TIMEOUT']):
-                os.remove(item_path)
-    except Exception as e:
-        logger.error(f"Error during cleanup: {str(e)}")
-
-@app.before_request
-def before_request():
-    """Perform cleanup before each request"""
-    cleanup_old_files()
+def requested_document_ids(data):
+    """Read document_ids (list) or document_id from a request body; None means all documents"""
+    document_ids = data.get('document_ids')
+    if document_ids is None and data.get('document_id'):
+        document_ids = [data['document_id']]
+    if document_ids is not None and not isinstance(document_ids, list):
+        raise ValueError('document_ids must be a list')
+    return document_ids
+
+def async_queries():
+    """Whether /search and /chat run on the async clients"""
+    return app.config['ASYNC_QUERIES'] and get_bedrock_clients().async_available()
+
+def start_ingestion(session):
+    """
+    Finalize a complete upload and queue it for ingestion, once; returns the job
+    An upload that revises a document is queued as a revision of that document.
+    """
+    with session.lock:
+        if session.job_id is None:
+            # Documents are identified by content, so re-uploading a file reuses its saved embeddings
+            document_id = uploads.finalize(session, app.config['UPLOAD_FOLDER'])
+            pdf_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{document_id}.pdf")
+            # The job deletes the file when it finishes
+            if session.revises:
+                job = jobs.submit(session.revises, session.filename, pdf_path, revise=True)
+            else:
+                job = jobs.submit(document_id, session.filename, pdf_path)
+            session.job_id = job.job_id
+        return jobs.get(session.job_id)
+
+def upload_status(session):
+    """Session state plus the ingestion job's status URL once it has started"""
+    status = session.to_dict()
+    if session.job_id:
+        status['status_url'] = url_for('job_status', job_id=session.job_id)
+    return status
 
 @app.route('/', methods=['GET'])
 def index():
     """Render the main page"""
     return render_template('index.html')
 
+@app.route('/uploads', methods=['POST'])
+def create_upload():
+    """
+    Open an upload session, or resume the matching one
+    Body: filename, fileSize, chunkSize and optionally totalChunks, lastModified,
+    sha256 (of the whole file, checked before ingestion starts) and revises (the ID of
+    a document this file is a new version of; only its changed pages are re-embedded).
+    The response lists received_chunks, so a client only sends what is missing.
+    """
+    try:
+        data = request.json
+        filename = secure_filename(data.get('filename', ''))
+        if not filename or not allowed_file(filename):
+            return jsonify({'error': 'File type not allowed'}), 400
+        revises = data.get('revises')
+        if revises and revises not in registry:
+            return jsonify({'error': 'Unknown document'}), 404
+
+        file_size = int(data['fileSize'])
+        chunk_size = int(data.get('chunkSize', app.config['CHUNK_SIZE']))
+        total_chunks = int(data.get('totalChunks') or math.ceil(file_size / chunk_size))
+        session = uploads.open_session(filename, total_chunks, chunk_size, file_size=file_size,
+                                       client_key=str(data.get('lastModified', '')),
+                                       sha256=data.get('sha256'), revises=revises)
+        return jsonify(upload_status(session))
+
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/uploads/<upload_id>', methods=['GET'])
+def get_upload(upload_id):
+    """Report which chunks of an upload have arrived"""
+    session = uploads.get(upload_id)
+    if session is None:
+        return jsonify({'error': 'Unknown upload'}), 404
+    return jsonify(upload_status(session))
+
+@app.route('/uploads/<upload_id>/chunks/<int:chunk_number>', methods=['PUT'])
+def put_chunk(upload_id, chunk_number):
+    """
+    Write a raw chunk body straight to its offset in the upload file
+    An optional X-Chunk-Checksum header carries the chunk's SHA-256. Ingestion is
+    queued as soon as the last missing chunk arrives.
+    """
+    session = uploads.get(upload_id)
+    if session is None:
+        return jsonify({'error': 'Unknown upload'}), 404
+
+    try:
+        session.write_chunk(chunk_number, request.stream, checksum=request.headers.get('X-Chunk-Checksum'))
+        if session.complete:
+            start_ingestion(session)
+        return jsonify(upload_status(session))
+
+    except UploadError as e:
+        return jsonify({'error': str(e)}), 400
+
+    except Exception as e:
+        logger.error(f"Error uploading chunk: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/upload-chunk', methods=['POST'])
 def upload_chunk():
-    """Handle chunk upload"""
+    """
+    Handle a multipart chunk upload; kept for clients that do not open a session first
+    Clients choose their own chunk size: it is the optional chunkSize field, or else the
+    length of any chunk but the last, which are all full. A last chunk arriving before
+    any other needs chunkSize.
+    """
     try:
         if 'file' not in request.files:
             return jsonify({'error': 'No file part'}), 400
@@ -93,20 +235,40 @@ def upload_chunk():
         if not allowed_file(filename):
             return jsonify({'error': 'File type not allowed'}), 400
 
-        # Create directory for this file's chunks
-        chunk_dir = Path(app.config['TEMP_FOLDER']) / f"{filename}_chunks"
-        chunk_dir.mkdir(exist_ok=True)
-
-        # Save the chunk
-        chunk_path = chunk_dir / f"chunk_{chunk_number}"
-        file.save(chunk_path)
+        if request.form.get('uploadId'):
+            session = uploads.get(request.form['uploadId'])
+            if session is None:
+                return jsonify({'error': 'Unknown upload'}), 404
+        else:
+            chunk_size = request.form.get('chunkSize', type=int)
+            if chunk_size is None and (chunk_number < total_chunks - 1 or total_chunks == 1):
+                stream = file.stream
+                stream.seek(0, os.SEEK_END)
+                chunk_size = stream.tell()
+                stream.seek(0)
+            if chunk_size is None:
+                # The shorter last chunk, with the session opened by an earlier chunk
+                session = uploads.get(UploadManager.session_id(filename, None))
+                if session is None or session.total_chunks != total_chunks:
+                    return jsonify({'error': 'chunkSize is required when the last chunk is sent first'}), 400
+            else:
+                session = uploads.open_session(filename, total_chunks, chunk_size)
+
+        session.write_chunk(chunk_number, file.stream, checksum=request.form.get('checksum'))
+        if session.complete:
+            start_ingestion(session)
 
         logger.info(f"Chunk {chunk_number + 1}/{total_chunks} uploaded for {filename}")
 
-        return jsonify({
+        status = upload_status(session)
+        status.update({
             'message': f'Chunk {chunk_number + 1}/{total_chunks} uploaded successfully',
             'progress': ((chunk_number + 1) / total_chunks) * 100
         })
+        return jsonify(status)
+
+    except UploadError as e:
+        return jsonify({'error': str(e)}), 400
 
     except Exception as e:
         logger.error(f"Error uploading chunk: {str(e)}")
@@ -114,91 +276,163 @@ def upload_chunk():
 
 @app.route('/finalize-upload', methods=['POST'])
 def finalize_upload():
-    """Finalize the upload by merging chunks and processing the PDF"""
-    global processor, processing_lock
-
-    if processing_lock:
-        return jsonify({'error': 'Another file is currently being processed'}), 429
-
-    processing_lock = True
-
+    """
+    Queue a completed upload for background processing
+    Chunks are already in place, so this only renames the file; if the last chunk
+    already started ingestion, the existing job is returned. An optional revises
+    document ID queues the file as a revision of that document.
+    """
     try:
         data = request.json
-        filename = secure_filename(data['filename'])
-        chunk_dir = Path(app.config['TEMP_FOLDER']) / f"{filename}_chunks"
+        if data.get('upload_id'):
+            session = uploads.get(data['upload_id'])
+        else:
+            filename = secure_filename(data['filename'])
+            session = uploads.get(UploadManager.session_id(filename, None))
 
-        if not chunk_dir.exists():
+        if session is None:
             return jsonify({'error': 'No chunks found'}), 400
 
-        # Merge chunks
-        output_path = Path(app.config['UPLOAD_FOLDER']) / filename
-        with output_path.open('wb') as output_file:
-            chunk_paths = sorted(chunk_dir.glob('chunk_*'),
-                               key=lambda x: int(x.name.split('_')[1]))
-
-            for chunk_path in chunk_paths:
-                with chunk_path.open('rb') as chunk_file:
-                    output_file.write(chunk_file.read())
-
-        # Clean up chunks
-        shutil.rmtree(chunk_dir)
-
-        processor = PDFProcessorCohere()
-
-        # Process the PDF
-        content_sequence = processor.process_pdf(str(output_path))
-
-        # Clean up the merged file
-        output_path.unlink()
+        if data.get('revises'):
+            if data['revises'] not in registry:
+                return jsonify({'error': 'Unknown document'}), 404
+            with session.lock:
+                if session.job_id is None:
+                    session.revises = data['revises']
 
-        # Remove embeddings from response
-        response_sequence = []
-        for item in content_sequence:
-            item_copy = item.copy()
-            item_copy.pop('embedding', None)
-            response_sequence.append(item_copy)
-
-        logger.info(f"Successfully processed {filename}")
+        job = start_ingestion(session)
 
         return jsonify({
-            'content_sequence': response_sequence,
-            'message': 'File processed successfully'
-        })
+            'job_id': job.job_id,
+            'document_id': job.document_id,
+            'status_url': url_for('job_status', job_id=job.job_id),
+            'message': 'File queued for processing'
+        }), 202
+
+    except UploadError as e:
+        return jsonify({'error': str(e)}), 400
 
     except Exception as e:
-        logger.error(f"Error processing file: {str(e)}")
+        logger.error(f"Error finalizing upload: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-    finally:
-        processing_lock = False
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Report ingestion progress: pages done, items embedded, throughput and ETA"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/documents', methods=['GET'])
+def documents():
+    """List indexed documents and corpus memory usage"""
+    return jsonify({
+        'documents': registry.list_documents(),
+        'memory_bytes': registry.memory_usage()
+    })
+
+@app.route('/documents/<document_id>', methods=['GET'])
+def document_content(document_id):
+    """Return a document's content sequence; items appear as their pages are indexed"""
+    try:
+        processor = registry.get_processor(document_id)
+    except KeyError as e:
+        return jsonify({'error': str(e)}), 404
+    return jsonify({
+        'document_id': document_id,
+        'content_sequence': list(processor.content_sequence)
+    })
+
+@app.route('/blobs/<key>', methods=['GET'])
+def blob(key):
+    """
+    Serve an extracted image or page render by its content key
+    ?size=<width> returns a JPEG thumbnail (128, 256 or 512 pixels wide).
+    Responses carry an ETag and long-lived cache headers and support Range requests.
+    """
+    try:
+        size = request.args.get('size', type=int)
+        if size:
+            path = blob_store.thumbnail(key, size)
+            mimetype = 'image/jpeg'
+            etag = f"{key}-{size}"
+        else:
+            path = blob_store.path(key)
+            mimetype = mime_type(key)
+            etag = key
+        if not os.path.exists(path):
+            return jsonify({'error': 'Unknown blob'}), 404
+
+        response = send_file(os.path.abspath(path), mimetype=mimetype, conditional=True,
+                             etag=etag, max_age=app.config['BLOB_MAX_AGE'])
+        response.headers['Cache-Control'] = f"public, max-age={app.config['BLOB_MAX_AGE']}, immutable"
+        return response
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    except UnidentifiedImageError:
+        return jsonify({'error': 'Blob is not an image that can be thumbnailed'}), 415
+
+    except KeyError:
+        return jsonify({'error': 'Unknown blob'}), 404
+
+@app.route('/storage', methods=['GET'])
+def storage():
+    """Disk usage per folder and cleanup counters from the last janitor run"""
+    return jsonify(janitor.stats())
+
+@app.route('/clients', methods=['GET'])
+def clients():
+    """Bedrock call latency per operation and connection reuse per shared client"""
+    return jsonify(get_bedrock_clients().stats())
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Stage latency histograms, Bedrock call, byte and token counters, and rate limiter waits"""
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+def request_trace(data):
+    """A trace of the request's stages if the body asks for one with "trace": true"""
+    return metrics.trace() if data.get('trace') else nullcontext()
 
 @app.route('/search', methods=['POST'])
 def search():
     """Search through processed content using both embedding and rerank"""
-    global processor
-
-    if not processor:
+    if not len(registry):
         return jsonify({'error': 'No document processed yet'}), 400
 
     try:
         data = request.json
         query = data.get('query')
         use_rerank = data.get('use_rerank', False)
+        document_ids = requested_document_ids(data)
 
         if not query:
             return jsonify({'error': 'No query provided'}), 400
 
-        # Get embedding results
-        embed_results = processor.search(query)
-
-        # Get rerank results only if toggle is on
-        rerank_results = processor.rerank_search(query) if use_rerank else None
+        # Get embedding results, plus rerank results only if toggle is on
+        with request_trace(data) as trace:
+            if async_queries():
+                results = get_bedrock_clients().run(registry.asearch(query, document_ids, use_rerank=use_rerank))
+            else:
+                results = registry.search(query, document_ids, use_rerank=use_rerank)
 
-        return jsonify({
-            'embed_results': embed_results,
-            'rerank_results': rerank_results,
+        response = {
+            'embed_results': results['embed_results'],
+            'rerank_results': results['rerank_results'],
             'message': 'Search completed successfully'
-        })
+        }
+        if trace:
+            response['trace'] = trace.to_list()
+        return jsonify(response)
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    except KeyError as e:
+        return jsonify({'error': str(e)}), 404
 
     except Exception as e:
         logger.error(f"Error during search: {str(e)}")
@@ -206,21 +440,24 @@ def search():
 
 @app.route('/chat', methods=['POST'])
 def chat():
-    """Handle chat queries about the document"""
-    global processor
-
-    if not processor:
+    """Handle chat queries about one or many documents"""
+    if not len(registry):
         return jsonify({'error': 'No document processed yet'}), 400
 
     try:
         data = request.json
         query = data.get('query')
+        document_ids = requested_document_ids(data)
 
         if not query:
             return jsonify({'error': 'No query provided'}), 400
 
         # Get chat response
-        response = processor.chat_query(query)
+        with request_trace(data) as trace:
+            if async_queries():
+                response = get_bedrock_clients().run(registry.achat(query, document_ids))
+            else:
+                response = registry.chat(query, document_ids)
 
         # Format the response properly
         formatted_response = {
@@ -228,10 +465,18 @@ def chat():
             'images': response.get('images', []),
             'sources': response.get('sources', [])
         }
+        if trace:
+            formatted_response['trace'] = trace.to_list()
 
         logger.info(f"Chat query completed for: {query}")
         return jsonify(formatted_response)
 
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    except KeyError as e:
+        return jsonify({'error': str(e)}), 404
+
     except Exception as e:
         logger.error(f"Error during chat query: {str(e)}")
         return jsonify({
@@ -239,6 +484,32 @@ def chat():
             'message': 'Error processing chat query'
         }), 500
 
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Stream a chat answer as server-sent events: context first, then tokens as they arrive"""
+    if not len(registry):
+        return jsonify({'error': 'No document processed yet'}), 400
+
+    data = request.json
+    query = data.get('query')
+
+    if not query:
+        return jsonify({'error': 'No query provided'}), 400
+
+    try:
+        document_ids = requested_document_ids(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def generate():
+        for event in registry.chat_stream(query, document_ids):
+            yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+        logger.info(f"Streaming chat query completed for: {query}")
+
+    return Response(stream_with_context(generate()),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.errorhandler(413)
 def request_entity_too_large(error):
     """Handle file size too large error"""
@@ -282,4 +553,4 @@ if __name__ == '__main__':
     app.logger.info('PDF Processor startup')
 
     # Run the application
-    app.run(debug=True)
+    create_app().run(debug=True)
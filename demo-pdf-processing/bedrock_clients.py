@@ -0,0 +1,293 @@
+"""
+Process-wide Bedrock clients with tuned connection pools
+Every processor shares one bedrock-runtime client (embed and chat) and one
+bedrock-agent-runtime client (rerank), so credentials are resolved and TLS
+connections opened once per process rather than per document or per chat request.
+boto3 clients are thread-safe once created. botocore's own retries are off: every
+call goes through the rate limiter, which retries throttling with its own backoff.
+The async processor API uses aiobotocore clients instead. They live on one
+process-wide event loop, run in a daemon thread, and other threads submit
+coroutines to it with run().
+"""
+import asyncio
+import importlib.util
+import json
+import logging
+import threading
+import time
+from contextlib import AsyncExitStack
+from types import SimpleNamespace
+from typing import Any, Awaitable, Dict, Iterator, Optional
+
+import boto3
+from botocore.config import Config
+
+logger = logging.getLogger(__name__)
+
+CLIENT_MAX_POOL_CONNECTIONS = 50  # Open connections kept per client; boto3's default is 10
+CLIENT_CONNECT_TIMEOUT = 5  # Seconds
+CLIENT_READ_TIMEOUT = 120  # Seconds; long chat answers are generated before the response starts
+CLIENT_TCP_KEEPALIVE = True  # Keep idle pooled connections from being dropped by middleboxes
+# One attempt per call; retrying inside botocore as well would multiply the limiter's
+# retries and hide throttling from its adaptive rate
+CLIENT_RETRIES = {'mode': 'standard', 'total_max_attempts': 1}
+# Connections per async client; requests wait on the loop rather than in a thread, so
+# far more can be in flight than with the blocking clients
+ASYNC_MAX_POOL_CONNECTIONS = 500
+
+
+class ClientMetrics:
+    """
+    Per-operation call counts and latency for botocore clients, recorded through the
+    client's before-call / after-call events, so every call site is covered
+    """
+
+    def __init__(self):
+        self.operations = {}  # "service.Operation" -> counters
+        self.lock = threading.Lock()
+
+    def attach(self, client) -> None:
+        """Record the calls made through client"""
+        events = client.meta.events
+        events.register('before-call', self._before_call)
+        events.register('after-call', self._after_call)
+        events.register('after-call-error', self._after_call_error)
+
+    @staticmethod
+    def _before_call(model, context, **kwargs) -> None:
+        context['operation'] = f"{model.service_model.service_id.hyphenize()}.{model.name}"
+        context['started'] = time.perf_counter()
+
+    def _after_call(self, http_response, context, **kwargs) -> None:
+        # Error responses such as throttling are raised after this event
+        self._record(context, error=http_response.status_code >= 300)
+
+    def _after_call_error(self, context, **kwargs) -> None:
+        # Connection errors and timeouts
+        self._record(context, error=True)
+
+    def _record(self, context, error: bool) -> None:
+        started = context.get('started')
+        if started is None:
+            return
+        seconds = time.perf_counter() - started
+        name = context['operation']
+        with self.lock:
+            counters = self.operations.get(name)
+            if counters is None:
+                counters = self.operations[name] = {'calls': 0, 'errors': 0, 'seconds': 0.0, 'max_seconds': 0.0}
+            counters['calls'] += 1
+            counters['errors'] += error
+            counters['seconds'] += seconds
+            counters['max_seconds'] = max(counters['max_seconds'], seconds)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self.lock:
+            return {
+                name: {
+                    'calls': counters['calls'],
+                    'errors': counters['errors'],
+                    'avg_ms': counters['seconds'] / counters['calls'] * 1000 if counters['calls'] else 0.0,
+                    'max_ms': counters['max_seconds'] * 1000
+                }
+                for name, counters in self.operations.items()
+            }
+
+
+def connection_stats(client) -> Optional[Dict[str, Any]]:
+    """
+    Connections opened and requests sent by a botocore client's urllib3 pools
+    Returns None for clients that are not botocore clients, such as test fakes.
+    """
+    try:
+        pools = client._endpoint.http_session._manager.pools
+        pools = [pools[key] for key in pools.keys()]
+    except (AttributeError, KeyError):
+        return None
+    opened = sum(pool.num_connections for pool in pools)
+    requests = sum(pool.num_requests for pool in pools)
+    return {
+        'connections_opened': opened,
+        'requests': requests,
+        # Share of requests sent over an already open connection
+        'reuse_rate': 1 - opened / requests if requests else 0.0
+    }
+
+
+class BedrockChat:
+    """
+    Cohere chat on Bedrock with the call shape of cohere_aws.Client.chat
+    cohere_aws creates its own bedrock-runtime client and wraps every error in
+    CohereError. This sends the same requests through a client we pass in, so chat
+    shares the pooled, instrumented client and the rate limiter sees botocore's
+    throttling errors.
+    """
+
+    def __init__(self, runtime):
+        self.runtime = runtime
+
+    def chat(self, message: str, model_id: str, stream: bool = False, **params) -> Any:
+        """
+        The model's response, with its fields as attributes (text, finish_reason, ...)
+        With stream=True, an iterator of events with event_type and, for text-generation, text
+        """
+        request = dict(body=json.dumps({'message': message, **params}), modelId=model_id,
+                       contentType='application/json', accept='*/*')
+        if stream:
+            return self._events(self.runtime.invoke_model_with_response_stream(**request)['body'])
+        response = self.runtime.invoke_model(**request)
+        return SimpleNamespace(**json.loads(response['body'].read()))
+
+    @staticmethod
+    def _events(body) -> Iterator[SimpleNamespace]:
+        pending = bytearray()
+        for payload in body:
+            pending += payload['chunk']['bytes']
+            try:
+                event = json.loads(pending)
+            except ValueError:
+                # A JSON object split across payloads
+                continue
+            pending.clear()
+            yield SimpleNamespace(**event)
+
+
+class BedrockClients:
+    """
+    Lazily created, shared Bedrock clients
+    region: AWS region of every client
+    max_pool_connections: connections each client keeps open for reuse
+    connect_timeout, read_timeout: socket timeouts in seconds
+    tcp_keepalive: enable TCP keep-alive on pooled connections
+    async_max_pool_connections: connections each async client keeps open
+    """
+
+    def __init__(self, region: str, max_pool_connections: int = CLIENT_MAX_POOL_CONNECTIONS,
+                 connect_timeout: float = CLIENT_CONNECT_TIMEOUT, read_timeout: float = CLIENT_READ_TIMEOUT,
+                 tcp_keepalive: bool = CLIENT_TCP_KEEPALIVE,
+                 async_max_pool_connections: int = ASYNC_MAX_POOL_CONNECTIONS):
+        self.region = region
+        self.config = Config(region_name=region,
+                             max_pool_connections=max_pool_connections,
+                             connect_timeout=connect_timeout,
+                             read_timeout=read_timeout,
+                             tcp_keepalive=tcp_keepalive,
+                             retries=CLIENT_RETRIES)
+        self.async_options = dict(region_name=region,
+                                  max_pool_connections=async_max_pool_connections,
+                                  connect_timeout=connect_timeout,
+                                  read_timeout=read_timeout,
+                                  retries=CLIENT_RETRIES)
+        self.metrics = ClientMetrics()
+        self.clients = {}
+        self.async_clients = {}
+        self._chat = None
+        self._loop = None
+        self._async_stack = AsyncExitStack()
+        self._async_lock = None
+        self._async_available = None
+        self.lock = threading.Lock()
+
+    def client(self, service_name: str):
+        """The shared boto3 client for service_name"""
+        with self.lock:
+            client = self.clients.get(service_name)
+            if client is None:
+                started = time.perf_counter()
+                # A session of our own: the default session is not safe to create clients from concurrently
+                client = boto3.session.Session().client(service_name, config=self.config)
+                self.metrics.attach(client)
+                self.clients[service_name] = client
+                logger.info(f"Created {service_name} client in {(time.perf_counter() - started) * 1000:.0f} ms")
+            return client
+
+    @property
+    def runtime(self):
+        """bedrock-runtime, used for embed and chat"""
+        return self.client('bedrock-runtime')
+
+    @property
+    def agent_runtime(self):
+        """bedrock-agent-runtime, used for rerank"""
+        return self.client('bedrock-agent-runtime')
+
+    def chat(self) -> 'BedrockChat':
+        """The shared chat client, sending its requests through the pooled bedrock-runtime client"""
+        runtime = self.runtime
+        with self.lock:
+            if self._chat is None:
+                self._chat = BedrockChat(runtime)
+            return self._chat
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """The event loop of the async clients, started on first use"""
+        with self.lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name='bedrock-async', daemon=True).start()
+            return self._loop
+
+    def run(self, coroutine: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+        """
+        Run a coroutine on the clients' loop from another thread and wait for its result
+        The coroutine sees the caller's context variables, such as an active trace.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    def async_available(self) -> bool:
+        """Whether the async API can run: aiobotocore is installed, or both async clients were provided"""
+        if self._async_available is None:
+            self._async_available = (importlib.util.find_spec('aiobotocore') is not None
+                                     or {'bedrock-runtime', 'bedrock-agent-runtime'} <= self.async_clients.keys())
+            if not self._async_available:
+                logger.warning("aiobotocore is not installed; queries use the blocking Bedrock clients")
+        return self._async_available
+
+    async def async_client(self, service_name: str):
+        """The shared aiobotocore client for service_name; call from a coroutine running on loop"""
+        client = self.async_clients.get(service_name)
+        if client is not None:
+            return client
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        async with self._async_lock:
+            client = self.async_clients.get(service_name)
+            if client is None:
+                # Imported here, so the blocking API works without aiobotocore installed
+                from aiobotocore.config import AioConfig
+                from aiobotocore.session import get_session
+                started = time.perf_counter()
+                client = await self._async_stack.enter_async_context(
+                    get_session().create_client(service_name, config=AioConfig(**self.async_options)))
+                self.metrics.attach(client)
+                self.async_clients[service_name] = client
+                logger.info(f"Created async {service_name} client in {(time.perf_counter() - started) * 1000:.0f} ms")
+            return client
+
+    async def async_runtime(self):
+        """Async bedrock-runtime, used for embed and chat"""
+        return await self.async_client('bedrock-runtime')
+
+    async def async_agent_runtime(self):
+        """Async bedrock-agent-runtime, used for rerank"""
+        return await self.async_client('bedrock-agent-runtime')
+
+    def close(self) -> None:
+        """Close the async clients and stop their loop; the blocking clients need no cleanup"""
+        with self.lock:
+            loop, self._loop = self._loop, None
+        if loop is not None:
+            asyncio.run_coroutine_threadsafe(self._async_stack.aclose(), loop).result()
+            self.async_clients = {}
+            self._async_lock = None
+            loop.call_soon_threadsafe(loop.stop)
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-operation latency and per-client connection reuse"""
+        with self.lock:
+            clients = dict(self.clients)
+        return {
+            'operations': self.metrics.stats(),
+            'connections': {name: connection_stats(client) for name, client in clients.items()}
+        }
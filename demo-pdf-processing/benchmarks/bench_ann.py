@@ -0,0 +1,128 @@
+"""
+Benchmark the IVF index against exact search: recall@k versus queries per second
+
+Builds a clustered synthetic corpus, trains an IVF index offline, then sweeps nprobe
+and reports recall against the exact index and single-query throughput. With
+--plot, the recall/QPS curve is also saved as an image (needs matplotlib).
+With --grow-from, the IVF index is instead trained once that many vectors are added
+and then grows to --size through inserts, as during ingestion; --no-retrain keeps the
+first clusters for comparison.
+
+Usage: python benchmarks/bench_ann.py --size 200000 --dim 768 --nprobe 1 2 4 8 16 32 --plot ann.png
+       python benchmarks/bench_ann.py --size 200000 --grow-from 5000 [--no-retrain]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_index import VectorIndex
+from ann_index import IVFIndex, IVF_RETRAIN_GROWTH
+from bench_quantization import clustered_vectors
+
+
+def measure(index: VectorIndex, queries: np.ndarray, top_k: int, truth=None):
+    """Return (results, queries per second)"""
+    index.search(queries[0], top_k)  # Warm up
+    start = time.perf_counter()
+    results = [index.search(query, top_k) for query in queries]
+    qps = len(queries) / (time.perf_counter() - start)
+    return results, qps
+
+
+def recall(results, truth, top_k: int) -> float:
+    return float(np.mean([len(expected & set(item_id for _, item_id in result)) / top_k
+                          for expected, result in zip(truth, results)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=200000)
+    parser.add_argument('--dim', type=int, default=768)
+    parser.add_argument('--clusters', type=int, default=2000)
+    parser.add_argument('--spread', type=float, default=1.5, help='noise around each cluster centre')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--nlist', type=int, default=None, help='IVF clusters (default 4 * sqrt(size))')
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument('--precision', default='float32', choices=['float32', 'int8', 'binary'])
+    parser.add_argument('--plot', default=None, help='save the recall/QPS curve to this image file')
+    parser.add_argument('--grow-from', type=int, default=None,
+                        help='train the IVF index at this many vectors and insert the rest')
+    parser.add_argument('--no-retrain', action='store_true', help='with --grow-from, never retrain the clusters')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = clustered_vectors(rng, args.size, args.dim, args.clusters, args.spread)
+    queries = vectors[rng.integers(0, args.size, args.queries)]
+    queries = queries + 0.5 * args.spread * rng.standard_normal(queries.shape, dtype=np.float32)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index = VectorIndex(args.dim)
+        for start in range(0, args.size, 10000):
+            batch = vectors[start:start + 10000]
+            index.add(batch, ['text'] * len(batch), np.ones(len(batch), dtype=np.int32),
+                      range(start, start + len(batch)))
+        index.save(tmp_dir)
+        del index
+        if args.grow_from is None:
+            del vectors
+
+        exact = VectorIndex.load(tmp_dir, mmap=False, precision=args.precision)
+        truth_index = exact if args.precision == 'float32' else VectorIndex.load(tmp_dir, mmap=False)
+        truth = [set(item_id for _, item_id in truth_index.search(query, args.top_k)) for query in queries]
+        exact_results, exact_qps = measure(exact, queries, args.top_k)
+        del truth_index
+
+        start = time.perf_counter()
+        if args.grow_from is None:
+            ivf = IVFIndex.load(tmp_dir, mmap=False, precision=args.precision, nlist=args.nlist,
+                                min_train_size=float('inf'))
+            ivf.build()
+            how = 'built'
+        else:
+            ivf = IVFIndex(args.dim, precision=args.precision, nlist=args.nlist, min_train_size=args.grow_from,
+                           retrain_growth=None if args.no_retrain else IVF_RETRAIN_GROWTH)
+            for batch_start in range(0, args.size, 1000):
+                batch = vectors[batch_start:batch_start + 1000]
+                ivf.add(batch, ['text'] * len(batch), np.ones(len(batch), dtype=np.int32),
+                        range(batch_start, batch_start + len(batch)))
+            del vectors
+            how = f"grown from {args.grow_from:,}, last trained at {ivf.trained_size:,},"
+        build = time.perf_counter() - start
+
+        print(f"{args.size:,} vectors, dim={args.dim}, {args.precision}, recall@{args.top_k} "
+              f"over {args.queries} queries; IVF nlist={len(ivf.centroids)} {how} in {build:.1f}s")
+        print(f"{'exact':<12} recall={recall(exact_results, truth, args.top_k):.3f}  QPS={exact_qps:8.1f}")
+        curve = []
+        for nprobe in args.nprobe:
+            ivf.nprobe = nprobe
+            results, qps = measure(ivf, queries, args.top_k)
+            curve.append((recall(results, truth, args.top_k), qps))
+            print(f"nprobe={nprobe:<5} recall={curve[-1][0]:.3f}  QPS={qps:8.1f}  "
+                  f"speedup={qps / exact_qps:6.1f}x")
+
+    if args.plot:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        figure, axes = plt.subplots()
+        axes.plot([point[0] for point in curve], [point[1] for point in curve], marker='o', label='IVF')
+        for nprobe, (point_recall, point_qps) in zip(args.nprobe, curve):
+            axes.annotate(str(nprobe), (point_recall, point_qps))
+        axes.axhline(exact_qps, color='gray', linestyle='--', label='exact')
+        axes.set_xlabel(f"recall@{args.top_k}")
+        axes.set_ylabel('queries per second')
+        axes.set_yscale('log')
+        axes.legend()
+        figure.savefig(args.plot)
+        print(f"Saved {args.plot}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Benchmark the async query API against blocking calls from a thread pool
+
+Sends many distinct queries at once to one processor backed by local fake Bedrock
+clients: rerank_search / chat_query from a pool of threads, like a threaded web
+worker, and arerank_search / achat_query gathered on one event loop. Reports wall
+time, throughput, p50/p99 latency from when the queries were sent, and the peak
+number of threads.
+
+Usage: python benchmarks/bench_async.py --queries 500 --threads 32 --rerank-latency 0.3
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdf_processor_cohere import PDFProcessorCohere
+from embedding_cache import EmbeddingCache
+from rate_limiter import BedrockRateLimiter
+from blob_store import BlobStore
+from fake_bedrock import (AsyncFakeBedrockAgentRuntime, AsyncFakeBedrockRuntime, FakeBedrockAgentRuntime,
+                          FakeBedrockRuntime, FakeChatClient)
+from synthetic_pdf import make_pdf
+
+
+class PeakThreads:
+    """Samples the number of live threads while a run is in progress"""
+
+    def __init__(self):
+        self.peak = threading.active_count()
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self.done.wait(0.01):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.done.set()
+        self.thread.join()
+
+
+def report(label: str, latencies, elapsed: float, peak_threads: int) -> None:
+    ms = np.array(latencies) * 1000
+    print(f"{label:<22} {elapsed:7.2f}s  {len(ms) / elapsed:8.1f} queries/s  p50={np.percentile(ms, 50):8.1f} ms  "
+          f"p99={np.percentile(ms, 99):8.1f} ms  threads={peak_threads}")
+
+
+def run_threads(fn, queries, threads: int):
+    # Latency counts from when all queries are sent, including time queued for a thread
+    def timed(query):
+        fn(query)
+        return time.perf_counter() - start
+
+    with PeakThreads() as peak:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            latencies = list(executor.map(timed, queries))
+        elapsed = time.perf_counter() - start
+    return latencies, elapsed, peak.peak
+
+
+def run_async(fn, queries):
+    async def timed(query):
+        await fn(query)
+        return time.perf_counter() - start
+
+    async def main():
+        return await asyncio.gather(*[timed(query) for query in queries])
+
+    with PeakThreads() as peak:
+        start = time.perf_counter()
+        latencies = asyncio.run(main())
+        elapsed = time.perf_counter() - start
+    return latencies, elapsed, peak.peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--queries', type=int, default=500, help='queries sent at once')
+    parser.add_argument('--threads', type=int, default=32, help='threads of the blocking run')
+    parser.add_argument('--embed-latency', type=float, default=0.05, help='fake embed latency in seconds')
+    parser.add_argument('--rerank-latency', type=float, default=0.3, help='fake rerank latency in seconds')
+    parser.add_argument('--first-token-latency', type=float, default=0.5, help='fake chat latency in seconds')
+    args = parser.parse_args()
+
+    chat = FakeChatClient(first_token_latency=args.first_token_latency, token_latency=0.0, tokens=50)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        processor = PDFProcessorCohere(
+            bedrock_runtime=FakeBedrockRuntime(latency=args.embed_latency),
+            bedrock_agent_runtime=FakeBedrockAgentRuntime(latency=args.rerank_latency),
+            async_bedrock_runtime=AsyncFakeBedrockRuntime(latency=args.embed_latency, chat=chat),
+            async_bedrock_agent_runtime=AsyncFakeBedrockAgentRuntime(latency=args.rerank_latency),
+            chat_client=chat,
+            embedding_cache=EmbeddingCache(None),
+            # The benchmark measures concurrency, not the quotas
+            rate_limiter=BedrockRateLimiter({}),
+            blob_store=BlobStore(os.path.join(tmp_dir, 'blobs')))
+        processor.process_pdf(make_pdf(os.path.join(tmp_dir, 'synthetic.pdf'), pages=args.pages))
+        print(f"{args.queries} queries at once, {args.threads} threads for the blocking calls; embed "
+              f"{args.embed_latency * 1000:.0f} ms, rerank {args.rerank_latency * 1000:.0f} ms, "
+              f"chat {args.first_token_latency * 1000:.0f} ms")
+
+        # Distinct queries per run, so neither the query nor the rerank cache helps
+        for run in ['rerank_search', 'chat_query']:
+            queries = [f"{run} blocking {i} revenue margin" for i in range(args.queries)]
+            report(f"{run}", *run_threads(getattr(processor, run), queries, args.threads))
+            queries = [f"{run} async {i} revenue margin" for i in range(args.queries)]
+            report(f"a{run}", *run_async(getattr(processor, f"a{run}"), queries))
+
+
+if __name__ == '__main__':
+    main()
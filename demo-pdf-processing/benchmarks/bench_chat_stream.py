@@ -0,0 +1,89 @@
+"""
+Benchmark time-to-first-token for /chat versus /chat/stream
+
+Drives the Flask app with a fake embed, rerank and chat backend and reports
+when the sources, the first token and the complete answer reach the client.
+
+Usage: python benchmarks/bench_chat_stream.py --tokens 200 --token-latency 0.03
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from fake_bedrock import FakeBedrockRuntime, FakeBedrockAgentRuntime, FakeChatClient
+from synthetic_pdf import make_pdf
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--tokens', type=int, default=200)
+    parser.add_argument('--first-token-latency', type=float, default=0.3)
+    parser.add_argument('--token-latency', type=float, default=0.03)
+    parser.add_argument('--queries', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # app.py creates its working folders relative to the current directory
+        os.chdir(tmp_dir)
+        import app as app_module
+        from pdf_processor_cohere import PDFProcessorCohere
+        from embedding_cache import EmbeddingCache
+        from corpus import CorpusRegistry
+        from rate_limiter import BedrockRateLimiter
+
+        embedding_cache = EmbeddingCache(None)
+        chat_client = FakeChatClient(args.first_token_latency, args.token_latency, args.tokens)
+
+        def make_processor():
+            processor = PDFProcessorCohere(
+                bedrock_runtime=FakeBedrockRuntime(latency=0.02),
+                bedrock_agent_runtime=FakeBedrockAgentRuntime(latency=0.05),
+                embedding_cache=embedding_cache,
+                chat_client=chat_client,
+                rate_limiter=BedrockRateLimiter({}))
+            return processor
+
+        app_module.registry = CorpusRegistry(os.path.join(tmp_dir, 'bench_processed'),
+                                             processor_factory=make_processor)
+        pdf_path = make_pdf(os.path.join(tmp_dir, 'synthetic.pdf'), pages=args.pages)
+        app_module.registry.add('synthetic', 'synthetic.pdf', pdf_path)
+        # The fakes are blocking clients
+        app_module.app.config['ASYNC_QUERIES'] = False
+        client = app_module.app.test_client()
+
+        blocking, context, first_token, total = [], [], [], []
+        for i in range(args.queries):
+            query = f"what drove operating margin growth in quarter {i}"
+
+            start = time.perf_counter()
+            response = client.post('/chat', json={'query': query})
+            assert response.status_code == 200, response.get_json()
+            blocking.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            response = client.post('/chat/stream', json={'query': query}, buffered=False)
+            seen_token = False
+            for chunk in response.response:
+                if b'event: context' in chunk and len(context) <= i:
+                    context.append(time.perf_counter() - start)
+                if b'event: token' in chunk and not seen_token:
+                    first_token.append(time.perf_counter() - start)
+                    seen_token = True
+            total.append(time.perf_counter() - start)
+            response.close()
+
+        mean = lambda values: sum(values) / len(values) * 1000
+        print(f"/chat         full answer      {mean(blocking):8.1f} ms")
+        print(f"/chat/stream  sources + images {mean(context):8.1f} ms")
+        print(f"/chat/stream  first token      {mean(first_token):8.1f} ms")
+        print(f"/chat/stream  full answer      {mean(total):8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark the layout-aware chunker against the previous character-based chunker
+
+Reports chunk count, token size distribution and chunking throughput over every
+page of a synthetic PDF. Page text extraction is timed separately, so the numbers
+are for chunking alone; the last line adds each chunker's extraction back in.
+
+Usage: python benchmarks/bench_chunking.py --pages 500 --max-tokens 256 --overlap 32
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from typing import List
+
+import fitz
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chunking import Chunker, approx_token_count
+from synthetic_pdf import make_pdf
+
+
+def legacy_chunk_text(text: str, chunk_size: int) -> List[str]:
+    """The previous chunker: split on '. ' and pack up to chunk_size characters"""
+    sentences = text.replace('\n', ' ').split('. ')
+    chunks = []
+    current_chunk = []
+    current_length = 0
+    for sentence in sentences:
+        sentence = sentence.strip() + '. '
+        if current_length + len(sentence) > chunk_size:
+            if current_chunk:
+                chunks.append(''.join(current_chunk))
+            current_chunk = [sentence]
+            current_length = len(sentence)
+        else:
+            current_chunk.append(sentence)
+            current_length += len(sentence)
+    if current_chunk:
+        chunks.append(''.join(current_chunk))
+    return [chunk.strip() for chunk in chunks if chunk.strip()]
+
+
+def report(label: str, chunks: List[str], elapsed: float, pages: int, text_bytes: int) -> None:
+    tokens = np.array([approx_token_count(chunk) for chunk in chunks])
+    p5, p50, p95 = np.percentile(tokens, [5, 50, 95])
+    print(f"{label:<10} chunks={len(chunks):<7} tokens min={tokens.min():<4} p5={p5:<6.0f} "
+          f"p50={p50:<6.0f} p95={p95:<6.0f} max={tokens.max():<4} cv={tokens.std() / tokens.mean():.2f}  "
+          f"{pages / elapsed:8.1f} pages/s  {text_bytes / elapsed / 1e6:6.2f} MB/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=500)
+    parser.add_argument('--sentences-per-page', type=int, default=60)
+    parser.add_argument('--max-tokens', type=int, default=256)
+    parser.add_argument('--overlap', type=int, default=32)
+    parser.add_argument('--chunk-size', type=int, default=1000, help='character budget of the previous chunker')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pdf_path = make_pdf(os.path.join(tmp_dir, 'synthetic.pdf'), pages=args.pages,
+                            sentences_per_page=args.sentences_per_page)
+        doc = fitz.open(pdf_path)
+        try:
+            start = time.perf_counter()
+            texts = [page.get_text() for page in doc]
+            extract_text = time.perf_counter() - start
+            start = time.perf_counter()
+            words = [page.get_text('words') for page in doc]
+            extract_words = time.perf_counter() - start
+            text_bytes = sum(len(text.encode('utf-8')) for text in texts)
+            print(f"Synthetic PDF: {args.pages} pages, {text_bytes / 1e6:.1f} MB of text; "
+                  f"get_text {extract_text:.2f}s, get_text('words') {extract_words:.2f}s")
+
+            start = time.perf_counter()
+            legacy = [chunk for text in texts for chunk in legacy_chunk_text(text, args.chunk_size)]
+            legacy_elapsed = time.perf_counter() - start
+            report('previous', legacy, legacy_elapsed, args.pages, text_bytes)
+
+            chunker = Chunker(max_tokens=args.max_tokens, overlap_tokens=args.overlap)
+
+            class Page:
+                """Replays pre-extracted words so only chunking is timed"""
+                def __init__(self, page_words):
+                    self.page_words = page_words
+
+                def get_text(self, option):
+                    return self.page_words
+
+            start = time.perf_counter()
+            layout = [chunk['text'] for page_words in words for chunk in chunker.chunk_page(Page(page_words))]
+            layout_elapsed = time.perf_counter() - start
+            report('layout', layout, layout_elapsed, args.pages, text_bytes)
+            print(f"With extraction: previous {args.pages / (extract_text + legacy_elapsed):.1f} pages/s, "
+                  f"layout {args.pages / (extract_words + layout_elapsed):.1f} pages/s")
+        finally:
+            doc.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Benchmark shared, pooled boto3 clients against a new client per call
+
+Runs a local keep-alive HTTP server standing in for bedrock-runtime and sends
+invoke_model requests from concurrent threads: with a new client per request (as
+chat did before), with one shared client at boto3's default pool of 10, and with one
+shared client from BedrockClients. Reports throughput, latency and connection reuse.
+The server is plain HTTP on localhost, so the cost of a new connection here is far
+below a TLS handshake with Bedrock.
+
+Usage: python benchmarks/bench_clients.py --threads 32 --requests 20 --server-latency 0.2
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import boto3
+import numpy as np
+from botocore.config import Config
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bedrock_clients import BedrockClients, ClientMetrics, connection_stats
+
+RESPONSE = b'{"embeddings": {"float": [[0.0]]}}'
+
+
+def make_server(latency: float) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # Keep-alive
+
+        def setup(self):
+            # One handler per accepted TCP connection
+            with server.lock:
+                server.connections += 1
+            super().setup()
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('content-length', 0)))
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header('content-type', 'application/json')
+            self.send_header('content-length', str(len(RESPONSE)))
+            self.end_headers()
+            self.wfile.write(RESPONSE)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    server.connections = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def make_client(endpoint: str, config: Config):
+    return boto3.session.Session().client('bedrock-runtime', endpoint_url=endpoint, config=config,
+                                          aws_access_key_id='bench', aws_secret_access_key='bench')
+
+
+def run(label: str, get_client, threads: int, requests: int, server: ThreadingHTTPServer) -> None:
+    latencies = [[] for _ in range(threads)]
+    connections = server.connections
+
+    def worker(slot: int):
+        for _ in range(requests):
+            start = time.perf_counter()
+            client = get_client()
+            client.invoke_model(body='{"texts": ["x"]}', modelId='bench')['body'].read()
+            latencies[slot].append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(slot,)) for slot in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    ms = np.array([latency for slot in latencies for latency in slot]) * 1000
+    print(f"{label:<26} {threads * requests / elapsed:8.1f} calls/s  p50={np.percentile(ms, 50):7.1f} ms  "
+          f"p99={np.percentile(ms, 99):7.1f} ms  tcp connections={server.connections - connections}", end='')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=20, help='requests per thread')
+    parser.add_argument('--server-latency', type=float, default=0.2, help='seconds per response')
+    args = parser.parse_args()
+
+    server = make_server(args.server_latency)
+    endpoint = f"http://127.0.0.1:{server.server_port}"
+    print(f"{args.threads} threads x {args.requests} requests, server latency {args.server_latency * 1000:.0f} ms")
+
+    opened = []
+    lock = threading.Lock()
+
+    def new_client():
+        client = make_client(endpoint, Config(region_name='us-west-2'))
+        with lock:
+            opened.append(client)
+        return client
+
+    run('new client per call', new_client, args.threads, max(1, args.requests // 4), server)
+    print(f"  clients={len(opened)}")
+
+    for label, config in [('shared, default pool (10)', Config(region_name='us-west-2')),
+                          ('shared, BedrockClients', BedrockClients('us-west-2').config)]:
+        client = make_client(endpoint, config)
+        metrics = ClientMetrics()
+        metrics.attach(client)
+        run(label, lambda: client, args.threads, args.requests, server)
+        stats = connection_stats(client)
+        operation = metrics.stats()['bedrock-runtime.InvokeModel']
+        # Counted by urllib3, which misses connections discarded because the pool was full
+        print(f"  pool reuse={stats['reuse_rate']:.3f} "
+              f"instrumented avg={operation['avg_ms']:.1f} ms")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
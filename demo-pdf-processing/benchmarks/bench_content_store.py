@@ -0,0 +1,118 @@
+"""
+Micro-benchmark: ContentStore versus a list of content dicts
+
+Builds the same items both ways from JSON lines, as load_results reads them, and
+reports bytes per item (tracemalloc), objects tracked by the garbage collector, the
+time of a full gc.collect(), the time to build a page of search results and the time
+to iterate every item. Items are text chunks of --chars characters with a bbox, plus
+--image-share image items holding blob keys; vectors are in the index either way.
+
+Usage: python benchmarks/bench_content_store.py --items 10000 100000 --chars 1000
+"""
+import argparse
+import gc
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from content_store import ContentStore
+
+WORDS = ['revenue', 'growth', 'margin', 'quarter', 'guidance', 'operating', 'income', 'cash', 'flow',
+         'segment', 'forecast', 'expenses', 'capital', 'dividend', 'debt', 'the', 'of', 'and', 'in', 'to']
+
+
+def make_lines(count: int, chars: int, image_share: float, seed: int):
+    """JSON lines of items shaped like the processor's, as save_results writes them"""
+    rng = random.Random(seed)
+    lines = []
+    for chunk_id in range(count):
+        page = chunk_id // 20 + 1
+        if rng.random() < image_share:
+            blob_key = hashlib.sha256(str(chunk_id).encode()).hexdigest() + '.png'
+            item = {'page': page, 'index': chunk_id % 3, 'type': 'image', 'format': 'png',
+                    'blob_key': blob_key, 'chunk_id': chunk_id}
+        else:
+            words = []
+            while sum(len(word) + 1 for word in words) < chars:
+                words.append(rng.choice(WORDS))
+            x, y = round(rng.uniform(36, 300), 2), round(rng.uniform(36, 700), 2)
+            item = {'page': page, 'chunk': chunk_id % 20 + 1, 'content': ' '.join(words), 'type': 'text',
+                    'bbox': [x, y, round(x + 200.5, 2), round(y + 80.25, 2)], 'chunk_id': chunk_id}
+        lines.append(json.dumps(item, separators=(',', ':')))
+    return lines
+
+
+def load_dicts(lines):
+    items = [json.loads(line) for line in lines]
+    for item in items:
+        if 'bbox' in item:
+            item['bbox'] = tuple(item['bbox'])
+    return items
+
+
+def load_store(lines):
+    store = ContentStore()
+    for line in lines:
+        item = json.loads(line)
+        if 'bbox' in item:
+            item['bbox'] = tuple(item['bbox'])
+        store.append(item)
+    return store
+
+
+def measure(label: str, build, lines, results: int, rng) -> None:
+    gc.collect()
+    objects_before = len(gc.get_objects())
+    tracemalloc.start()
+    items = build(lines)
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    objects = len(gc.get_objects()) - objects_before
+
+    start = time.perf_counter()
+    gc.collect()
+    collect_ms = (time.perf_counter() - start) * 1000
+
+    pages = [rng.sample(range(len(items)), results) for _ in range(200)]
+    start = time.perf_counter()
+    for ids in pages:
+        # What search does per match
+        for idx in ids:
+            result = dict(items[idx]) if isinstance(items, list) else items[idx]
+            result['similarity_score'] = 0.5
+    results_us = (time.perf_counter() - start) / len(pages) * 1e6
+
+    start = time.perf_counter()
+    for item in items:
+        pass
+    scan_ms = (time.perf_counter() - start) * 1000
+
+    print(f"  {label:<6} {held / len(lines):8.0f} bytes/item  gc objects={objects:>9,}  "
+          f"gc.collect={collect_ms:7.1f} ms  {results} results={results_us:7.1f} us  scan={scan_ms:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--items', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--chars', type=int, default=1000, help='characters per text chunk')
+    parser.add_argument('--image-share', type=float, default=0.1)
+    parser.add_argument('--results', type=int, default=10, help='items per page of search results')
+    args = parser.parse_args()
+
+    for count in args.items:
+        lines = make_lines(count, args.chars, args.image_share, seed=count)
+        text_bytes = sum(len(line) for line in lines) / count
+        print(f"{count:,} items, {args.chars} chars per chunk, {args.image_share:.0%} images "
+              f"({text_bytes:.0f} bytes per JSON line)")
+        measure('dicts', load_dicts, lines, args.results, random.Random(0))
+        measure('store', load_store, lines, args.results, random.Random(0))
+
+
+if __name__ == '__main__':
+    main()
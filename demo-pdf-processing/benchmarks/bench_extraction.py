@@ -0,0 +1,48 @@
+"""
+Benchmark PyMuPDF extraction scaling with the number of worker processes
+
+Extracts every page of a synthetic PDF through pdf_extraction.iter_page_records
+(text chunking, image extraction and page rendering) without any embedding.
+
+Usage: python benchmarks/bench_extraction.py --pages 400 --workers 1 2 4 8
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdf_extraction import iter_page_records
+from chunking import Chunker
+from synthetic_pdf import make_pdf
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=400)
+    parser.add_argument('--images-per-page', type=int, default=2)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--pages-per-shard', type=int, default=16)
+    parser.add_argument('--chunk-tokens', type=int, default=256)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pdf_path = make_pdf(os.path.join(tmp_dir, 'synthetic.pdf'), pages=args.pages,
+                            images_per_page=args.images_per_page)
+        print(f"Synthetic PDF: {args.pages} pages, {os.cpu_count()} CPUs available")
+
+        chunker = Chunker(max_tokens=args.chunk_tokens)
+        baseline = None
+        for workers in args.workers:
+            start = time.perf_counter()
+            pages = sum(1 for _ in iter_page_records(pdf_path, chunker, workers, args.pages_per_shard))
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            print(f"workers={workers:<3} pages={pages:<5} time={elapsed:7.2f}s  "
+                  f"{pages / elapsed:8.1f} pages/s  speedup={baseline / elapsed:5.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""
+Benchmark hybrid BM25 + vector candidates against vector-only candidates for reranking
+
+Builds a synthetic corpus of chunks that share a small topic vocabulary and each
+mention a few part numbers. Queries ask about one chunk by topic words plus one of
+its part numbers, the exact-term lookups dense embeddings handle poorly. The stand-in
+embedding is a bag of hashed word vectors in which identifiers get only id_weight of
+a word's weight. Reports how often the target chunk is among the candidates sent to
+rerank at each candidate_k, and the smallest candidate_k (rerank documents per query)
+reaching the target hit rate.
+
+Usage: python benchmarks/bench_hybrid.py --chunks 20000 --queries 200 --id-weight 0.2
+"""
+import argparse
+import os
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lexical_index import LexicalIndex, reciprocal_rank_fusion, tokenize
+from vector_index import VectorIndex
+
+CANDIDATE_KS = (5, 10, 20, 30, 50, 100, 200)
+
+
+class BagOfWordsEmbedder:
+    """Sum of fixed random word vectors; tokens containing digits are down-weighted"""
+
+    def __init__(self, dim: int, id_weight: float, seed: int = 0):
+        self.dim = dim
+        self.id_weight = id_weight
+        self.rng = np.random.default_rng(seed)
+        self.words: Dict[str, np.ndarray] = {}
+
+    def __call__(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in text.lower().split():
+            if word not in self.words:
+                self.words[word] = self.rng.standard_normal(self.dim).astype(np.float32)
+            weight = self.id_weight if any(c.isdigit() for c in word) else 1.0
+            vector += weight * self.words[word]
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+
+def make_corpus(rng, chunks: int, words_per_chunk: int, vocabulary: int, ids_per_chunk: int) -> List[str]:
+    topic_words = [f"term{i}" for i in range(vocabulary)]
+    texts = []
+    for chunk in range(chunks):
+        words = list(rng.choice(topic_words, words_per_chunk))
+        for i in range(ids_per_chunk):
+            words.insert(int(rng.integers(0, len(words))), f"PN-{chunk * ids_per_chunk + i:06d}")
+        texts.append(' '.join(words))
+    return texts
+
+
+def first_hit(ranking: List[Dict], target: int) -> int:
+    """1-based rank of the target chunk, or 0 if it is missing"""
+    for rank, item in enumerate(ranking, 1):
+        if item['chunk_id'] == target:
+            return rank
+    return 0
+
+
+def report(label: str, ranks: np.ndarray, target_rate: float, seconds: float) -> None:
+    rates = [np.mean((ranks > 0) & (ranks <= k)) for k in CANDIDATE_KS]
+    needed = next((k for k, rate in zip(CANDIDATE_KS, rates) if rate >= target_rate), None)
+    print(f"{label:<8} " + ' '.join(f"{rate:>6.2f}" for rate in rates) +
+          f"   {needed if needed else f'>{CANDIDATE_KS[-1]}':>8}   {seconds * 1000 / len(ranks):6.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--chunks', type=int, default=20000)
+    parser.add_argument('--words-per-chunk', type=int, default=60)
+    parser.add_argument('--vocabulary', type=int, default=2000, help='distinct topic words')
+    parser.add_argument('--ids-per-chunk', type=int, default=3)
+    parser.add_argument('--query-words', type=int, default=3, help='topic words per query besides the part number')
+    parser.add_argument('--id-weight', type=float, default=0.2, help="weight of identifiers in the stand-in embedding")
+    parser.add_argument('--dim', type=int, default=256)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--target', type=float, default=0.95, help='hit rate the rerank budget must reach')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    texts = make_corpus(rng, args.chunks, args.words_per_chunk, args.vocabulary, args.ids_per_chunk)
+    embed = BagOfWordsEmbedder(args.dim, args.id_weight)
+    items = [{'type': 'text', 'page': 1, 'content': text, 'chunk_id': i} for i, text in enumerate(texts)]
+
+    start = time.perf_counter()
+    index = VectorIndex(args.dim)
+    index.add([embed(text) for text in texts], ['text'] * len(texts), [1] * len(texts), range(len(texts)))
+    vector_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    lexical = LexicalIndex.from_items(enumerate(items))
+    lexical_seconds = time.perf_counter() - start
+    postings = sum(len(rows) for rows, _ in lexical.postings.values())
+    print(f"{args.chunks:,} chunks, {len(lexical.postings):,} terms, {postings:,} postings; "
+          f"BM25 index {lexical.memory_bytes() / 1e6:.1f} MB built in {lexical_seconds:.2f}s "
+          f"(embedding + vector index {vector_seconds:.2f}s)")
+
+    queries = []
+    for target in rng.integers(0, args.chunks, args.queries):
+        words = [word for word in texts[target].split() if not word.startswith('PN-')]
+        part = [word for word in texts[target].split() if word.startswith('PN-')][0]
+        queries.append((int(target), ' '.join(list(rng.choice(words, args.query_words)) + [part])))
+
+    top = CANDIDATE_KS[-1]
+    dense_ranks, lexical_ranks, hybrid_ranks = [], [], []
+    dense_seconds = lexical_seconds = fusion_seconds = 0.0
+    for target, query in queries:
+        start = time.perf_counter()
+        dense = [dict(items[item_id], similarity_score=score)
+                 for score, item_id in index.search(embed(query), top, content_type='text')]
+        dense_seconds += time.perf_counter() - start
+        start = time.perf_counter()
+        matches = [dict(items[item_id], bm25_score=score) for score, item_id in lexical.search(query, top)]
+        lexical_seconds += time.perf_counter() - start
+        start = time.perf_counter()
+        # Each ranking contributes its top k, as PDFProcessorCohere.hybrid_candidates does
+        ranks = []
+        for k in CANDIDATE_KS:
+            fused = reciprocal_rank_fusion([dense[:k], matches[:k]], key=lambda item: item['chunk_id'], limit=k)
+            ranks.append(k if first_hit(fused, target) else 0)
+        fusion_seconds += time.perf_counter() - start
+        dense_ranks.append(first_hit(dense, target))
+        lexical_ranks.append(first_hit(matches, target))
+        # Smallest candidate_k whose fused candidates include the target
+        hybrid_ranks.append(min((rank for rank in ranks if rank), default=0))
+
+    print(f"\nHit rate of the target chunk among the candidates sent to rerank, {args.queries} queries "
+          f"(tokens like {tokenize('PN-000123')})")
+    print(f"{'':<8} " + ' '.join(f"{'k=' + str(k):>6}" for k in CANDIDATE_KS) +
+          f"   {'k@' + str(args.target):>8}   {'search':>9}")
+    report('vector', np.array(dense_ranks), args.target, dense_seconds)
+    report('bm25', np.array(lexical_ranks), args.target, lexical_seconds)
+    report('hybrid', np.array(hybrid_ranks), args.target, dense_seconds + lexical_seconds + fusion_seconds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Benchmark image filtering during ingestion against a local fake Bedrock client
+
+Builds a synthetic PDF with a logo repeated on every page, tiny icons, blank images
+and vector charts on some pages, then compares the image embed requests process_pdf
+makes with what the previous extractor made (every image on every page plus a
+render of every page).
+
+Usage: python benchmarks/bench_images.py --pages 100 --images-per-page 1 --drawings-every 5
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import fitz
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdf_processor_cohere import PDFProcessorCohere
+from embedding_cache import EmbeddingCache
+from rate_limiter import BedrockRateLimiter
+from blob_store import BlobStore
+from fake_bedrock import FakeBedrockRuntime
+from synthetic_pdf import make_pdf
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=100)
+    parser.add_argument('--images-per-page', type=int, default=1)
+    parser.add_argument('--icons-per-page', type=int, default=2)
+    parser.add_argument('--blank-images-per-page', type=int, default=1)
+    parser.add_argument('--drawings-every', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.0, help='fake request latency in seconds')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pdf_path = make_pdf(os.path.join(tmp_dir, 'synthetic.pdf'), pages=args.pages,
+                            images_per_page=args.images_per_page, logo=True,
+                            icons_per_page=args.icons_per_page,
+                            blank_images_per_page=args.blank_images_per_page,
+                            drawings_every=args.drawings_every)
+        doc = fitz.open(pdf_path)
+        try:
+            previous = sum(len(page.get_images(full=True)) + 1 for page in doc)
+        finally:
+            doc.close()
+
+        runtime = FakeBedrockRuntime(latency=args.latency)
+        processor = PDFProcessorCohere(bedrock_runtime=runtime, bedrock_agent_runtime=object(),
+                                       embedding_cache=EmbeddingCache(None),
+                                       rate_limiter=BedrockRateLimiter({}),
+                                       blob_store=BlobStore(os.path.join(tmp_dir, 'blobs')))
+        start = time.perf_counter()
+        processor.process_pdf(pdf_path)
+        elapsed = time.perf_counter() - start
+
+        print(f"Synthetic PDF: {args.pages} pages, {args.images_per_page} images, a logo, "
+              f"{args.icons_per_page} icons and {args.blank_images_per_page} blank images per page, "
+              f"charts on every {args.drawings_every} pages")
+        print(f"previous  image embed requests={previous}")
+        print(f"filtered  image embed requests={runtime.image_calls} "
+              f"({1 - runtime.image_calls / previous:.0%} fewer)  time={elapsed:.2f}s")
+        print(f"image stats: {dict(processor.image_stats)}")
+
+
+if __name__ == '__main__':
+    main()
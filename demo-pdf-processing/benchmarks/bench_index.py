@@ -0,0 +1,86 @@
+"""
+Micro-benchmark: VectorIndex versus the per-item np.dot loop
+
+The loop baseline reproduces the previous search implementation: a list of
+content dicts holding Python float lists, one np.dot per item, then a full sort.
+
+Usage: python benchmarks/bench_index.py --sizes 10000 100000 1000000 --dim 256
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_index import VectorIndex
+
+
+def loop_search(content_sequence, query_embedding, top_k):
+    similarities = []
+    for idx, item in enumerate(content_sequence):
+        if 'embedding' in item:
+            similarity = np.dot(query_embedding, item['embedding'])
+            similarities.append((similarity, idx))
+    similarities.sort(reverse=True)
+    return similarities[:top_k]
+
+
+def time_queries(search, queries) -> float:
+    """Return mean milliseconds per query"""
+    start = time.perf_counter()
+    for query in queries:
+        search(query)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+
+def run(size: int, dim: int, queries: int, top_k: int, loop_max: int, rng) -> None:
+    vectors = rng.standard_normal((size, dim), dtype=np.float32)
+    pages = rng.integers(1, 500, size)
+    query_vectors = [rng.standard_normal(dim, dtype=np.float32).tolist() for _ in range(queries)]
+
+    start = time.perf_counter()
+    index = VectorIndex(dim)
+    for offset in range(0, size, 10000):
+        batch = vectors[offset:offset + 10000]
+        index.add(batch, ['text'] * len(batch), pages[offset:offset + 10000],
+                  range(offset, offset + len(batch)))
+    build = time.perf_counter() - start
+
+    index_ms = time_queries(lambda q: index.search(q, top_k), query_vectors)
+    filtered_ms = time_queries(lambda q: index.search(q, top_k, content_type='text', pages=range(1, 50)),
+                               query_vectors)
+
+    loop_ms = None
+    if size <= loop_max:
+        content_sequence = [{'type': 'text', 'page': int(page), 'embedding': vector.tolist()}
+                            for vector, page in zip(vectors, pages)]
+        loop_ms = time_queries(lambda q: loop_search(content_sequence, q, top_k),
+                               query_vectors[:max(1, queries // 10)])
+
+    loop_text = f"{loop_ms:10.2f} ms" if loop_ms is not None else "   skipped"
+    speedup = f"{loop_ms / index_ms:8.1f}x" if loop_ms is not None else "       -"
+    print(f"{size:>9,}  build={build:7.2f}s  index={index_ms:8.2f} ms  "
+          f"filtered={filtered_ms:8.2f} ms  loop={loop_text}  speedup={speedup}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--dim', type=int, default=256)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--top-k', type=int, default=30)
+    parser.add_argument('--loop-max', type=int, default=100000,
+                        help='skip the loop baseline above this many vectors (it needs ~32 bytes per dimension)')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"dim={args.dim} top_k={args.top_k}")
+    for size in args.sizes:
+        run(size, args.dim, args.queries, args.top_k, args.loop_max, rng)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark process_pdf against a local fake Bedrock client
+
+Compares one-item-per-request serial embedding (the previous behaviour) with
+batched, concurrent embedding and reports throughput and per-page latency.
+
+Usage: python benchmarks/bench_ingestion.py --pages 100 --latency 0.05
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdf_processor_cohere import PDFProcessorCohere, EMBED_BATCH_SIZE, EMBED_MAX_WORKERS
+from embedding_cache import EmbeddingCache
+from rate_limiter import BedrockRateLimiter
+from blob_store import BlobStore
+from fake_bedrock import FakeBedrockRuntime
+from synthetic_pdf import make_pdf
+
+
+def run(pdf_path: str, pages: int, batch_size: int, max_workers: int, latency: float,
+        blob_store: BlobStore, cache: EmbeddingCache = None) -> None:
+    runtime = FakeBedrockRuntime(latency=latency)
+    processor = PDFProcessorCohere(embed_batch_size=batch_size, max_workers=max_workers,
+                                   bedrock_runtime=runtime, bedrock_agent_runtime=object(),
+                                   embedding_cache=cache or EmbeddingCache(None),
+                                   # The benchmark measures request scheduling, not the quotas
+                                   rate_limiter=BedrockRateLimiter({}),
+                                   blob_store=blob_store)
+
+    start = time.perf_counter()
+    items = processor.process_pdf(pdf_path)
+    elapsed = time.perf_counter() - start
+
+    chunk_ids = [item['chunk_id'] for item in items]
+    assert chunk_ids == sorted(chunk_ids), "chunk_id order is not deterministic"
+
+    print(f"batch={batch_size:<3} workers={max_workers:<3} "
+          f"items={len(items):<6} requests={runtime.calls:<6} "
+          f"time={elapsed:8.2f}s  throughput={len(items) / elapsed:8.1f} items/s  "
+          f"per-page={elapsed / pages * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=50)
+    parser.add_argument('--images-per-page', type=int, default=1)
+    parser.add_argument('--latency', type=float, default=0.05, help='fake request latency in seconds')
+    parser.add_argument('--workers', type=int, default=EMBED_MAX_WORKERS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pdf_path = make_pdf(os.path.join(tmp_dir, 'synthetic.pdf'), pages=args.pages,
+                            images_per_page=args.images_per_page)
+        blob_store = BlobStore(os.path.join(tmp_dir, 'blobs'))
+        print(f"Synthetic PDF: {args.pages} pages, fake latency {args.latency * 1000:.0f} ms")
+        run(pdf_path, args.pages, batch_size=1, max_workers=1, latency=args.latency, blob_store=blob_store)
+        run(pdf_path, args.pages, batch_size=EMBED_BATCH_SIZE, max_workers=1, latency=args.latency, blob_store=blob_store)
+        run(pdf_path, args.pages, batch_size=EMBED_BATCH_SIZE, max_workers=args.workers, latency=args.latency, blob_store=blob_store)
+
+        # Repeat ingestion of the same file through a shared cache
+        cache = EmbeddingCache(os.path.join(tmp_dir, 'cache.sqlite'))
+        for label in ('cold cache', 'warm cache'):
+            print(label)
+            run(pdf_path, args.pages, batch_size=EMBED_BATCH_SIZE, max_workers=args.workers,
+                latency=args.latency, blob_store=blob_store, cache=cache)
+        stats = cache.stats()
+        print(f"cache hits={stats['hits']} misses={stats['misses']} hit_rate={stats['hit_rate']:.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Stress LexicalIndex with searches running while chunks are added and the index is saved
+
+Search threads query the index while one thread keeps adding chunks, as during
+ingestion, and another saves it now and then. Reports searches and adds per second,
+and exits with an error if any thread raised, such as a BufferError from appending
+to an array that a search still reads.
+
+Usage: python benchmarks/bench_lexical_concurrency.py --searchers 2 --adds 20000 --batch 8
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lexical_index import LexicalIndex
+
+WORDS = ['revenue', 'growth', 'margin', 'quarter', 'guidance', 'operating', 'income', 'cash', 'flow',
+         'segment', 'forecast', 'expenses', 'capital', 'dividend', 'debt', 'pn-4471-x', 'clause', '4.2(b)']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--searchers', type=int, default=2, help='threads searching at the same time')
+    parser.add_argument('--adds', type=int, default=20000, help='chunks added while searching')
+    parser.add_argument('--batch', type=int, default=8, help='chunks per add call')
+    parser.add_argument('--words', type=int, default=40, help='words per chunk')
+    args = parser.parse_args()
+
+    index = LexicalIndex()
+    done = threading.Event()
+    errors = []
+    searches = [0] * args.searchers
+
+    def chunk(rng):
+        return ' '.join(rng.choice(WORDS) for _ in range(args.words))
+
+    def search(slot):
+        rng = random.Random(slot)
+        try:
+            while not done.is_set():
+                index.search(' '.join(rng.sample(WORDS, 3)), top_k=10, allowed=lambda item_id: item_id % 3 != 0)
+                searches[slot] += 1
+        except Exception as e:
+            errors.append(f"search: {type(e).__name__}: {e}")
+            done.set()
+
+    def save(tmp_dir):
+        try:
+            while not done.wait(0.05):
+                index.save(tmp_dir)
+        except Exception as e:
+            errors.append(f"save: {type(e).__name__}: {e}")
+            done.set()
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        threads = [threading.Thread(target=search, args=(slot,)) for slot in range(args.searchers)]
+        threads.append(threading.Thread(target=save, args=(tmp_dir,)))
+        for thread in threads:
+            thread.start()
+        start = time.perf_counter()
+        added = 0
+        try:
+            while added < args.adds and not done.is_set():
+                texts = [chunk(rng) for _ in range(args.batch)]
+                index.add(range(added, added + len(texts)), texts)
+                added += len(texts)
+        except Exception as e:
+            errors.append(f"add: {type(e).__name__}: {e}")
+        elapsed = time.perf_counter() - start
+        done.set()
+        for thread in threads:
+            thread.join()
+
+    print(f"{added:,} chunks added in {elapsed:.2f}s ({added / elapsed:,.0f}/s) while "
+          f"{args.searchers} threads ran {sum(searches):,} searches ({sum(searches) / elapsed:,.0f}/s)")
+    if errors:
+        sys.exit('FAILED: ' + '; '.join(errors))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+"""
+Load test the Flask app end to end against a local fake Bedrock
+
+Installs FakeBedrockClients in place of the AWS clients and drives the HTTP routes
+through Flask's test client from concurrent users, in two phases:
+1. ingest: each user uploads a synthetic PDF to /upload-chunk in chunks, calls
+   /finalize-upload and polls /jobs until the document is ready
+2. query: each user sends a mix of /search (with and without rerank) and /chat
+Reports p50/p99 latency, throughput and failed responses per route, and the calls,
+throttles and errors seen by the fakes. Runs in a temporary directory, so uploads,
+processed documents and caches start empty. Bedrock quotas are the app's own.
+
+Usage: python benchmarks/bench_load.py --users 8 --documents 4 --queries 20 --throttle-rate 0.05
+"""
+import argparse
+import io
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from pdf_processor_cohere import set_bedrock_clients
+from fake_bedrock import FakeBedrockClients
+from synthetic_pdf import make_pdf
+
+QUERY_WORDS = ['revenue', 'growth', 'margin', 'quarter', 'guidance', 'operating', 'income', 'cash', 'flow',
+               'segment', 'forecast', 'expenses', 'capital', 'dividend', 'debt']
+
+
+class Recorder:
+    """Latency and status code of every request, per route"""
+
+    def __init__(self):
+        self.requests = {}  # route -> [(seconds, status)]
+        self.lock = threading.Lock()
+
+    def send(self, route: str, call):
+        start = time.perf_counter()
+        response = call()
+        with self.lock:
+            self.requests.setdefault(route, []).append((time.perf_counter() - start, response.status_code))
+        return response
+
+    def add(self, route: str, seconds: float, status: int) -> None:
+        with self.lock:
+            self.requests.setdefault(route, []).append((seconds, status))
+
+    def report(self, elapsed: float) -> None:
+        for route, requests in self.requests.items():
+            ms = np.array([seconds for seconds, _ in requests]) * 1000
+            failed = sum(status >= 400 for _, status in requests)
+            print(f"  {route:<18} n={len(requests):<5} {len(requests) / elapsed:7.1f} req/s  "
+                  f"p50={np.percentile(ms, 50):8.1f} ms  p99={np.percentile(ms, 99):8.1f} ms  failed={failed}")
+
+
+def run_users(users: int, target) -> float:
+    """Run target(slot) on users threads and return the wall time"""
+    start = time.perf_counter()
+    threads = [threading.Thread(target=target, args=(slot,)) for slot in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def ingest(app, recorder: Recorder, pdf_path: str, name: str, chunk_size: int, document_ids: list) -> None:
+    """Upload one PDF in chunks, finalize it and wait for its ingestion job"""
+    client = app.test_client()
+    data = open(pdf_path, 'rb').read()
+    total_chunks = max(1, -(-len(data) // chunk_size))
+    start = time.perf_counter()
+    upload_id = None
+    for chunk in range(total_chunks):
+        form = {'file': (io.BytesIO(data[chunk * chunk_size:(chunk + 1) * chunk_size]), name),
+                'chunk': str(chunk), 'totalChunks': str(total_chunks), 'filename': name}
+        if upload_id:
+            form['uploadId'] = upload_id
+        response = recorder.send('/upload-chunk', lambda: client.post('/upload-chunk', data=form,
+                                                                      content_type='multipart/form-data'))
+        upload_id = response.json.get('upload_id')
+    response = recorder.send('/finalize-upload', lambda: client.post('/finalize-upload',
+                                                                     json={'upload_id': upload_id}))
+    if response.status_code != 202:
+        recorder.add('ingest', time.perf_counter() - start, response.status_code)
+        return
+    status_url = response.json['status_url']
+    while True:
+        job = client.get(status_url).json
+        if job['status'] not in ('queued', 'running'):
+            break
+        time.sleep(0.05)
+    recorder.add('ingest', time.perf_counter() - start, 200 if job['status'] == 'done' else 500)
+    if job['status'] == 'done':
+        document_ids.append(job['document_id'])
+
+
+def query(app, recorder: Recorder, queries: int, chat_share: float, rerank_share: float, seed: int) -> None:
+    """Send a seeded mix of search, rerank search and chat requests"""
+    client = app.test_client()
+    rng = random.Random(seed)
+    for _ in range(queries):
+        text = ' '.join(rng.sample(QUERY_WORDS, 3))
+        draw = rng.random()
+        if draw < chat_share:
+            recorder.send('/chat', lambda: client.post('/chat', json={'query': text}))
+        else:
+            use_rerank = draw < chat_share + (1 - chat_share) * rerank_share
+            route = '/search rerank' if use_rerank else '/search'
+            recorder.send(route, lambda: client.post('/search', json={'query': text, 'use_rerank': use_rerank}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=8, help='concurrent users')
+    parser.add_argument('--documents', type=int, default=4, help='PDFs uploaded in the ingest phase')
+    parser.add_argument('--pages', type=int, default=20, help='pages per PDF')
+    parser.add_argument('--images-per-page', type=int, default=0)
+    parser.add_argument('--chunk-size', type=int, default=16 * 1024, help='upload chunk size in bytes')
+    parser.add_argument('--queries', type=int, default=20, help='queries per user')
+    parser.add_argument('--chat-share', type=float, default=0.2, help='share of queries sent to /chat')
+    parser.add_argument('--rerank-share', type=float, default=0.5, help='share of searches with rerank')
+    parser.add_argument('--embed-latency', type=float, default=0.05, help='fake embed latency in seconds')
+    parser.add_argument('--rerank-latency', type=float, default=0.1, help='fake rerank latency in seconds')
+    parser.add_argument('--first-token-latency', type=float, default=0.3, help='fake chat latency in seconds')
+    parser.add_argument('--token-latency', type=float, default=0.005, help='fake chat time per token')
+    parser.add_argument('--jitter', type=float, default=0.0, help='extra latency per call, up to this many seconds')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='share of Bedrock calls throttled')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of Bedrock calls failing')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--verbose', action='store_true', help='keep the app log')
+    args = parser.parse_args()
+
+    fakes = FakeBedrockClients(embed_latency=args.embed_latency, rerank_latency=args.rerank_latency,
+                               first_token_latency=args.first_token_latency, token_latency=args.token_latency,
+                               throttle_rate=args.throttle_rate, error_rate=args.error_rate,
+                               jitter=args.jitter, seed=args.seed)
+    set_bedrock_clients(fakes)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pdf_paths = [make_pdf(os.path.join(tmp_dir, f'doc{index}.pdf'), pages=args.pages,
+                              images_per_page=args.images_per_page, seed=args.seed + index)
+                     for index in range(args.documents)]
+        # The app creates its folders and caches relative to the working directory
+        os.chdir(tmp_dir)
+        import app as app_module
+        if not args.verbose:
+            logging.disable(logging.CRITICAL)
+        app = app_module.create_app()
+
+        print(f"{args.users} users, {args.documents} PDFs x {args.pages} pages, {args.queries} queries per user; "
+              f"embed {args.embed_latency * 1000:.0f} ms, rerank {args.rerank_latency * 1000:.0f} ms, "
+              f"chat first token {args.first_token_latency * 1000:.0f} ms; "
+              f"throttle {args.throttle_rate:.0%}, errors {args.error_rate:.0%}")
+
+        recorder = Recorder()
+        document_ids = []
+        elapsed = run_users(min(args.users, args.documents), lambda slot: [
+            ingest(app, recorder, pdf_paths[index], f'doc{index}.pdf', args.chunk_size, document_ids)
+            for index in range(slot, args.documents, args.users)])
+        print(f"ingest: {len(document_ids)}/{args.documents} documents in {elapsed:.2f}s "
+              f"({args.documents * args.pages / elapsed:.1f} pages/s, "
+              f"{app.config['INGESTION_WORKERS']} ingestion worker)")
+        recorder.report(elapsed)
+
+        if document_ids:
+            recorder = Recorder()
+            elapsed = run_users(args.users, lambda slot: query(app, recorder, args.queries, args.chat_share,
+                                                               args.rerank_share, args.seed * 1000 + slot))
+            total = sum(len(requests) for requests in recorder.requests.values())
+            print(f"query: {total} requests in {elapsed:.2f}s ({total / elapsed:.1f} req/s)")
+            recorder.report(elapsed)
+
+        for name, stats in fakes.stats()['operations'].items():
+            print(f"fake {name:<28} calls={stats['calls']:<6} throttled={stats['throttled']:<5} "
+                  f"errors={stats['errors']}")
+        app_module.janitor.stop()
+        app_module.jobs.shutdown()
+        os.chdir(BENCH_DIR)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark int8 and binary vector codes against the float32 index
+
+Builds a clustered synthetic corpus (embeddings of real documents are far from
+uniform), saves it, and reloads it at each precision with the float vectors
+memory-mapped. Reports RAM per vector, recall@k against exact float32 search,
+and query latency, with and without rescoring the best candidates in float32.
+RAM excludes memory-mapped vectors: an exact float32 search over a mapping still
+pages the whole matrix in, while rescoring only touches the candidate rows.
+
+Usage: python benchmarks/bench_quantization.py --size 100000 --dim 1536 --top-k 10
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_index import VectorIndex
+
+
+def clustered_vectors(rng, size: int, dim: int, clusters: int, spread: float) -> np.ndarray:
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    vectors = centers[rng.integers(0, clusters, size)]
+    vectors += spread * rng.standard_normal((size, dim), dtype=np.float32)
+    return vectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=100000)
+    parser.add_argument('--dim', type=int, default=1536)
+    parser.add_argument('--clusters', type=int, default=1000)
+    parser.add_argument('--spread', type=float, default=1.0, help='noise around each cluster centre')
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--top-k', type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = clustered_vectors(rng, args.size, args.dim, args.clusters, args.spread)
+    # Queries near stored items, like a question about a passage
+    queries = vectors[rng.integers(0, args.size, args.queries)]
+    queries = queries + 0.5 * args.spread * rng.standard_normal(queries.shape, dtype=np.float32)
+
+    # Python float lists in content dicts, as embeddings were stored before the vector index
+    list_bytes = sys.getsizeof([0.0] * args.dim) + args.dim * sys.getsizeof(0.5)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index = VectorIndex(args.dim)
+        for start in range(0, args.size, 10000):
+            batch = vectors[start:start + 10000]
+            index.add(batch, ['text'] * len(batch), np.ones(len(batch), dtype=np.int32),
+                      range(start, start + len(batch)))
+        index.save(tmp_dir)
+        del index, vectors
+
+        exact = VectorIndex.load(tmp_dir, mmap=False)
+        truth = [set(item_id for _, item_id in exact.search(query, args.top_k)) for query in queries]
+
+        print(f"{args.size:,} vectors, dim={args.dim}, recall@{args.top_k} over {args.queries} queries")
+        print(f"{'python lists':<24} RAM/vector={list_bytes:>7,} B")
+        configs = [('float32', 0, False), ('float32', 0, True), ('int8', 0, True), ('int8', 4, True),
+                   ('binary', 0, True), ('binary', 4, True), ('binary', 10, True)]
+        for precision, rescore_factor, mmap in configs:
+            start = time.perf_counter()
+            index = VectorIndex.load(tmp_dir, mmap=mmap, precision=precision, rescore_factor=rescore_factor)
+            load = time.perf_counter() - start
+            index.search(queries[0], args.top_k)  # Warm up
+
+            start = time.perf_counter()
+            results = [index.search(query, args.top_k) for query in queries]
+            latency = (time.perf_counter() - start) / len(queries) * 1000
+            recall = np.mean([len(truth[i] & set(item_id for _, item_id in result)) / args.top_k
+                              for i, result in enumerate(results)])
+
+            label = f"{precision}{' mmap' if mmap else ''}" + (f" rescore x{rescore_factor}" if rescore_factor else '')
+            print(f"{label:<24} RAM/vector={index.memory_bytes() / args.size:>7,.0f} B  "
+                  f"recall={recall:.3f}  query={latency:7.2f} ms  load={load:6.2f}s")
+            del index
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark the rerank cache and in-flight deduplication against a local fake Bedrock client
+
+Concurrent users ask questions drawn from a Zipf distribution over a fixed set, so
+popular questions repeat, as they do from a shared UI. Each question is retrieved
+twice, like the search toggle followed by chat: search_with_toggle, then
+rerank_search with the chat's top_k. Reports rerank API calls and per-question
+latency with the cache and deduplication off and on.
+
+Usage: python benchmarks/bench_rerank_cache.py --users 16 --questions 20 --distinct 50 --rerank-latency 0.3
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdf_processor_cohere import PDFProcessorCohere
+from embedding_cache import EmbeddingCache, TTLCache
+from rate_limiter import BedrockRateLimiter
+from blob_store import BlobStore
+from fake_bedrock import FakeBedrockRuntime, FakeBedrockAgentRuntime
+from synthetic_pdf import make_pdf
+
+
+class NoSharing:
+    """Stands in for SingleFlight with deduplication off"""
+
+    def do(self, key, fn):
+        return fn(), False
+
+    def stats(self):
+        return {}
+
+
+def run(processor: PDFProcessorCohere, questions, users: int) -> np.ndarray:
+    latencies = []
+    lock = threading.Lock()
+
+    def user(slot: int):
+        for question in questions[slot]:
+            start = time.perf_counter()
+            processor.search_with_toggle(question, use_rerank=True)
+            processor.rerank_search(question, top_k=3)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=user, args=(slot,)) for slot in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return np.array(latencies) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--users', type=int, default=16)
+    parser.add_argument('--questions', type=int, default=20, help='questions per user')
+    parser.add_argument('--distinct', type=int, default=50, help='distinct questions')
+    parser.add_argument('--zipf', type=float, default=1.2, help='Zipf exponent of question popularity')
+    parser.add_argument('--rerank-latency', type=float, default=0.3, help='fake rerank latency in seconds')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    popularity = 1 / np.arange(1, args.distinct + 1) ** args.zipf
+    picks = rng.choice(args.distinct, (args.users, args.questions), p=popularity / popularity.sum())
+    questions = [[f"what does section {pick} say about revenue and margin" for pick in row] for row in picks]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pdf_path = make_pdf(os.path.join(tmp_dir, 'synthetic.pdf'), pages=args.pages)
+        print(f"{args.users} users x {args.questions} questions, {len(np.unique(picks))} distinct, "
+              f"rerank latency {args.rerank_latency * 1000:.0f} ms")
+        for label, cached in [('no cache', False), ('cache + dedup', True)]:
+            agent_runtime = FakeBedrockAgentRuntime(latency=args.rerank_latency)
+            processor = PDFProcessorCohere(bedrock_runtime=FakeBedrockRuntime(latency=0),
+                                           bedrock_agent_runtime=agent_runtime,
+                                           embedding_cache=EmbeddingCache(None),
+                                           rate_limiter=BedrockRateLimiter({}),
+                                           blob_store=BlobStore(os.path.join(tmp_dir, 'blobs')))
+            processor.process_pdf(pdf_path)
+            if not cached:
+                processor.rerank_cache = TTLCache(max_items=0)
+                processor.rerank_flight = NoSharing()
+            ms = run(processor, questions, args.users)
+            print(f"{label:<14} rerank calls={agent_runtime.calls:<5} p50={np.percentile(ms, 50):7.1f} ms  "
+                  f"p95={np.percentile(ms, 95):7.1f} ms  cache={processor.rerank_cache.stats()}  "
+                  f"in-flight={processor.rerank_flight.stats()}")
+
+
+if __name__ == '__main__':
+    main()
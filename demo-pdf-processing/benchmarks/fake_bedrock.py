@@ -0,0 +1,262 @@
+"""
+Local stand-in for the Bedrock runtime clients used by the benchmarks
+Each fake has a configurable latency and can inject throttling and service errors
+at a given rate. Faults and latency jitter are drawn from a seeded generator, so a
+run with the same seed and request order fails the same requests. The Async*
+variants mimic aiobotocore clients for the async processor API.
+"""
+import asyncio
+import hashlib
+import io
+import json
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from botocore.exceptions import ClientError
+
+from bedrock_clients import BedrockClients
+
+EMBEDDING_DIM = 1536
+
+
+def fake_embedding(value: str, dim: int = EMBEDDING_DIM) -> List[float]:
+    """Deterministic unit-length embedding derived from the input"""
+    seed = int.from_bytes(hashlib.sha256(value.encode('utf-8')).digest()[:8], 'little')
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    vector /= np.linalg.norm(vector)
+    return vector.tolist()
+
+
+def client_error(code: str, status: int, operation: str) -> ClientError:
+    """The botocore error Bedrock returns for code"""
+    return ClientError({'Error': {'Code': code, 'Message': f"Injected {code}"},
+                        'ResponseMetadata': {'HTTPStatusCode': status}}, operation)
+
+
+class FaultInjector:
+    """
+    Seeded throttling, error and latency jitter shared by the fakes
+    throttle_rate: share of calls failing with ThrottlingException (HTTP 429)
+    error_rate: share of calls failing with InternalServerException (HTTP 500)
+    jitter: maximum extra latency per call in seconds, drawn uniformly
+    seed: seed of the generator behind all three
+    """
+
+    def __init__(self, throttle_rate: float = 0.0, error_rate: float = 0.0, jitter: float = 0.0, seed: int = 0):
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.throttled = 0
+        self.errors = 0
+        self.fault_lock = threading.Lock()
+
+    def _call(self, operation: str) -> float:
+        """Count a call and return its extra latency, or raise the injected fault"""
+        with self.fault_lock:
+            self.calls += 1
+            draw = self.random.random()
+            extra = self.random.uniform(0, self.jitter) if self.jitter else 0.0
+            if draw < self.throttle_rate:
+                self.throttled += 1
+                fault = client_error('ThrottlingException', 429, operation)
+            elif draw < self.throttle_rate + self.error_rate:
+                self.errors += 1
+                fault = client_error('InternalServerException', 500, operation)
+            else:
+                fault = None
+        if fault is not None:
+            # Bedrock rejects throttled and failed requests after a short round trip
+            time.sleep(extra)
+            raise fault
+        return extra
+
+    def fault_stats(self) -> Dict[str, int]:
+        with self.fault_lock:
+            return {'calls': self.calls, 'throttled': self.throttled, 'errors': self.errors}
+
+
+class FakeBedrockRuntime(FaultInjector):
+    """Mimics bedrock-runtime invoke_model for Cohere embed requests, and chat requests if given a chat fake"""
+
+    def __init__(self, latency: float = 0.05, per_item_latency: float = 0.001,
+                 dim: int = EMBEDDING_DIM, chat: Optional['FakeChatClient'] = None, **faults):
+        """
+        latency: fixed round-trip time per request in seconds
+        per_item_latency: additional time per text or image in the request
+        chat: answers requests with a "message", with its latency
+        faults: throttle_rate, error_rate, jitter and seed, see FaultInjector
+        """
+        super().__init__(**faults)
+        self.latency = latency
+        self.per_item_latency = per_item_latency
+        self.dim = dim
+        self.chat = chat
+        self.image_calls = 0
+        self.items = 0
+        self.lock = threading.Lock()
+
+    def _respond(self, body: str) -> Tuple[float, bytes]:
+        """Seconds to wait and the response payload"""
+        request = json.loads(body)
+        extra = self._call('InvokeModel')
+        if 'message' in request and self.chat is not None:
+            tokens = self.chat._answer_tokens(request['message'])
+            seconds = self.chat.first_token_latency + self.chat.token_latency * len(tokens) + extra
+            return seconds, json.dumps({"text": ''.join(tokens), "finish_reason": "COMPLETE"}).encode('utf-8')
+
+        inputs = request.get("texts") or request.get("images") or []
+        with self.lock:
+            self.image_calls += 'images' in request
+            self.items += len(inputs)
+        response = {"embeddings": {"float": [fake_embedding(value, self.dim) for value in inputs]}}
+        return self.latency + self.per_item_latency * len(inputs) + extra, json.dumps(response).encode('utf-8')
+
+    def invoke_model(self, body: str, modelId: str, contentType: str = "application/json",
+                     accept: str = "*/*") -> Dict[str, Any]:
+        seconds, payload = self._respond(body)
+        time.sleep(seconds)
+        return {"body": io.BytesIO(payload)}
+
+
+class FakeBedrockAgentRuntime(FaultInjector):
+    """Mimics bedrock-agent-runtime rerank by scoring word overlap with the query"""
+
+    def __init__(self, latency: float = 0.1, **faults):
+        super().__init__(**faults)
+        self.latency = latency
+
+    def _respond(self, queries: List[Dict[str, Any]], sources: List[Dict[str, Any]],
+                 rerankingConfiguration: Dict[str, Any]) -> Tuple[float, Dict[str, Any]]:
+        extra = self._call('Rerank')
+        query_words = set(queries[0]["textQuery"]["text"].lower().split())
+        scores = []
+        for index, source in enumerate(sources):
+            words = set(source["inlineDocumentSource"]["textDocument"]["text"].lower().split())
+            scores.append((len(query_words & words) / (len(query_words) or 1), index))
+        scores.sort(reverse=True)
+        top_n = rerankingConfiguration["bedrockRerankingConfiguration"]["numberOfResults"]
+        return self.latency + extra, {"results": [{"index": index, "relevanceScore": score}
+                                                  for score, index in scores[:top_n]]}
+
+    def rerank(self, **request) -> Dict[str, Any]:
+        seconds, response = self._respond(**request)
+        time.sleep(seconds)
+        return response
+
+
+class FakeStreamingBody:
+    """Mimics aiobotocore's StreamingBody: read() is a coroutine and the body is an async context manager"""
+
+    def __init__(self, payload: bytes):
+        self.payload = payload
+
+    async def read(self) -> bytes:
+        return self.payload
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class AsyncFakeBedrockRuntime(FakeBedrockRuntime):
+    """Mimics an aiobotocore bedrock-runtime client; waiting does not hold a thread"""
+
+    async def invoke_model(self, body: str, modelId: str, contentType: str = "application/json",
+                           accept: str = "*/*") -> Dict[str, Any]:
+        seconds, payload = self._respond(body)
+        await asyncio.sleep(seconds)
+        return {"body": FakeStreamingBody(payload)}
+
+
+class AsyncFakeBedrockAgentRuntime(FakeBedrockAgentRuntime):
+    """Mimics an aiobotocore bedrock-agent-runtime client"""
+
+    async def rerank(self, **request) -> Dict[str, Any]:
+        seconds, response = self._respond(**request)
+        await asyncio.sleep(seconds)
+        return response
+
+
+class FakeChatEvent:
+    """Mimics a cohere_aws streaming text-generation event"""
+
+    def __init__(self, text: str, event_type: str = "text-generation"):
+        self.text = text
+        self.event_type = event_type
+
+
+class FakeChatResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeChatClient(FaultInjector):
+    """Mimics cohere_aws.Client.chat with a fixed first-token delay and per-token generation time"""
+
+    def __init__(self, first_token_latency: float = 0.3, token_latency: float = 0.03, tokens: int = 100,
+                 **faults):
+        super().__init__(**faults)
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.tokens = tokens
+
+    def _answer_tokens(self, message: str) -> List[str]:
+        words = message.split() or ["answer"]
+        return [words[i % len(words)] + ' ' for i in range(self.tokens)]
+
+    def _stream(self, tokens: List[str], extra: float):
+        yield FakeChatEvent("", event_type="stream-start")
+        time.sleep(self.first_token_latency + extra)
+        for token in tokens:
+            yield FakeChatEvent(token)
+            time.sleep(self.token_latency)
+        yield FakeChatEvent(''.join(tokens), event_type="stream-end")
+
+    def chat(self, message: str, model_id: str = None, stream: bool = False, **kwargs):
+        extra = self._call('InvokeModelWithResponseStream' if stream else 'InvokeModel')
+        tokens = self._answer_tokens(message)
+        if stream:
+            return self._stream(tokens, extra)
+        time.sleep(self.first_token_latency + extra + self.token_latency * len(tokens))
+        return FakeChatResponse(''.join(tokens))
+
+
+class FakeBedrockClients(BedrockClients):
+    """
+    Drop-in for BedrockClients backed by the fakes, for running the app without AWS
+    Install with pdf_processor_cohere.set_bedrock_clients before processors are created.
+    The async clients answer chat requests with the chat fake's latency and answers.
+    faults: throttle_rate, error_rate, jitter and seed, applied to every fake
+    """
+
+    def __init__(self, embed_latency: float = 0.05, rerank_latency: float = 0.1,
+                 first_token_latency: float = 0.3, token_latency: float = 0.03, tokens: int = 100,
+                 **faults):
+        super().__init__('local')
+        seed = faults.pop('seed', 0)
+        # Separate seeds, so the fault sequence of one service does not depend on traffic to the others
+        self._chat = FakeChatClient(first_token_latency, token_latency, tokens, seed=seed + 2, **faults)
+        self.clients = {'bedrock-runtime': FakeBedrockRuntime(latency=embed_latency, seed=seed, **faults),
+                        'bedrock-agent-runtime': FakeBedrockAgentRuntime(latency=rerank_latency, seed=seed + 1,
+                                                                         **faults)}
+        self.async_clients = {
+            'bedrock-runtime': AsyncFakeBedrockRuntime(latency=embed_latency, chat=self._chat, seed=seed + 3,
+                                                       **faults),
+            'bedrock-agent-runtime': AsyncFakeBedrockAgentRuntime(latency=rerank_latency, seed=seed + 4, **faults)}
+
+    def chat(self) -> FakeChatClient:
+        return self._chat
+
+    def stats(self) -> Dict[str, Any]:
+        fakes = [('', self.clients), ('async ', self.async_clients)]
+        operations = {f"{prefix}{name}": client.fault_stats() for prefix, clients in fakes
+                      for name, client in clients.items()}
+        operations['chat'] = self._chat.fault_stats()
+        return {'operations': operations, 'connections': {}}
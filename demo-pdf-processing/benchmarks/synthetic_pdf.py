@@ -0,0 +1,69 @@
+"""Generate synthetic PDFs for the benchmarks"""
+import random
+
+import fitz
+
+WORDS = ("revenue income margin quarter fiscal growth segment operating cash flow "
+         "guidance outlook risk factor liability asset equity dividend share "
+         "customer product market region forecast expense capital").split()
+
+
+def make_sentence(rng: random.Random) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(8, 20))]
+    return ' '.join(words).capitalize() + '.'
+
+
+def make_image(rng: random.Random, size: int = 64, blocks: int = 8) -> fitz.Pixmap:
+    """A random grid of coloured blocks, so every image has distinct, non-trivial content"""
+    pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, size, size), False)
+    step = size // blocks
+    for y in range(0, size, step):
+        for x in range(0, size, step):
+            pix.set_rect(fitz.IRect(x, y, x + step, y + step),
+                         (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    return pix
+
+
+def make_pdf(path: str, pages: int = 50, sentences_per_page: int = 40,
+             images_per_page: int = 0, seed: int = 0, logo: bool = False,
+             icons_per_page: int = 0, blank_images_per_page: int = 0, drawings_every: int = 0) -> str:
+    """
+    Write a PDF with random financial-sounding text and optional images
+    logo: show the same image object in the header of every page
+    icons_per_page: 16x16 images; blank_images_per_page: solid-colour images
+    drawings_every: draw a vector chart on every n-th page (0 for none)
+    """
+    rng = random.Random(seed)
+    doc = fitz.open()
+    logo_xref = 0
+    for page_num in range(pages):
+        page = doc.new_page()
+        text = ' '.join(make_sentence(rng) for _ in range(sentences_per_page))
+        page.insert_textbox(fitz.Rect(36, 36, 576, 756), text, fontsize=8)
+        for img_index in range(images_per_page):
+            rect = fitz.Rect(36 + 70 * img_index, 700, 100 + 70 * img_index, 764)
+            page.insert_image(rect, pixmap=make_image(rng))
+        if logo:
+            if logo_xref:
+                page.insert_image(fitz.Rect(500, 4, 564, 30), xref=logo_xref)
+            else:
+                logo_xref = page.insert_image(fitz.Rect(500, 4, 564, 30), pixmap=make_image(random.Random(-1)))
+        for icon_index in range(icons_per_page):
+            rect = fitz.Rect(36 + 20 * icon_index, 770, 52 + 20 * icon_index, 786)
+            page.insert_image(rect, pixmap=make_image(rng, size=16, blocks=4))
+        for blank_index in range(blank_images_per_page):
+            pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 64, 64), False)
+            pix.set_rect(pix.irect, (255, 255, 255 - blank_index))
+            page.insert_image(fitz.Rect(400 + 70 * blank_index, 700, 464 + 70 * blank_index, 764), pixmap=pix)
+        if drawings_every and page_num % drawings_every == 0:
+            # A small bar chart: axes plus one rectangle per bar
+            shape = page.new_shape()
+            shape.draw_line((320, 690), (560, 690))
+            shape.draw_line((320, 690), (320, 560))
+            for bar in range(6):
+                shape.draw_rect(fitz.Rect(330 + 38 * bar, 690 - rng.randint(20, 120), 360 + 38 * bar, 690))
+            shape.finish(color=(0, 0, 0), fill=(0.3, 0.5, 0.8))
+            shape.commit()
+    doc.save(path)
+    doc.close()
+    return path
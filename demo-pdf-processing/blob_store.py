@@ -0,0 +1,121 @@
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+from typing import Dict
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Keys are "<sha256>.<ext>", so the format travels with the reference
+BLOB_KEY_PATTERN = re.compile(r'^[0-9a-f]{64}\.[a-z0-9]{1,5}$')
+
+MIME_TYPES = {
+    'png': 'image/png',
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'gif': 'image/gif',
+    'bmp': 'image/bmp',
+    'tif': 'image/tiff',
+    'tiff': 'image/tiff',
+    'webp': 'image/webp'
+}
+
+# Widths served by thumbnail; other sizes are rejected so clients cannot fill the disk
+THUMBNAIL_SIZES = (128, 256, 512)
+
+
+def is_blob_key(key: str) -> bool:
+    return bool(BLOB_KEY_PATTERN.match(key or ''))
+
+
+def mime_type(key: str) -> str:
+    return MIME_TYPES.get(key.rsplit('.', 1)[-1], 'application/octet-stream')
+
+
+class BlobStore:
+    """
+    Content-addressed store for extracted images and page renders
+    Each blob is written once to root/<first two hex digits>/<key>; storing the same
+    bytes again returns the existing key. Thumbnails are derived on first request
+    and kept under root/thumbs/<width>/.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        if not is_blob_key(key):
+            raise KeyError(f"Invalid blob key: {key}")
+        return os.path.join(self.root, key[:2], key)
+
+    def put(self, data: bytes, ext: str) -> str:
+        """Store bytes and return their key"""
+        ext = ext.lower().lstrip('.')
+        key = f"{hashlib.sha256(data).hexdigest()}.{ext}"
+        path = self.path(key)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Unique temporary name, so concurrent writers of the same blob cannot collide
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return key
+
+    def get(self, key: str) -> bytes:
+        """Return the blob's bytes; raises KeyError if it is missing"""
+        try:
+            with open(self.path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            raise KeyError(f"Unknown blob: {key}")
+
+    def exists(self, key: str) -> bool:
+        return is_blob_key(key) and os.path.exists(self.path(key))
+
+    def thumbnail(self, key: str, width: int) -> str:
+        """
+        Return the path of a JPEG thumbnail at most width pixels wide, creating it if needed
+        width: one of THUMBNAIL_SIZES
+        Raises PIL.UnidentifiedImageError if the blob is not an image Pillow can read.
+        """
+        if width not in THUMBNAIL_SIZES:
+            raise ValueError(f"Unsupported thumbnail size {width}, use one of {THUMBNAIL_SIZES}")
+        source = self.path(key)
+        thumb_path = os.path.join(self.root, 'thumbs', str(width), key[:2], f"{key}.jpg")
+        if os.path.exists(thumb_path):
+            return thumb_path
+        if not os.path.exists(source):
+            raise KeyError(f"Unknown blob: {key}")
+
+        with Image.open(source) as image:
+            image.thumbnail((width, width * 4))
+            if image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            buffer = io.BytesIO()
+            image.save(buffer, format='JPEG', quality=85)
+
+        os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+        tmp_path = f"{thumb_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(buffer.getvalue())
+        os.replace(tmp_path, thumb_path)
+        return thumb_path
+
+    def stats(self) -> Dict[str, int]:
+        """Number of blobs and their total size on disk, thumbnails included"""
+        blobs = 0
+        total = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                try:
+                    total += os.path.getsize(os.path.join(dirpath, filename))
+                    blobs += 1
+                except OSError:
+                    continue
+        return {'blobs': blobs, 'bytes': total}
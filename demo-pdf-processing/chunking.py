@@ -0,0 +1,166 @@
+"""
+Layout-aware, token-budgeted text chunking
+Chunks are packed from PyMuPDF's block/line structure: lines are never split across
+chunks unless a single line exceeds the budget, chunks prefer to end at block
+boundaries, and consecutive chunks share a few trailing lines of overlap. Each chunk
+carries the bounding box of the lines it contains. Packing is a single pass over the
+lines and every chunk's text is built with one join.
+"""
+import re
+from collections import deque
+from functools import lru_cache
+from itertools import groupby
+from operator import itemgetter
+from typing import Any, Dict, List, Optional, Tuple
+
+# Tokens are approximated without a tokenizer: one per punctuation mark, and one per
+# started 6 characters of each word
+TOKEN_PATTERN = re.compile(r"\w{1,6}|[^\w\s]")
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+PARAGRAPH_BOUNDARY = re.compile(r"\n\s*\n")
+
+# (text, tokens, bbox or None, block number)
+Unit = Tuple[str, int, Optional[Tuple[float, float, float, float]], int]
+
+
+def approx_token_count(text: str) -> int:
+    """Approximate number of subword tokens in text"""
+    return len(TOKEN_PATTERN.findall(text))
+
+
+@lru_cache(maxsize=65536)
+def word_token_count(word: str) -> int:
+    """approx_token_count of one whitespace-free word, cached: pages repeat most of their words"""
+    return len(TOKEN_PATTERN.findall(word))
+
+
+def union_bbox(boxes) -> Optional[Tuple[float, float, float, float]]:
+    boxes = [box for box in boxes if box is not None]
+    if not boxes:
+        return None
+    return (min(box[0] for box in boxes), min(box[1] for box in boxes),
+            max(box[2] for box in boxes), max(box[3] for box in boxes))
+
+
+class Chunker:
+    """
+    Splits page text into chunks of at most max_tokens approximate tokens
+    max_tokens: token budget per chunk
+    overlap_tokens: tokens of trailing lines repeated at the start of the next chunk
+    min_tokens: a chunk at least this full ends at a block boundary rather than splitting the next block
+    """
+
+    def __init__(self, max_tokens: int = 256, overlap_tokens: int = 32, min_tokens: Optional[int] = None):
+        self.max_tokens = max(1, max_tokens)
+        self.overlap_tokens = max(0, min(overlap_tokens, self.max_tokens // 2))
+        self.min_tokens = self.max_tokens // 2 if min_tokens is None else min_tokens
+
+    def _split_words(self, words: List[Tuple[str, Any]], block: int) -> List[Unit]:
+        """Group (word, bbox) pairs into units that fit the budget"""
+        units = []
+        group = []
+        tokens = 0
+        for word, bbox in words:
+            word_tokens = word_token_count(word)
+            if group and tokens + word_tokens > self.max_tokens:
+                units.append((' '.join(w for w, _ in group), tokens, union_bbox(b for _, b in group), block))
+                group = []
+                tokens = 0
+            group.append((word, bbox))
+            tokens += word_tokens
+        if group:
+            units.append((' '.join(w for w, _ in group), tokens, union_bbox(b for _, b in group), block))
+        return units
+
+    def page_units(self, page) -> List[Unit]:
+        """One unit per text line on a PyMuPDF page, in content stream order"""
+        units = []
+        # words: (x0, y0, x1, y1, word, block_no, line_no, word_no)
+        for (block, _), line in groupby(page.get_text('words'), key=itemgetter(5, 6)):
+            x0, y0, x1, y1, words = list(zip(*line))[:5]
+            # Tokens never span whitespace, so a line's count is the sum over its words
+            tokens = sum(map(word_token_count, words))
+            if tokens <= self.max_tokens:
+                units.append((' '.join(words), tokens, (min(x0), min(y0), max(x1), max(y1)), block))
+            else:
+                # Only lines longer than the whole budget are split, by word
+                units.extend(self._split_words(list(zip(words, zip(x0, y0, x1, y1))), block))
+        return units
+
+    def text_units(self, text: str) -> List[Unit]:
+        """Units for plain text: sentences, with paragraphs standing in for blocks"""
+        units = []
+        for block, paragraph in enumerate(PARAGRAPH_BOUNDARY.split(text)):
+            for sentence in SENTENCE_BOUNDARY.split(paragraph.replace('\n', ' ')):
+                sentence = sentence.strip()
+                if not sentence:
+                    continue
+                tokens = approx_token_count(sentence)
+                if tokens <= self.max_tokens:
+                    units.append((sentence, tokens, None, block))
+                else:
+                    units.extend(self._split_words([(word, None) for word in sentence.split()], block))
+        return units
+
+    @staticmethod
+    def _chunk(units: List[Unit]) -> Dict[str, Any]:
+        parts = []
+        previous_block = None
+        for text, _, _, block in units:
+            if previous_block is not None:
+                parts.append(' ' if block == previous_block else '\n')
+            parts.append(text)
+            previous_block = block
+        return {
+            'text': ''.join(parts),
+            'bbox': union_bbox(unit[2] for unit in units),
+            'tokens': sum(unit[1] for unit in units)
+        }
+
+    def pack(self, units: List[Unit]) -> List[Dict[str, Any]]:
+        """Pack units into chunks of text, bbox and token count"""
+        block_tokens = {}
+        for _, tokens, _, block in units:
+            block_tokens[block] = block_tokens.get(block, 0) + tokens
+
+        chunks = []
+        current = []
+        current_tokens = 0
+        new_units = 0  # Units in current that are not overlap from the previous chunk
+        for unit in units:
+            _, tokens, _, block = unit
+            starts_block = bool(current) and block != current[-1][3]
+            over_budget = current_tokens + tokens > self.max_tokens
+            # Keep a block that would fit in the next chunk together, if this one is full enough
+            block_break = starts_block and current_tokens >= self.min_tokens and \
+                current_tokens + block_tokens[block] > self.max_tokens
+            if new_units and (over_budget or block_break):
+                chunks.append(self._chunk(current))
+                # Carry trailing lines over as overlap, leaving room for the next unit
+                tail = deque()
+                tail_tokens = 0
+                for previous in reversed(current):
+                    if tail_tokens + previous[1] > self.overlap_tokens:
+                        break
+                    tail.appendleft(previous)
+                    tail_tokens += previous[1]
+                while tail and tail_tokens + tokens > self.max_tokens:
+                    tail_tokens -= tail.popleft()[1]
+                current = list(tail)
+                current_tokens = tail_tokens
+                new_units = 0
+            current.append(unit)
+            current_tokens += tokens
+            new_units += 1
+
+        if new_units:
+            chunks.append(self._chunk(current))
+        return chunks
+
+    def chunk_page(self, page) -> List[Dict[str, Any]]:
+        """Chunk a PyMuPDF page into dicts with text, bbox and tokens"""
+        return self.pack(self.page_units(page))
+
+    def chunk_text(self, text: str) -> List[str]:
+        """Chunk plain text, splitting at sentence boundaries"""
+        return [chunk['text'] for chunk in self.pack(self.text_units(text))]
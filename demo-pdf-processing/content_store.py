@@ -0,0 +1,149 @@
+import math
+import threading
+from array import array
+from typing import Any, Dict, Iterable, Iterator
+
+# Fields of the two item layouts kept in columns, as _page_items builds them
+TEXT_FIELDS = frozenset(('page', 'chunk', 'content', 'type', 'bbox', 'chunk_id'))
+IMAGE_FIELDS = frozenset(('page', 'index', 'type', 'format', 'blob_key', 'chunk_id'))
+
+TEXT = 0
+IMAGE = 1
+OTHER = 2  # Any other item shape, kept as a dict
+
+INT32_MIN = -2 ** 31
+INT32_MAX = 2 ** 31 - 1
+NO_BBOX = float('nan')
+
+
+def _is_int32(value: Any) -> bool:
+    return type(value) is int and INT32_MIN <= value <= INT32_MAX
+
+
+class ContentStore:
+    """
+    A document's content items in typed columns instead of one dict per item
+    page, chunk (or image index) and chunk_id are int32 columns, the type a byte,
+    the bbox four doubles (NaN when absent) and image formats an index into a short
+    interned list. Text content and blob keys live in one UTF-8 arena addressed by
+    offsets. Vectors stay in the VectorIndex. Indexing builds a fresh dict, so only
+    the items actually returned are materialized and callers may modify them.
+    Items with another shape are kept as dicts and returned as copies.
+    """
+
+    def __init__(self, items: Iterable[Dict[str, Any]] = ()):
+        self.pages = array('i')
+        self.numbers = array('i')  # Text chunk number or image index
+        self.chunk_ids = array('i')
+        self.bboxes = array('d')  # Four values per item
+        self.format_codes = array('H')
+        self.formats = []  # Interned image formats, by code
+        self.format_index = {}
+        self.offsets = array('Q', [0])  # Arena span of item i is offsets[i]:offsets[i + 1]
+        self.arena = bytearray()
+        self.kinds = array('B')
+        self.other = {}  # item id -> dict, for items outside both layouts
+        self.lock = threading.Lock()
+        self.extend(items)
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def __getitem__(self, idx: int) -> Dict[str, Any]:
+        if idx < 0:
+            idx += len(self.kinds)
+        kind = self.kinds[idx]
+        if kind == OTHER:
+            return dict(self.other[idx])
+        value = self.arena[self.offsets[idx]:self.offsets[idx + 1]].decode('utf-8')
+        if kind == TEXT:
+            bbox = tuple(self.bboxes[idx * 4:idx * 4 + 4])
+            return {
+                'page': self.pages[idx],
+                'chunk': self.numbers[idx],
+                'content': value,
+                'type': 'text',
+                'bbox': None if math.isnan(bbox[0]) else bbox,
+                'chunk_id': self.chunk_ids[idx]
+            }
+        return {
+            'page': self.pages[idx],
+            'index': self.numbers[idx],
+            'type': 'image',
+            'format': self.formats[self.format_codes[idx]],
+            'blob_key': value,
+            'chunk_id': self.chunk_ids[idx]
+        }
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for idx in range(len(self.kinds)):
+            yield self[idx]
+
+    def page(self, idx: int) -> Any:
+        """Page of an item, without building the item"""
+        if self.kinds[idx] == OTHER:
+            return self.other[idx].get('page')
+        return self.pages[idx]
+
+    def _kind(self, item: Dict[str, Any]) -> int:
+        """Layout an item fits in, or OTHER"""
+        if item.get('type') == 'text' and item.keys() == TEXT_FIELDS:
+            bbox = item['bbox']
+            if (_is_int32(item['chunk']) and isinstance(item['content'], str)
+                    and (bbox is None or (len(bbox) == 4 and all(isinstance(v, (int, float)) for v in bbox)))):
+                kind = TEXT
+            else:
+                return OTHER
+        elif item.get('type') == 'image' and item.keys() == IMAGE_FIELDS:
+            if _is_int32(item['index']) and isinstance(item['format'], str) and isinstance(item['blob_key'], str):
+                kind = IMAGE
+            else:
+                return OTHER
+        else:
+            return OTHER
+        return kind if _is_int32(item['page']) and _is_int32(item['chunk_id']) else OTHER
+
+    def append(self, item: Dict[str, Any]) -> None:
+        """Add an item; the store keeps its values, not the dict"""
+        self.extend([item])
+
+    def extend(self, items: Iterable[Dict[str, Any]]) -> None:
+        with self.lock:
+            for item in items:
+                idx = len(self.kinds)
+                kind = self._kind(item)
+                if kind == OTHER:
+                    self.other[idx] = dict(item)
+                    self.pages.append(0)
+                    self.numbers.append(0)
+                    self.chunk_ids.append(0)
+                    self.bboxes.extend((NO_BBOX,) * 4)
+                    self.format_codes.append(0)
+                else:
+                    self.pages.append(item['page'])
+                    self.chunk_ids.append(item['chunk_id'])
+                    if kind == TEXT:
+                        self.numbers.append(item['chunk'])
+                        self.bboxes.extend(item['bbox'] or (NO_BBOX,) * 4)
+                        self.format_codes.append(0)
+                        self.arena += item['content'].encode('utf-8')
+                    else:
+                        self.numbers.append(item['index'])
+                        self.bboxes.extend((NO_BBOX,) * 4)
+                        code = self.format_index.get(item['format'])
+                        if code is None:
+                            code = self.format_index[item['format']] = len(self.formats)
+                            self.formats.append(item['format'])
+                        self.format_codes.append(code)
+                        self.arena += item['blob_key'].encode('utf-8')
+                self.offsets.append(len(self.arena))
+                # Published last, so a concurrent reader never sees an item without its columns
+                self.kinds.append(kind)
+
+    def memory_bytes(self) -> int:
+        """Bytes held by the columns and the arena, with a rough allowance for items kept as dicts"""
+        total = (len(self.pages) * 4 + len(self.numbers) * 4 + len(self.chunk_ids) * 4 + len(self.bboxes) * 8
+                 + len(self.format_codes) * 2 + len(self.offsets) * 8 + len(self.arena) + len(self.kinds))
+        for item in self.other.values():
+            total += len(item.get('content', '')) + 200
+        return total
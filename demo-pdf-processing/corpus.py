@@ -0,0 +1,380 @@
+import asyncio
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from lexical_index import reciprocal_rank_fusion
+from pdf_processor_cohere import PDFProcessorCohere, MANIFEST_FILE
+from rate_limiter import ThrottlingRetriesExhausted
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_FILE = 'document.json'
+
+
+class Document:
+    """A registered document; its processor is None while evicted to disk"""
+
+    def __init__(self, document_id: str, name: str, store_dir: str, created: float):
+        self.document_id = document_id
+        self.name = name
+        self.store_dir = store_dir
+        self.created = created
+        self.processor = None
+        self.memory_bytes = 0
+        self.last_used = time.time()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'document_id': self.document_id,
+            'name': self.name,
+            'created': self.created,
+            'loaded': self.processor is not None,
+            'memory_bytes': self.memory_bytes,
+            'items': len(self.processor.content_sequence) if self.processor else None
+        }
+
+
+class CorpusRegistry:
+    """
+    Registry of processed documents keyed by document ID
+    Each document's results live under store_root/<document_id>. Loaded documents are
+    kept in LRU order; when the memory budget is exceeded, or a document has been idle
+    longer than idle_timeout, its processor is dropped and reloaded from disk
+    (memory-mapped) on next use.
+    """
+
+    def __init__(self, store_root: str, max_memory_bytes: int = 2 * 1024 * 1024 * 1024,
+                 idle_timeout: float = 1800,
+                 processor_factory: Callable[[], PDFProcessorCohere] = PDFProcessorCohere):
+        self.store_root = store_root
+        self.max_memory_bytes = max_memory_bytes
+        self.idle_timeout = idle_timeout
+        self.processor_factory = processor_factory
+        self.documents = OrderedDict()
+        self.lock = threading.RLock()
+        self._document_locks = {}
+        os.makedirs(store_root, exist_ok=True)
+        self._scan_store()
+
+    def _scan_store(self) -> None:
+        """Register documents saved by earlier runs without loading them"""
+        for document_id in sorted(os.listdir(self.store_root)):
+            store_dir = os.path.join(self.store_root, document_id)
+            info_path = os.path.join(store_dir, DOCUMENT_FILE)
+            if os.path.exists(os.path.join(store_dir, MANIFEST_FILE)) and os.path.exists(info_path):
+                try:
+                    with open(info_path) as f:
+                        info = json.load(f)
+                    self.documents[document_id] = Document(document_id, info['name'], store_dir, info['created'])
+                except Exception as e:
+                    logger.error(f"Error reading stored document {document_id}: {str(e)}")
+        logger.info(f"Corpus registry found {len(self.documents)} stored documents")
+
+    def _document_lock(self, document_id: str) -> threading.RLock:
+        with self.lock:
+            return self._document_locks.setdefault(document_id, threading.RLock())
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.documents)
+
+    def __contains__(self, document_id: str) -> bool:
+        with self.lock:
+            return document_id in self.documents
+
+    def list_documents(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            return [document.to_dict() for document in self.documents.values()]
+
+    def memory_usage(self) -> int:
+        """Approximate bytes held by loaded documents"""
+        with self.lock:
+            return sum(document.memory_bytes for document in self.documents.values())
+
+    def add(self, document_id: str, name: str, pdf_path: str,
+            progress_callback: Optional[Callable[[int, int, int], None]] = None) -> PDFProcessorCohere:
+        """
+        Process a PDF and register it under document_id
+        A document that was processed before is loaded from its saved results instead.
+        The document is registered as soon as processing starts, so pages that are
+        already indexed can be searched while the rest is processed.
+        Concurrent adds of the same document wait for the first one to finish.
+        """
+        with self._document_lock(document_id):
+            if document_id in self:
+                return self.get_processor(document_id)
+
+            store_dir = os.path.join(self.store_root, document_id)
+            processor = self.processor_factory()
+            document = Document(document_id, name, store_dir, time.time())
+            if os.path.exists(os.path.join(store_dir, MANIFEST_FILE)):
+                logger.info(f"Loading previously processed results for {name}")
+                processor.load_results(store_dir)
+                self._register(document, processor)
+            else:
+                # Not evictable until save_results has written the manifest
+                self._register(document, processor)
+                try:
+                    processor.process_pdf(pdf_path, progress_callback=progress_callback)
+                except Exception:
+                    with self.lock:
+                        self.documents.pop(document_id, None)
+                    raise
+                processor.save_results(store_dir)
+                with self.lock:
+                    document.memory_bytes = processor.memory_usage()
+                    self._enforce_limits(keep=document_id)
+
+            self._write_info(document)
+            return processor
+
+    def revise(self, document_id: str, name: str, pdf_path: str,
+               progress_callback: Optional[Callable[[int, int, int], None]] = None) -> Dict[str, Any]:
+        """
+        Replace a registered document with a revised PDF, re-embedding only pages that changed
+        The document keeps its ID; searches keep using the previous version until the
+        revision is swapped in. Raises KeyError for an unknown document.
+        Returns the processor's revision report.
+        """
+        with self._document_lock(document_id):
+            processor = self.get_processor(document_id)
+            report = processor.revise_pdf(pdf_path, progress_callback=progress_callback)
+            with self.lock:
+                document = self.documents[document_id]
+                document.name = name
+            processor.save_results(document.store_dir)
+            self._write_info(document)
+            with self.lock:
+                self._attach(document, processor)
+                self._enforce_limits(keep=document_id)
+            logger.info(f"Revised document {document_id} ({name})")
+            return report
+
+    @staticmethod
+    def _write_info(document: Document) -> None:
+        os.makedirs(document.store_dir, exist_ok=True)
+        with open(os.path.join(document.store_dir, DOCUMENT_FILE), 'w') as f:
+            json.dump({'name': document.name, 'created': document.created}, f)
+
+    def _register(self, document: Document, processor: PDFProcessorCohere) -> None:
+        with self.lock:
+            self._attach(document, processor)
+            self.documents[document.document_id] = document
+            self._enforce_limits(keep=document.document_id)
+
+    def get_processor(self, document_id: str) -> PDFProcessorCohere:
+        """Return the document's processor, reloading it from disk if it was evicted"""
+        with self.lock:
+            document = self.documents.get(document_id)
+            if document is None:
+                raise KeyError(f"Unknown document: {document_id}")
+            document.last_used = time.time()
+            self.documents.move_to_end(document_id)
+            if document.processor is not None:
+                return document.processor
+
+        with self._document_lock(document_id):
+            processor = document.processor
+            if processor is None:
+                processor = self.processor_factory()
+                processor.load_results(document.store_dir)
+                with self.lock:
+                    self._attach(document, processor)
+                    self._enforce_limits(keep=document_id)
+            return processor
+
+    def _attach(self, document: Document, processor: PDFProcessorCohere) -> None:
+        document.processor = processor
+        document.memory_bytes = processor.memory_usage()
+        document.last_used = time.time()
+
+    def _evict(self, document: Document) -> bool:
+        # Only drop documents whose results are safely on disk
+        if document.processor is None or not os.path.exists(os.path.join(document.store_dir, MANIFEST_FILE)):
+            return False
+        document.processor = None
+        document.memory_bytes = 0
+        logger.info(f"Evicted document {document.document_id} ({document.name}) from memory")
+        return True
+
+    def _enforce_limits(self, keep: Optional[str] = None) -> None:
+        """Evict idle documents, then least recently used ones until under the memory budget"""
+        now = time.time()
+        for document in list(self.documents.values()):
+            if document.document_id != keep and now - document.last_used > self.idle_timeout:
+                self._evict(document)
+        total = self.memory_usage()
+        for document in list(self.documents.values()):
+            if total <= self.max_memory_bytes:
+                break
+            memory_bytes = document.memory_bytes
+            if document.document_id != keep and self._evict(document):
+                total -= memory_bytes
+
+    def evict_idle(self) -> None:
+        """Drop processors of documents idle longer than idle_timeout"""
+        with self.lock:
+            self._enforce_limits()
+
+    def _processors(self, document_ids: Optional[List[str]]) -> Dict[str, PDFProcessorCohere]:
+        if document_ids is None:
+            with self.lock:
+                document_ids = list(self.documents)
+        if not document_ids:
+            raise KeyError("No documents to search")
+        return {document_id: self.get_processor(document_id) for document_id in document_ids}
+
+    def search(self, query: str, document_ids: Optional[List[str]] = None, top_k: int = 5,
+               use_rerank: bool = False, candidate_k: int = 30) -> Dict[str, Any]:
+        """
+        Search one or many documents and merge their top-k results
+        document_ids: documents to search, or None for every registered document
+        Each result carries the document_id it came from. Raises KeyError for unknown IDs.
+        """
+        return self._search(self._processors(document_ids), query, top_k, use_rerank, candidate_k)
+
+    async def asearch(self, query: str, document_ids: Optional[List[str]] = None, top_k: int = 5,
+                      use_rerank: bool = False, candidate_k: int = 30) -> Dict[str, Any]:
+        """
+        Async variant of search
+        Loading documents and the local index searches run in worker threads; Bedrock
+        calls use the processors' async clients.
+        """
+        processors = await asyncio.to_thread(self._processors, document_ids)
+        return await self._asearch(processors, query, top_k, use_rerank, candidate_k)
+
+    def _search(self, processors: Dict[str, PDFProcessorCohere], query: str, top_k: int = 5,
+                use_rerank: bool = False, candidate_k: int = 30) -> Dict[str, Any]:
+        first = next(iter(processors.values()))
+
+        # Embed the query once for every document and both retrievals
+        try:
+            query_embedding = first.embed_query(query)
+        except ThrottlingRetriesExhausted:
+            raise
+        except Exception as e:
+            logger.error(f"Error embedding search query: {str(e)}")
+            return self._no_results(use_rerank)
+
+        embed_results, candidates = self._retrieve(processors, query, top_k, use_rerank, candidate_k,
+                                                   query_embedding)
+        rerank_results = None
+        if use_rerank:
+            try:
+                rerank_results = first.rerank_items(query, candidates, top_k, version=self._version(processors))
+            except Exception as e:
+                logger.error(f"Error during rerank search: {str(e)}")
+                rerank_results = []
+
+        return {'embed_results': embed_results, 'rerank_results': rerank_results}
+
+    async def _asearch(self, processors: Dict[str, PDFProcessorCohere], query: str, top_k: int = 5,
+                       use_rerank: bool = False, candidate_k: int = 30) -> Dict[str, Any]:
+        first = next(iter(processors.values()))
+        try:
+            query_embedding = await first.aembed_query(query)
+        except ThrottlingRetriesExhausted:
+            raise
+        except Exception as e:
+            logger.error(f"Error embedding search query: {str(e)}")
+            return self._no_results(use_rerank)
+
+        embed_results, candidates = await asyncio.to_thread(self._retrieve, processors, query, top_k, use_rerank,
+                                                            candidate_k, query_embedding)
+        rerank_results = None
+        if use_rerank:
+            try:
+                rerank_results = await first.arerank_items(query, candidates, top_k,
+                                                           version=self._version(processors))
+            except Exception as e:
+                logger.error(f"Error during rerank search: {str(e)}")
+                rerank_results = []
+
+        return {'embed_results': embed_results, 'rerank_results': rerank_results}
+
+    @staticmethod
+    def _no_results(use_rerank: bool) -> Dict[str, Any]:
+        return {'embed_results': [], 'rerank_results': [] if use_rerank else None}
+
+    @staticmethod
+    def _version(processors: Dict[str, PDFProcessorCohere]) -> str:
+        """Content version of the searched documents; cached rerank results are reused only while it holds"""
+        return ','.join(f"{document_id}:{processor.version}" for document_id, processor in sorted(processors.items()))
+
+    def _retrieve(self, processors: Dict[str, PDFProcessorCohere], query: str, top_k: int, use_rerank: bool,
+                  candidate_k: int, query_embedding) -> Tuple[List[Dict[str, Any]], Optional[List[Dict[str, Any]]]]:
+        """Merged top_k embedding results, and the rerank candidates if use_rerank"""
+        first = next(iter(processors.values()))
+        embed_results = heapq.nlargest(
+            top_k,
+            self._gather(processors, query, top_k, None, query_embedding),
+            key=lambda item: item['similarity_score'])
+
+        candidates = None
+        if use_rerank:
+            candidates = heapq.nlargest(
+                candidate_k,
+                self._gather(processors, query, candidate_k, 'text', query_embedding),
+                key=lambda item: item['similarity_score'])
+            if first.hybrid_search:
+                # BM25 scores depend on each document's term statistics, so documents are merged by rank
+                lexical = reciprocal_rank_fusion(self._lexical_rankings(processors, query, candidate_k),
+                                                 key=lambda item: (item['document_id'], item['chunk_id']),
+                                                 limit=candidate_k)
+                candidates = reciprocal_rank_fusion(
+                    [candidates, lexical], key=lambda item: (item['document_id'], item['chunk_id']),
+                    limit=candidate_k)
+        return embed_results, candidates
+
+    def _gather(self, processors: Dict[str, PDFProcessorCohere], query: str, k: int,
+                content_type: Optional[str], query_embedding) -> Iterator[Dict[str, Any]]:
+        for document_id, processor in processors.items():
+            for item in processor.search(query, k, content_type=content_type, query_embedding=query_embedding):
+                item['document_id'] = document_id
+                yield item
+
+    def _lexical_rankings(self, processors: Dict[str, PDFProcessorCohere], query: str,
+                          k: int) -> List[List[Dict[str, Any]]]:
+        """Each document's BM25 ranking"""
+        rankings = []
+        for document_id, processor in processors.items():
+            ranking = processor.lexical_search(query, k)
+            for item in ranking:
+                item['document_id'] = document_id
+            rankings.append(ranking)
+        return rankings
+
+    def chat(self, query: str, document_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Answer a question from the reranked context of one or many documents"""
+        processors = self._processors(document_ids)
+        results = self._search(processors, query, use_rerank=True)
+        processor = next(iter(processors.values()))
+        return processor.chat_query(query, context_results=results['rerank_results'],
+                                    embed_results=results['embed_results'])
+
+    async def achat(self, query: str, document_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Async variant of chat"""
+        processors = await asyncio.to_thread(self._processors, document_ids)
+        results = await self._asearch(processors, query, use_rerank=True)
+        processor = next(iter(processors.values()))
+        return await processor.achat_query(query, context_results=results['rerank_results'],
+                                           embed_results=results['embed_results'])
+
+    def chat_stream(self, query: str, document_ids: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
+        """Streaming variant of chat; see PDFProcessorCohere.chat_query_stream for the events"""
+        try:
+            processors = self._processors(document_ids)
+            results = self._search(processors, query, use_rerank=True)
+        except Exception as e:
+            logger.error(f"Error during streaming chat query: {str(e)}")
+            yield {'event': 'error', 'error': f"Error processing query: {str(e)}"}
+            return
+        processor = next(iter(processors.values()))
+        yield from processor.chat_query_stream(query, context_results=results['rerank_results'],
+                                               embed_results=results['embed_results'])
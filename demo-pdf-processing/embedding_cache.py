@@ -0,0 +1,286 @@
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SQLITE_MAX_PARAMETERS = 500  # Keys per IN (...) lookup; older SQLite builds allow 999 parameters
+
+
+def embedding_cache_key(model_id: str, input_type: str, embedding_type: str,
+                        kind: str, data: str) -> str:
+    """Content address for one embedding input: model, input type, embedding type and payload"""
+    digest = hashlib.sha256()
+    for part in (model_id, input_type, embedding_type, kind):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    digest.update(data.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache
+    An in-memory LRU sits in front of a SQLite file. Both tiers are bounded by size
+    in bytes and evict least recently used entries first.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_memory_bytes: int = 256 * 1024 * 1024,
+                 max_disk_bytes: int = 2 * 1024 * 1024 * 1024):
+        """
+        path: SQLite file for the disk tier, or None for a memory-only cache
+        max_memory_bytes: size limit for vectors held in memory
+        max_disk_bytes: size limit for vectors stored on disk
+        """
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, "
+                "size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+            self._disk_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Return the cached vector for key, or None on a miss"""
+        with self.lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return vector
+
+            if self._db is not None:
+                row = self._db.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._db.execute("UPDATE embeddings SET last_used = ? WHERE key = ?", (time.time(), key))
+                    vector = np.frombuffer(row[0], dtype=np.float32)
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+                    return vector
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, vector) -> np.ndarray:
+        """Store a vector in both tiers and return it as a read-only float32 array"""
+        return self.put_many([(key, vector)])[0]
+
+    def put_many(self, items: Iterable[Tuple[str, Any]]) -> List[np.ndarray]:
+        """
+        Store (key, vector) pairs in both tiers and return the vectors as read-only float32 arrays
+        The disk tier is written in one transaction, so a batch costs one commit rather than one per vector.
+        """
+        entries = []
+        for key, vector in items:
+            vector = np.array(vector, dtype=np.float32)
+            vector.setflags(write=False)
+            entries.append((key, vector))
+        with self.lock:
+            for key, vector in entries:
+                self._remember(key, vector)
+            if self._db is not None and entries:
+                now = time.time()
+                rows = {key: (key, vector.tobytes(), vector.nbytes, now) for key, vector in entries}
+                keys = list(rows)
+                self._db.execute("BEGIN")
+                try:
+                    previous = 0
+                    for start in range(0, len(keys), SQLITE_MAX_PARAMETERS):
+                        batch = keys[start:start + SQLITE_MAX_PARAMETERS]
+                        previous += self._db.execute(
+                            f"SELECT COALESCE(SUM(size), 0) FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                            batch).fetchone()[0]
+                    self._db.executemany("INSERT OR REPLACE INTO embeddings (key, vector, size, last_used) "
+                                         "VALUES (?, ?, ?, ?)", rows.values())
+                    self._db.execute("COMMIT")
+                except BaseException:
+                    self._db.execute("ROLLBACK")
+                    raise
+                self._disk_bytes += sum(row[2] for row in rows.values()) - previous
+                if self._disk_bytes > self.max_disk_bytes:
+                    self._evict_disk()
+        return [vector for _, vector in entries]
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= previous.nbytes
+        self._memory[key] = vector
+        self._memory_bytes += vector.nbytes
+        while self._memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.nbytes
+
+    def _evict_disk(self) -> None:
+        """Delete least recently used rows until the disk tier is 10% under its limit"""
+        target = int(self.max_disk_bytes * 0.9)
+        while self._disk_bytes > target:
+            rows = self._db.execute("SELECT key, size FROM embeddings ORDER BY last_used LIMIT 256").fetchall()
+            if not rows:
+                break
+            self._db.executemany("DELETE FROM embeddings WHERE key = ?", [(key,) for key, _ in rows])
+            self._disk_bytes -= sum(size for _, size in rows)
+            self.evictions += len(rows)
+        logger.info(f"Embedding cache evicted entries, disk tier now {self._disk_bytes} bytes")
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters and tier sizes"""
+        with self.lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                'hits': hits,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'memory_items': len(self._memory),
+                'memory_bytes': self._memory_bytes,
+                'disk_bytes': self._disk_bytes
+            }
+
+    def close(self) -> None:
+        with self.lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class TTLCache:
+    """Small thread-safe LRU cache whose entries expire after ttl seconds"""
+
+    def __init__(self, max_items: int = 1024, ttl: float = 600):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self._items.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._items.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._items[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value) -> None:
+        with self.lock:
+            self._items.pop(key, None)
+            self._items[key] = (time.monotonic() + self.ttl, value)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self._items.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'items': len(self._items)
+            }
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one
+    The first caller runs fn; callers arriving while it runs wait for it and receive
+    the same result, or the same exception. ado does the same for coroutines running
+    on one event loop.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._calls = {}  # key -> [done event, result, exception]
+        self._tasks = {}  # key -> task running the coroutine
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Return (fn's result, whether it came from another caller's call)"""
+        with self.lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = [threading.Event(), None, None]
+                self.calls += 1
+                leader = True
+            else:
+                self.shared += 1
+                leader = False
+
+        if not leader:
+            call[0].wait()
+            if call[2] is not None:
+                raise call[2]
+            return call[1], True
+
+        try:
+            call[1] = fn()
+        except Exception as e:
+            call[2] = e
+            raise
+        finally:
+            with self.lock:
+                del self._calls[key]
+            call[0].set()
+        return call[1], False
+
+    async def ado(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Async variant of do; fn returns the coroutine to await"""
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            task = self._tasks.get(key)
+            leader = task is None or task.get_loop() is not loop
+            if leader:
+                task = self._tasks[key] = loop.create_task(fn())
+                task.add_done_callback(lambda done: self._forget(key, done))
+                self.calls += 1
+            else:
+                self.shared += 1
+        # Shielded, so a cancelled caller does not cancel the call the others wait for
+        return await asyncio.shield(task), not leader
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        with self.lock:
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {'calls': self.calls, 'shared': self.shared, 'in_flight': len(self._calls) + len(self._tasks)}
@@ -0,0 +1,136 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from corpus import CorpusRegistry
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionJob:
+    """Progress of one background PDF ingestion or revision"""
+
+    def __init__(self, document_id: str, name: str, pdf_path: str, revise: bool = False):
+        self.job_id = uuid.uuid4().hex
+        self.document_id = document_id
+        self.name = name
+        self.pdf_path = pdf_path
+        self.revise = revise
+        self.report = None
+        self.status = 'queued'
+        self.error = None
+        self.pages_done = 0
+        self.total_pages = None
+        self.items_embedded = 0
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+
+    def update(self, pages_done: int, total_pages: int, items_embedded: int) -> None:
+        self.pages_done = pages_done
+        self.total_pages = total_pages
+        self.items_embedded = items_embedded
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.finished or time.time()
+        elapsed = end - self.started if self.started else 0.0
+        eta = None
+        if self.status == 'running' and self.pages_done and self.total_pages:
+            eta = elapsed / self.pages_done * (self.total_pages - self.pages_done)
+        return {
+            'job_id': self.job_id,
+            'document_id': self.document_id,
+            'name': self.name,
+            'revise': self.revise,
+            'status': self.status,
+            'error': self.error,
+            'pages_done': self.pages_done,
+            'total_pages': self.total_pages,
+            'items_embedded': self.items_embedded,
+            'elapsed_seconds': elapsed,
+            'items_per_second': self.items_embedded / elapsed if elapsed else 0.0,
+            'pages_per_second': self.pages_done / elapsed if elapsed else 0.0,
+            'eta_seconds': eta,
+            'report': self.report
+        }
+
+
+class JobManager:
+    """
+    Runs PDF ingestion in a background worker pool
+    Jobs are queued when all workers are busy. Submitting a document that already has
+    an active job returns that job instead of queueing a duplicate.
+    """
+
+    def __init__(self, registry: CorpusRegistry, max_workers: int = 1, max_finished_jobs: int = 100):
+        self.registry = registry
+        self.max_finished_jobs = max_finished_jobs
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ingestion')
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, document_id: str, name: str, pdf_path: str, revise: bool = False) -> IngestionJob:
+        """
+        Queue a PDF for ingestion; the file is deleted once the job finishes
+        revise: pdf_path is a revised version of the registered document_id; only its
+        changed pages are processed. Revisions of the same document run one at a time.
+        """
+        with self.lock:
+            for job in self.jobs.values():
+                if job.status not in ('queued', 'running') or job.document_id != document_id \
+                        or job.revise != revise:
+                    continue
+                if revise and job.pdf_path != pdf_path:
+                    # A different revision, queued behind this one
+                    continue
+                if os.path.exists(pdf_path) and pdf_path != job.pdf_path:
+                    os.remove(pdf_path)
+                return job
+            job = IngestionJob(document_id, name, pdf_path, revise=revise)
+            self.jobs[job.job_id] = job
+            self._prune()
+        self.executor.submit(self._run, job)
+        logger.info(f"Queued ingestion job {job.job_id} for {name}")
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def _prune(self) -> None:
+        finished = [job_id for job_id, job in self.jobs.items() if job.status in ('done', 'failed')]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self.jobs[job_id]
+
+    def _run(self, job: IngestionJob) -> None:
+        job.status = 'running'
+        job.started = time.time()
+        try:
+            if job.revise:
+                job.report = self.registry.revise(job.document_id, job.name, job.pdf_path,
+                                                  progress_callback=job.update)
+                job.items_embedded = job.report['items_embedded']
+            else:
+                processor = self.registry.add(job.document_id, job.name, job.pdf_path,
+                                              progress_callback=job.update)
+                if job.total_pages is None:
+                    # Loaded from saved results, so nothing was processed
+                    job.items_embedded = len(processor.content_sequence)
+            job.status = 'done'
+            logger.info(f"Ingestion job {job.job_id} finished for {job.name}")
+        except Exception as e:
+            job.status = 'failed'
+            job.error = str(e)
+            logger.error(f"Ingestion job {job.job_id} failed for {job.name}: {str(e)}")
+        finally:
+            job.finished = time.time()
+            if os.path.exists(job.pdf_path):
+                os.remove(job.pdf_path)
+
+    def shutdown(self, wait: bool = True) -> None:
+        self.executor.shutdown(wait=wait)
@@ -0,0 +1,131 @@
+import logging
+import os
+import shutil
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from corpus import CorpusRegistry
+from uploads import UploadManager
+
+logger = logging.getLogger(__name__)
+
+
+def folder_usage(path: str) -> Dict[str, int]:
+    """Number of files and total bytes under path"""
+    files = 0
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, filename))
+                files += 1
+            except OSError:
+                continue
+    return {'files': files, 'bytes': total}
+
+
+class Janitor:
+    """
+    Background housekeeping, off the request path
+    Every interval seconds it expires upload sessions from the in-memory session index
+    (no directory listing), evicts idle documents and refreshes the disk usage snapshot
+    that stats reports. Files left behind by an earlier process are removed once at startup.
+    """
+
+    def __init__(self, uploads: UploadManager, registry: CorpusRegistry, folders: Dict[str, str],
+                 interval: float = 60, orphan_age: float = 3600):
+        """
+        folders: directories to report disk usage for, by name
+        orphan_age: files older than this in the upload folders are removed at startup
+        """
+        self.uploads = uploads
+        self.registry = registry
+        self.folders = folders
+        self.interval = interval
+        self.orphan_age = orphan_age
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.runs = 0
+        self.expired_uploads = 0
+        self.orphans_removed = 0
+        self.last_run = None
+        self.last_duration = 0.0
+        self.disk_usage = {}
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name='janitor', daemon=True)
+        self._thread.start()
+        logger.info(f"Janitor started, running every {self.interval} seconds")
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _loop(self) -> None:
+        self.remove_orphans(self.folders.get('temp'), self.folders.get('uploads'))
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Error during janitor run: {str(e)}")
+            if self._stop.wait(self.interval):
+                break
+
+    def remove_orphans(self, *folders: Optional[str]) -> int:
+        """Delete files older than orphan_age that no live upload session owns"""
+        cutoff = time.time() - self.orphan_age
+        live = set(self.uploads.paths())
+        removed = 0
+        for folder in folders:
+            if not folder or not os.path.isdir(folder):
+                continue
+            for entry in os.scandir(folder):
+                try:
+                    if entry.is_file() and entry.path not in live and entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                        removed += 1
+                except OSError as e:
+                    logger.error(f"Error removing orphaned file {entry.path}: {str(e)}")
+        with self.lock:
+            self.orphans_removed += removed
+        if removed:
+            logger.info(f"Janitor removed {removed} orphaned files")
+        return removed
+
+    def run_once(self) -> None:
+        start = time.time()
+        expired = self.uploads.expire(start)
+        self.registry.evict_idle()
+        disk_usage = {name: folder_usage(path) for name, path in self.folders.items()}
+        with self.lock:
+            self.runs += 1
+            self.expired_uploads += expired
+            self.disk_usage = disk_usage
+            self.last_run = start
+            self.last_duration = time.time() - start
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters from recent runs and the last disk usage snapshot"""
+        with self.lock:
+            stats = {
+                'runs': self.runs,
+                'last_run': self.last_run,
+                'last_duration_seconds': self.last_duration,
+                'expired_uploads': self.expired_uploads,
+                'orphans_removed': self.orphans_removed,
+                'active_uploads': len(self.uploads),
+                'folders': dict(self.disk_usage)
+            }
+        try:
+            usage = shutil.disk_usage(next(iter(self.folders.values()), '.'))
+            stats['disk_total_bytes'] = usage.total
+            stats['disk_free_bytes'] = usage.free
+        except OSError:
+            pass
+        return stats
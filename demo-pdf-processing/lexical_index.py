@@ -0,0 +1,224 @@
+import math
+import os
+import re
+import threading
+from array import array
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+LEXICAL_FILE = 'lexical_index.npz'
+
+# Words plus identifiers that keep their inner punctuation: "4.2(b)" -> "4.2", "b"; "PN-4471-X" -> "pn-4471-x"
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.\-/_:][a-z0-9]+)*")
+TOKEN_SEPARATORS = re.compile(r"[.\-/_:]")
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60  # Reciprocal rank fusion constant; larger values flatten the gap between ranks
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased word and identifier tokens
+    Compound identifiers are also indexed by their parts, so "4471" finds "PN-4471-X".
+    """
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        if TOKEN_SEPARATORS.search(token):
+            tokens.extend(part for part in TOKEN_SEPARATORS.split(token) if part)
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[Dict[str, Any]]], key: Callable[[Dict[str, Any]], Hashable],
+                           limit: Optional[int] = None, k: int = RRF_K) -> List[Dict[str, Any]]:
+    """
+    Fuse ranked lists of result dicts by summing 1 / (k + rank) over the lists each result appears in
+    key: identifies the same result across lists
+    Returns up to limit merged copies, best first, with a fusion_score; a result found by
+    several lists keeps the scores each of them set.
+    """
+    scores = {}
+    merged = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, 1):
+            item_key = key(item)
+            scores[item_key] = scores.get(item_key, 0.0) + 1.0 / (k + rank)
+            if item_key in merged:
+                merged[item_key].update(item)
+            else:
+                merged[item_key] = dict(item)
+    ranked = sorted(scores, key=scores.get, reverse=True)[:limit]
+    results = []
+    for item_key in ranked:
+        item = merged[item_key]
+        item['fusion_score'] = scores[item_key]
+        results.append(item)
+    return results
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index over text chunks
+    Each term's postings are two typed arrays (row number as int32, term frequency as
+    uint16), about 6 bytes per posting, appended to as chunks are added. Rows map to
+    item ids like VectorIndex rows; removed rows are skipped and dropped on save.
+    """
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}  # term -> (array('i') rows, array('H') frequencies)
+        self.lengths = array('I')  # Tokens per row
+        self.ids = array('q')  # Item id per row
+        self.live = bytearray()
+        self.removed = 0
+        self.total_length = 0
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.ids) - self.removed
+
+    def add(self, ids: Sequence[int], texts: Sequence[str]) -> None:
+        """Index texts under their item ids"""
+        with self.lock:
+            for item_id, text in zip(ids, texts):
+                row = len(self.ids)
+                tokens = tokenize(text)
+                counts = {}
+                for token in tokens:
+                    counts[token] = counts.get(token, 0) + 1
+                for token, count in counts.items():
+                    postings = self.postings.get(token)
+                    if postings is None:
+                        postings = self.postings[token] = (array('i'), array('H'))
+                    postings[0].append(row)
+                    postings[1].append(min(count, 65535))
+                self.lengths.append(len(tokens))
+                self.total_length += len(tokens)
+                self.live.append(1)
+                # Published last, so a concurrent search never sees a row without its length
+                self.ids.append(item_id)
+
+    def remove(self, ids: Sequence[int]) -> int:
+        """Remove the rows with these item ids; returns how many were removed"""
+        ids = set(ids)
+        removed = 0
+        with self.lock:
+            for row, item_id in enumerate(self.ids):
+                if item_id in ids and self.live[row]:
+                    self.live[row] = 0
+                    self.total_length -= self.lengths[row]
+                    removed += 1
+            self.removed += removed
+        return removed
+
+    def search(self, query: str, top_k: int = 5,
+               allowed: Optional[Callable[[int], bool]] = None) -> List[Tuple[float, int]]:
+        """
+        Return up to top_k (BM25 score, id) pairs, best first
+        allowed: optional predicate on item ids, applied to rows that matched
+        """
+        terms = set(tokenize(query))
+        # numpy views of the arrays block add() from resizing them, so every view is
+        # dropped or copied before the lock is released
+        with self.lock:
+            size = len(self.ids)
+            live_rows = size - self.removed
+            if not terms or live_rows == 0 or top_k <= 0:
+                return []
+            average_length = self.total_length / live_rows
+            matched = [(term, self.postings[term]) for term in terms if term in self.postings]
+            lengths = np.frombuffer(self.lengths, dtype=np.uint32, count=size).astype(np.float32)
+            scores = np.zeros(size, dtype=np.float32)
+            for term, (term_rows, term_frequencies) in matched:
+                self._score_term(scores, lengths, live_rows, average_length, term_rows, term_frequencies)
+            if self.removed:
+                scores[np.frombuffer(self.live, dtype=np.uint8, count=size) == 0] = 0
+            rows = np.flatnonzero(scores > 0)
+            rows = rows[np.argsort(-scores[rows], kind='stable')]
+            # Fancy indexing copies, so only the matched rows' ids are read
+            ids = np.frombuffer(self.ids, dtype=np.int64, count=size)[rows]
+
+        results = []
+        for row, item_id in zip(rows.tolist(), ids.tolist()):
+            if allowed is None or allowed(item_id):
+                results.append((float(scores[row]), item_id))
+                if len(results) == top_k:
+                    break
+        return results
+
+    def _score_term(self, scores: np.ndarray, lengths: np.ndarray, live_rows: int, average_length: float,
+                    rows: array, frequencies: array) -> None:
+        """Add one term's BM25 contribution to scores; the views of its postings end with the call"""
+        rows = np.frombuffer(rows, dtype=np.int32)
+        frequencies = np.frombuffer(frequencies, dtype=np.uint16).astype(np.float32)
+        idf = math.log(1 + (live_rows - len(rows) + 0.5) / (len(rows) + 0.5))
+        norm = self.k1 * (1 - self.b + self.b * lengths[rows] / max(average_length, 1e-9))
+        scores[rows] += idf * frequencies * (self.k1 + 1) / (frequencies + norm)
+
+    def memory_bytes(self) -> int:
+        """Bytes held by postings and per-row arrays, not counting the term strings"""
+        total = len(self.lengths) * 4 + len(self.ids) * 8 + len(self.live)
+        for rows, frequencies in self.postings.values():
+            total += len(rows) * 4 + len(frequencies) * 2
+        return total
+
+    def save(self, output_dir: str) -> None:
+        """Write the index as one .npz of concatenated postings, leaving out removed rows"""
+        with self.lock:
+            live = np.frombuffer(self.live, dtype=np.uint8).astype(bool)
+            # Removed rows are dropped, so live rows are renumbered
+            new_rows = np.cumsum(live, dtype=np.int64) - 1
+            terms, offsets, all_rows, all_frequencies = [], [0], [], []
+            for term, (rows, frequencies) in self.postings.items():
+                # Copies, so no view of the postings outlives the lock
+                rows = np.array(rows, dtype=np.int32)
+                frequencies = np.array(frequencies, dtype=np.uint16)
+                keep = live[rows]
+                if not keep.any():
+                    continue
+                terms.append(term)
+                all_rows.append(new_rows[rows[keep]].astype(np.int32))
+                all_frequencies.append(frequencies[keep])
+                offsets.append(offsets[-1] + int(keep.sum()))
+            # Boolean indexing copies, and the temporary views are released right away
+            lengths = np.frombuffer(self.lengths, dtype=np.uint32)[live]
+            ids = np.frombuffer(self.ids, dtype=np.int64)[live]
+
+        os.makedirs(output_dir, exist_ok=True)
+        path = os.path.join(output_dir, LEXICAL_FILE)
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, terms=np.array(terms, dtype=str), offsets=np.array(offsets, dtype=np.int64),
+                     rows=np.concatenate(all_rows) if all_rows else np.empty(0, dtype=np.int32),
+                     frequencies=np.concatenate(all_frequencies) if all_frequencies else np.empty(0, dtype=np.uint16),
+                     lengths=lengths, ids=ids)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, input_dir: str, k1: float = BM25_K1, b: float = BM25_B) -> 'LexicalIndex':
+        """Load an index written by save; raises FileNotFoundError if there is none"""
+        with np.load(os.path.join(input_dir, LEXICAL_FILE)) as data:
+            terms, offsets = data['terms'], data['offsets']
+            rows, frequencies = data['rows'], data['frequencies']
+            lengths, ids = data['lengths'], data['ids']
+
+        index = cls(k1=k1, b=b)
+        for position, term in enumerate(terms.tolist()):
+            start, end = offsets[position], offsets[position + 1]
+            index.postings[term] = (array('i', rows[start:end].tobytes()),
+                                    array('H', frequencies[start:end].tobytes()))
+        index.lengths = array('I', lengths.astype(np.uint32).tobytes())
+        index.ids = array('q', ids.astype(np.int64).tobytes())
+        index.live = bytearray(b'\x01' * len(ids))
+        index.total_length = int(lengths.sum())
+        return index
+
+    @classmethod
+    def from_items(cls, items: Iterable[Tuple[int, Dict[str, Any]]]) -> 'LexicalIndex':
+        """Build an index over the text items of (id, item) pairs"""
+        index = cls()
+        pairs = [(item_id, item['content']) for item_id, item in items if item.get('type') == 'text']
+        index.add([item_id for item_id, _ in pairs], [text for _, text in pairs])
+        return index
@@ -0,0 +1,269 @@
+"""
+In-process counters and histograms with Prometheus text exposition, plus optional
+per-request trace spans
+Metrics live in the process-wide REGISTRY and are served by GET /metrics. stage()
+times a block into STAGE_SECONDS and, while a trace() is active in the calling
+context, also records it as a span of that trace. Work handed to thread pools keeps
+the caller's trace when submitted through propagate().
+"""
+import bisect
+import contextvars
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Seconds; from a cached lookup to a long chat answer
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(labels: Sequence[Tuple[str, str]]) -> str:
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """Monotonic totals per label combination"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}  # label values -> total
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def get(self, **labels) -> float:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self.lock:
+            return self.values.get(key, 0.0)
+
+    def samples(self) -> Iterator[Tuple[str, List[Tuple[str, str]], float]]:
+        with self.lock:
+            values = dict(self.values)
+        for key, value in sorted(values.items()):
+            yield self.name, list(zip(self.labelnames, key)), value
+
+
+class Histogram:
+    """Observations counted into cumulative buckets per label combination, with their sum"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.values = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[slot] += 1
+            counts[-1] += value
+
+    def summary(self, **labels) -> Dict[str, float]:
+        """Count, sum and mean of one label combination"""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                return {'count': 0, 'sum': 0.0, 'mean': 0.0}
+            count = sum(counts[:-1])
+            return {'count': count, 'sum': counts[-1], 'mean': counts[-1] / count if count else 0.0}
+
+    def samples(self) -> Iterator[Tuple[str, List[Tuple[str, str]], float]]:
+        with self.lock:
+            values = {key: list(counts) for key, counts in self.values.items()}
+        for key, counts in sorted(values.items()):
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts[:-1]):
+                cumulative += count
+                yield f"{self.name}_bucket", labels + [('le', _format_value(bound))], cumulative
+            yield f"{self.name}_sum", labels, counts[-1]
+            yield f"{self.name}_count", labels, cumulative
+
+
+class Gauge:
+    """
+    Current values read from a callback when metrics are collected
+    fn returns a number, or a dict of label-value tuples (in labelnames order) to numbers
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, fn: Callable[[], Any], labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+
+    def samples(self) -> Iterator[Tuple[str, List[Tuple[str, str]], float]]:
+        values = self.fn()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for key, value in sorted(values.items()):
+            if value is not None:
+                yield self.name, list(zip(self.labelnames, key)), value
+
+
+class CallbackCounter(Gauge):
+    """
+    Totals kept elsewhere, read from a callback when metrics are collected
+    fn returns values the way Gauge's does; they must only increase, so rate() applies
+    """
+
+    kind = 'counter'
+
+
+class MetricsRegistry:
+    """Named metrics, created once and rendered together"""
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _register(self, metric):
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                if existing.kind != metric.kind:
+                    raise ValueError(f"Metric {metric.name} is already registered as a {existing.kind}")
+                return existing
+            self.metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, fn: Callable[[], Any], labelnames: Sequence[str] = ()) -> Gauge:
+        """Register a callback gauge; registering a name again replaces the callback"""
+        with self.lock:
+            gauge = self.metrics[name] = Gauge(name, help, fn, labelnames)
+            return gauge
+
+    def callback_counter(self, name: str, help: str, fn: Callable[[], Any],
+                         labelnames: Sequence[str] = ()) -> CallbackCounter:
+        """Register a callback counter; registering a name again replaces the callback"""
+        with self.lock:
+            counter = self.metrics[name] = CallbackCounter(name, help, fn, labelnames)
+            return counter
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text exposition format"""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'pdf_stage_seconds', 'Time spent in each ingestion and query stage', ('stage',))
+BEDROCK_CALL_SECONDS = REGISTRY.histogram(
+    'bedrock_call_seconds', 'Bedrock call latency per attempt, excluding rate limiter waits', ('budget', 'outcome'))
+BEDROCK_BYTES = REGISTRY.counter(
+    'bedrock_bytes_total', 'Request and response payload bytes exchanged with Bedrock', ('model', 'direction'))
+BEDROCK_TOKENS = REGISTRY.counter(
+    'bedrock_tokens_total', 'Approximate tokens sent to and generated by Bedrock models', ('model', 'direction'))
+BEDROCK_INPUTS = REGISTRY.counter(
+    'bedrock_inputs_total', 'Texts, images and rerank documents sent to Bedrock', ('model', 'kind'))
+RATE_LIMIT_WAIT_SECONDS = REGISTRY.histogram(
+    'rate_limit_wait_seconds', 'Time calls waited for a rate limiter token', ('budget',))
+RATE_LIMIT_BACKOFF_SECONDS = REGISTRY.counter(
+    'rate_limit_backoff_seconds_total', 'Time spent backing off after throttling', ('budget',))
+THROTTLES = REGISTRY.counter('bedrock_throttles_total', 'Throttling errors returned by Bedrock', ('budget',))
+
+
+class Trace:
+    """Spans recorded for one request, as offsets from the start of the trace"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = []
+        self.lock = threading.Lock()
+
+    def add(self, name: str, start: float, seconds: float, attributes: Dict[str, Any]) -> None:
+        with self.lock:
+            self.spans.append((start, name, seconds, threading.current_thread().name, attributes))
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            spans = sorted(self.spans, key=lambda span: span[0])
+        return [dict(attributes, name=name, thread=thread,
+                     start_ms=round((start - self.started) * 1000, 3), duration_ms=round(seconds * 1000, 3))
+                for start, name, seconds, thread, attributes in spans]
+
+
+_current_trace = contextvars.ContextVar('trace', default=None)
+
+
+@contextmanager
+def trace() -> Iterator[Trace]:
+    """Collect the spans of stages run in this context until the block exits"""
+    current = Trace()
+    token = _current_trace.set(current)
+    try:
+        yield current
+    finally:
+        _current_trace.reset(token)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def stage(name: str, **attributes) -> Iterator[Dict[str, Any]]:
+    """
+    Time a block into STAGE_SECONDS and the active trace
+    Yields the span's attributes, so the block can add details such as item counts.
+    """
+    start = time.perf_counter()
+    try:
+        yield attributes
+    finally:
+        seconds = time.perf_counter() - start
+        STAGE_SECONDS.observe(seconds, stage=name)
+        current = _current_trace.get()
+        if current is not None:
+            current.add(name, start, seconds, attributes)
+
+
+def propagate(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """fn bound to a copy of the caller's context, so spans it records join the caller's trace"""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
@@ -0,0 +1,244 @@
+"""
+PyMuPDF extraction stage
+Runs in worker processes, so it only depends on fitz and returns plain picklable
+page records. Embedding happens separately in the parent process.
+"""
+import hashlib
+import io
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+import fitz
+from PIL import Image
+
+from chunking import Chunker
+
+logger = logging.getLogger(__name__)
+
+MIN_IMAGE_SIDE = 32  # Images narrower or shorter than this (icons, bullets, rules) are skipped
+MIN_IMAGE_ENTROPY = 1.0  # Bits; blank and near-solid images fall below this
+RENDER_MIN_DRAWINGS = 3  # Lines, curves and rectangles a page needs before it is rendered; a lone rule is not enough
+# Opt-in: images whose perceptual hashes differ in at most this many bits are duplicates. Off by
+# default, since charts or tables sharing a template can hash within a few bits of each other
+PHASH_MAX_DISTANCE = None
+
+
+def page_fingerprint(doc, page_num: int) -> str:
+    """
+    Content hash of one page: its size, text and the raw stream of every image it shows
+    Images are hashed by content rather than by xref number, which changes between revisions.
+    """
+    page = doc[page_num]
+    digest = hashlib.sha256()
+    digest.update(repr(tuple(page.rect)).encode('utf-8'))
+    digest.update(page.get_text().encode('utf-8'))
+    for img in page.get_images(full=True):
+        digest.update(b'\0')
+        digest.update(doc.xref_stream_raw(img[0]) or b'')
+    return digest.hexdigest()
+
+
+def page_fingerprints(pdf_path: str) -> List[str]:
+    """Fingerprints of every page, in page order"""
+    doc = fitz.open(pdf_path)
+    try:
+        return [page_fingerprint(doc, page_num) for page_num in range(len(doc))]
+    finally:
+        doc.close()
+
+
+def difference_hash(image: Image.Image) -> int:
+    """64-bit perceptual hash: whether each pixel of a 9x8 grayscale thumbnail is brighter than its right neighbour"""
+    pixels = list(image.convert('L').resize((9, 8)).getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return bits
+
+
+def image_signature(image_bytes: bytes) -> Optional[Dict[str, Any]]:
+    """
+    Entropy and perceptual hash of an image, from a small grayscale thumbnail
+    Returns None for formats PIL cannot decode; those images are kept as they are.
+    """
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            image.draft('L', (64, 64))  # Lets JPEG decode at reduced size
+            gray = image.convert('L')
+            gray.thumbnail((64, 64))
+            return {'entropy': gray.entropy(), 'phash': difference_hash(gray)}
+    except Exception:
+        return None
+
+
+class ImageDeduplicator:
+    """
+    Remembers the images kept so far in a document
+    An image is a duplicate if its bytes match a kept image, or, when max_distance is set,
+    if its perceptual hash is within max_distance bits of one (the same logo re-encoded or
+    slightly rescaled).
+    """
+
+    def __init__(self, max_distance: Optional[int] = PHASH_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self.digests = set()
+        self.phashes = []
+        self.duplicates = 0
+
+    def is_duplicate(self, image_bytes: bytes, phash: Optional[int] = None) -> bool:
+        """Check an image and remember it if it is new"""
+        digest = hashlib.sha256(image_bytes).digest()
+        duplicate = digest in self.digests or (
+            self.max_distance is not None and phash is not None
+            and any(bin(phash ^ kept).count('1') <= self.max_distance for kept in self.phashes))
+        if duplicate:
+            self.duplicates += 1
+            return True
+        self.digests.add(digest)
+        if self.max_distance is not None and phash is not None:
+            self.phashes.append(phash)
+        return False
+
+
+def has_drawings(page, minimum: int = RENDER_MIN_DRAWINGS) -> bool:
+    """Whether the page draws at least minimum vector path segments"""
+    return sum(len(path['items']) for path in page.get_cdrawings()) >= minimum
+
+
+def extract_page(doc, page_num: int, chunker: Chunker, seen_xrefs: Optional[Set[int]] = None,
+                 fingerprint: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Extract one page into a compact record
+    chunks: text chunks as dicts with text, bbox and tokens (see chunking.Chunker);
+    images: (index, format, bytes, perceptual hash or None) per embedded image worth embedding;
+    render: PNG bytes of the rendered page if it has vector drawings, else None;
+    skipped: images dropped here as repeated, too small or blank;
+    fingerprint: see page_fingerprint;
+    seconds: time spent extracting the page
+    seen_xrefs: image xrefs already extracted from this document; repeats are skipped and added to it
+    A fingerprint passed in, computed earlier by the caller, is used instead of hashing the page again.
+    """
+    started = time.perf_counter()
+    page = doc[page_num]
+    record = {
+        'page': page_num + 1,
+        'fingerprint': fingerprint or page_fingerprint(doc, page_num),
+        'bbox': tuple(page.bound()),
+        'chunks': [],
+        'images': [],
+        'render': None,
+        'skipped': {'repeated': 0, 'small': 0, 'blank': 0}
+    }
+    if seen_xrefs is None:
+        seen_xrefs = set()
+
+    # Chunk text by layout, keeping each chunk's coordinates
+    record['chunks'] = chunker.chunk_page(page)
+
+    # Enhanced image and vector graphic processing
+    try:
+        # Extract images using get_images()
+        images = page.get_images(full=True)
+        for img_index, img in enumerate(images):
+            xref, width, height = img[0], img[2], img[3]  # Image reference and pixel size
+            if xref in seen_xrefs:
+                # The same image object shown again, typically a logo or header
+                record['skipped']['repeated'] += 1
+                continue
+            seen_xrefs.add(xref)
+            if min(width, height) < MIN_IMAGE_SIDE:
+                record['skipped']['small'] += 1
+                continue
+
+            base_image = doc.extract_image(xref)
+            if not base_image or not base_image["image"]:
+                continue
+            signature = image_signature(base_image["image"])
+            if signature is not None and signature['entropy'] < MIN_IMAGE_ENTROPY:
+                record['skipped']['blank'] += 1
+                continue
+            record['images'].append((img_index, base_image["ext"].lower(), base_image["image"],
+                                     signature['phash'] if signature else None))
+
+        # Render the page only when it has vector graphics; text and images are embedded directly
+        if has_drawings(page):
+            pix = page.get_pixmap()
+            record['render'] = pix.tobytes() or None
+
+    except Exception as e:
+        logger.error(f"Error processing images on page {page_num + 1}: {str(e)}")
+
+    record['seconds'] = time.perf_counter() - started
+    return record
+
+
+def extract_pages(pdf_path: str, page_numbers: List[int], chunker: Chunker,
+                  fingerprints: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Worker entry point: open the PDF independently and extract the given 0-based pages
+    fingerprints: precomputed fingerprints of those pages, in the same order
+    """
+    doc = fitz.open(pdf_path)
+    seen_xrefs = set()
+    if fingerprints is None:
+        fingerprints = [None] * len(page_numbers)
+    try:
+        return [extract_page(doc, page_num, chunker, seen_xrefs, fingerprint)
+                for page_num, fingerprint in zip(page_numbers, fingerprints)]
+    finally:
+        doc.close()
+
+
+def page_count(pdf_path: str) -> int:
+    doc = fitz.open(pdf_path)
+    try:
+        return len(doc)
+    finally:
+        doc.close()
+
+
+def iter_page_records(pdf_path: str, chunker: Chunker, workers: int = 1, pages_per_shard: int = 16,
+                      page_numbers: Optional[List[int]] = None,
+                      fingerprints: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Yield page records in page order
+    With workers > 1, runs of pages_per_shard pages are sharded across a process
+    pool; shards are consumed in order as they complete, so the caller can embed
+    early pages while later ones are still being extracted. Repeated image xrefs are
+    only skipped within a shard; the caller deduplicates across shards by content.
+    page_numbers: sorted 0-based pages to extract, or None for every page
+    fingerprints: precomputed fingerprints of every page of the document, by 0-based page, so
+    the pages are not hashed again
+    """
+    if page_numbers is None:
+        page_numbers = list(range(page_count(pdf_path)))
+    if workers <= 1 or len(page_numbers) <= pages_per_shard:
+        doc = fitz.open(pdf_path)
+        seen_xrefs = set()
+        try:
+            for page_num in page_numbers:
+                yield extract_page(doc, page_num, chunker, seen_xrefs,
+                                   fingerprints[page_num] if fingerprints else None)
+        finally:
+            doc.close()
+        return
+
+    shards = [page_numbers[start:start + pages_per_shard]
+              for start in range(0, len(page_numbers), pages_per_shard)]
+    # spawn avoids forking a parent that is running embedding and web server threads
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=min(workers, len(shards)), mp_context=context) as executor:
+        futures = [executor.submit(extract_pages, pdf_path, shard, chunker,
+                                   [fingerprints[page_num] for page_num in shard] if fingerprints else None)
+                   for shard in shards]
+        try:
+            for future in futures:
+                yield from future.result()
+        finally:
+            # Drop shards that have not started if the consumer stops early
+            for future in futures:
+                future.cancel()
@@ -1,18 +1,29 @@
-from PyPDF2 import PdfReader
-from PIL import Image
-import io
 import base64
-import fitz
-import cohere
+import asyncio
 import numpy as np
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator, Callable, Tuple
 import os
+import math
 import time
-from datetime import datetime, timedelta
+import uuid
+import hashlib
 import logging
-import cohere_aws
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 import json
-import boto3
+from vector_index import VectorIndex, RESCORE_FACTOR
+from ann_index import INDEX_BACKENDS
+from lexical_index import LexicalIndex, reciprocal_rank_fusion
+from content_store import ContentStore
+from pdf_extraction import (ImageDeduplicator, PHASH_MAX_DISTANCE, iter_page_records, page_count,
+                            page_fingerprints)
+from chunking import Chunker, approx_token_count
+from embedding_cache import EmbeddingCache, SingleFlight, TTLCache, embedding_cache_key
+from rate_limiter import BedrockRateLimiter, ThrottlingRetriesExhausted
+from blob_store import BlobStore
+from bedrock_clients import BedrockClients
+from metrics import BEDROCK_BYTES, BEDROCK_INPUTS, BEDROCK_TOKENS, STAGE_SECONDS, propagate, stage
 
 # AWS Configuration
 AWS_REGION = "us-west-2"  # Define AWS region for the application
@@ -20,252 +31,771 @@ EMBEDDING_MODEL_ID = "us.cohere.embed-v4:0"
 RERANK_MODEL_ID = "cohere.rerank-v3-5:0"
 CHAT_MODEL_ID = "cohere.command-r-plus-v1:0"
 
+# Bedrock request budgets in requests per minute, shared by all call sites.
+# Match these to your account's quotas; the limiter lowers them while throttled.
+IMAGE_EMBEDDING_BUDGET = f"{EMBEDDING_MODEL_ID}/images"
+MODEL_RATE_LIMITS = {
+    EMBEDDING_MODEL_ID: 600,
+    IMAGE_EMBEDDING_BUDGET: 40,
+    RERANK_MODEL_ID: 120,
+    CHAT_MODEL_ID: 60
+}
+
+# Embedding pipeline configuration
+EMBED_BATCH_SIZE = 96  # Maximum number of texts per embed request
+EMBED_MAX_WORKERS = 4  # Maximum number of embed requests in flight
+
+# Chunking configuration, in approximate tokens
+CHUNK_MAX_TOKENS = 256  # Budget per text chunk
+CHUNK_OVERLAP_TOKENS = 32  # Trailing lines repeated at the start of the next chunk
+
+# Extraction configuration
+EXTRACT_WORKERS = min(4, os.cpu_count() or 1)  # Processes running PyMuPDF extraction
+EXTRACT_PAGES_PER_SHARD = 16  # Pages handed to a worker at a time
+
+# Embedding cache configuration
+EMBEDDING_CACHE_PATH = os.path.join("embedding_cache", "embeddings.sqlite")
+EMBEDDING_CACHE_MEMORY_BYTES = 256 * 1024 * 1024  # 256MB in-memory LRU tier
+EMBEDDING_CACHE_DISK_BYTES = 2 * 1024 * 1024 * 1024  # 2GB SQLite tier
+EMBEDDING_TYPE = "float"
+
+# Vector index precision: 'float32', or 'int8' / 'binary' codes in RAM with the float
+# vectors memory-mapped from disk and used to rescore the best candidates
+VECTOR_PRECISION = "float32"
+# Index backend: 'exact', or 'ivf' to score only the clusters nearest each query (see ann_index)
+INDEX_BACKEND = "exact"
+# Fuse BM25 matches over text chunks with vector matches before reranking, so exact
+# terms such as part numbers and clause IDs reach the reranker (see lexical_index)
+HYBRID_SEARCH = True
+
+# Recent query vectors, so repeated or paginated queries skip Bedrock
+QUERY_CACHE_ITEMS = 1024
+QUERY_CACHE_TTL = 600  # 10 minutes
+
+# Recent rerank results per document, keyed by query and the exact candidate list
+RERANK_CACHE_ITEMS = 256
+RERANK_CACHE_TTL = 600  # 10 minutes
+
+# Extracted images and page renders, stored once and referenced by key
+BLOB_STORE_PATH = "blobs"
+
+# Saved results layout
+STORE_VERSION = 2  # 2: image items reference the blob store instead of inlining base64
+MANIFEST_FILE = 'manifest.json'
+CONTENT_FILE = 'content_sequence.jsonl'
+FINGERPRINTS_FILE = 'page_fingerprints.json'
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class RateLimiter:
-    def __init__(self, max_requests: int, time_window: int):
+_shared_lock = threading.Lock()
+_rate_limiter = None
+
+def get_rate_limiter() -> BedrockRateLimiter:
+    """Return the process-wide Bedrock rate limiter shared by all processors"""
+    global _rate_limiter
+    with _shared_lock:
+        if _rate_limiter is None:
+            _rate_limiter = BedrockRateLimiter(MODEL_RATE_LIMITS)
+        return _rate_limiter
+
+_embedding_cache = None
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Return the process-wide embedding cache shared by all processors"""
+    global _embedding_cache
+    with _shared_lock:
+        if _embedding_cache is None:
+            _embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH,
+                                              max_memory_bytes=EMBEDDING_CACHE_MEMORY_BYTES,
+                                              max_disk_bytes=EMBEDDING_CACHE_DISK_BYTES)
+        return _embedding_cache
+
+_bedrock_clients = None
+
+def get_bedrock_clients() -> BedrockClients:
+    """Return the process-wide Bedrock clients shared by all processors"""
+    global _bedrock_clients
+    with _shared_lock:
+        if _bedrock_clients is None:
+            _bedrock_clients = BedrockClients(AWS_REGION)
+        return _bedrock_clients
+
+def set_bedrock_clients(clients) -> None:
+    """
+    Replace the process-wide Bedrock clients, e.g. with a local stand-in to run without AWS
+    clients: provides runtime, agent_runtime, chat(), the async clients, run() and
+    stats() like BedrockClients.
+    Processors created earlier keep the embed and rerank clients they were given.
+    """
+    global _bedrock_clients
+    with _shared_lock:
+        _bedrock_clients = clients
+
+_blob_store = None
+
+def get_blob_store() -> BlobStore:
+    """Return the process-wide image blob store shared by all processors"""
+    global _blob_store
+    with _shared_lock:
+        if _blob_store is None:
+            _blob_store = BlobStore(BLOB_STORE_PATH)
+        return _blob_store
+
+_query_cache = TTLCache(max_items=QUERY_CACHE_ITEMS, ttl=QUERY_CACHE_TTL)
+
+def rerank_cache_key(query: str, model_arn: str, version: str, items: List[Dict[str, Any]]) -> str:
+    """Cache key for reranking items, in order, against query for one content version"""
+    digest = hashlib.sha256()
+    for part in (query, model_arn, version):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    for item in items:
+        digest.update(f"{item.get('document_id', '')}:{item['chunk_id']},".encode('utf-8'))
+    return digest.hexdigest()
+
+class PDFProcessorCohere:
+    def __init__(self, chunk_tokens: int = CHUNK_MAX_TOKENS,
+                 chunk_overlap: int = CHUNK_OVERLAP_TOKENS,
+                 embed_batch_size: int = EMBED_BATCH_SIZE,
+                 max_workers: int = EMBED_MAX_WORKERS,
+                 extract_workers: int = EXTRACT_WORKERS,
+                 bedrock_runtime=None,
+                 bedrock_agent_runtime=None,
+                 embedding_cache: Optional[EmbeddingCache] = None,
+                 chat_client=None,
+                 rate_limiter: Optional[BedrockRateLimiter] = None,
+                 blob_store: Optional[BlobStore] = None,
+                 vector_precision: str = VECTOR_PRECISION,
+                 rescore_factor: int = RESCORE_FACTOR,
+                 index_backend: str = INDEX_BACKEND,
+                 index_options: Optional[Dict[str, Any]] = None,
+                 hybrid_search: bool = HYBRID_SEARCH,
+                 async_bedrock_runtime=None,
+                 async_bedrock_agent_runtime=None,
+                 image_max_distance: Optional[int] = PHASH_MAX_DISTANCE):
         """
-        Initialize rate limiter
-        max_requests: Maximum number of requests allowed in the time window
-        time_window: Time window in seconds
+        index_backend: key of ann_index.INDEX_BACKENDS
+        index_options: backend settings, such as nprobe for 'ivf'
+        hybrid_search: default for rerank_search fusing BM25 and vector candidates
+        async_bedrock_runtime, async_bedrock_agent_runtime: clients with coroutine methods
+        for the async API; default to the shared aiobotocore clients
+        image_max_distance: also drop images whose perceptual hash is within this many bits
+        of a kept image's; None keeps every image whose bytes differ
         """
-        self.max_requests = max_requests
-        self.time_window = time_window
-        self.requests = []
-
-    def wait_if_needed(self):
-        """Wait if rate limit is exceeded"""
-        now = datetime.now()
-
-        # Remove old requests outside the time window
-        self.requests = [req_time for req_time in self.requests
-                        if now - req_time < timedelta(seconds=self.time_window)]
+        if index_backend not in INDEX_BACKENDS:
+            raise ValueError(f"Unknown index backend {index_backend}, use one of {list(INDEX_BACKENDS)}")
+        self.index_class = INDEX_BACKENDS[index_backend]
+        self.index_options = index_options or {}
+        self.vector_precision = vector_precision
+        self.rescore_factor = rescore_factor
+        self.content_sequence = ContentStore()
+        self.index = self._new_index()
+        self.lexical = LexicalIndex()  # BM25 over text items, keyed like the index
+        self.hybrid_search = hybrid_search
+        self.image_max_distance = image_max_distance
+        self.page_fingerprints = []  # Per page, used by revise_pdf to find unchanged pages
+        # Images kept and skipped during extraction, by reason
+        self.image_stats = defaultdict(int)
+        # Guards swapping index, lexical and content_sequence together
+        self.lock = threading.RLock()
+        self.embed_requests = 0
+        self._requests_lock = threading.Lock()
+        self.chunker = Chunker(max_tokens=chunk_tokens, overlap_tokens=chunk_overlap)
+        self.embed_batch_size = max(1, min(embed_batch_size, EMBED_BATCH_SIZE))
+        self.max_workers = max(1, max_workers)
+        self.extract_workers = max(1, extract_workers)
+        # Every Bedrock call goes through the shared per-model rate limiter
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        # Embeddings are cached by content, so re-ingesting a file skips Bedrock
+        self.embedding_cache = embedding_cache or get_embedding_cache()
+        self.query_cache = _query_cache
+        # Rerank results for this version of the content; cleared whenever it changes
+        self.rerank_cache = TTLCache(max_items=RERANK_CACHE_ITEMS, ttl=RERANK_CACHE_TTL)
+        self.rerank_flight = SingleFlight()  # Concurrent identical reranks share one call
+        self.version = uuid.uuid4().hex
+        # Image bytes live in the blob store; content items only carry the key
+        self.blob_store = blob_store or get_blob_store()
+        self.chat_client = chat_client
+
+        # AWS clients and their connection pools are shared by every processor
+        self.bedrock_runtime = bedrock_runtime or get_bedrock_clients().runtime
+        self.bedrock_agent_runtime = bedrock_agent_runtime or get_bedrock_clients().agent_runtime
+        # Bound to the shared clients' event loop, so resolved when first awaited there
+        self.async_bedrock_runtime = async_bedrock_runtime
+        self.async_bedrock_agent_runtime = async_bedrock_agent_runtime
+
+    def _new_index(self, dim: Optional[int] = None) -> VectorIndex:
+        return self.index_class(dim, precision=self.vector_precision, rescore_factor=self.rescore_factor,
+                                **self.index_options)
 
-        if len(self.requests) >= self.max_requests:
-            # Calculate how long to wait
-            oldest_request = self.requests[0]
-            wait_time = (oldest_request + timedelta(seconds=self.time_window) - now).total_seconds()
-            if wait_time > 0:
-                logger.info(f"Rate limit reached. Waiting {wait_time:.2f} seconds...")
-                time.sleep(wait_time)
-            self.requests = self.requests[1:]
-
-        self.requests.append(now)
-
-class PDFProcessorCohere:
-    def __init__(self, chunk_size: int = 1000):
-        self.content_sequence = []
-        self.embeddings = []
-        self.chunk_size = chunk_size
-        # Initialize rate limiter for 40 requests per minute
-        self.rate_limiter = RateLimiter(max_requests=40, time_window=60)
-
-        # Initialize AWS clients once
-        self.bedrock_runtime = boto3.client(
-            service_name="bedrock-runtime",
-            region_name=AWS_REGION
+    def chunk_text(self, text: str) -> List[str]:
+        """Split text into token-budgeted chunks at sentence boundaries"""
+        return self.chunker.chunk_text(text)
+
+    async def _async_runtime(self):
+        return self.async_bedrock_runtime or await get_bedrock_clients().async_runtime()
+
+    async def _async_agent_runtime(self):
+        return self.async_bedrock_agent_runtime or await get_bedrock_clients().async_agent_runtime()
+
+    def _invoke_embed(self, body: Dict[str, Any], budget: str = EMBEDDING_MODEL_ID) -> List[List[float]]:
+        """Send a single embed request to Bedrock and return the float embeddings"""
+        with self._requests_lock:
+            self.embed_requests += 1
+        request_body = json.dumps(body)
+        response = self.rate_limiter.call(
+          budget,
+          self.bedrock_runtime.invoke_model,
+          body=request_body,
+          modelId=EMBEDDING_MODEL_ID,
+          contentType="application/json",
+          accept="*/*"
         )
-        self.bedrock_agent_runtime = boto3.client(
-            'bedrock-agent-runtime',
-            region_name=AWS_REGION
+        return self._embed_response(body, request_body, response["body"].read())
+
+    async def _ainvoke_embed(self, body: Dict[str, Any], budget: str = EMBEDDING_MODEL_ID) -> List[List[float]]:
+        """Async variant of _invoke_embed"""
+        with self._requests_lock:
+            self.embed_requests += 1
+        request_body = json.dumps(body)
+        runtime = await self._async_runtime()
+        response = await self.rate_limiter.acall(
+          budget,
+          runtime.invoke_model,
+          body=request_body,
+          modelId=EMBEDDING_MODEL_ID,
+          contentType="application/json",
+          accept="*/*"
         )
-
-    def chunk_text(self, text: str) -> List[str]:
-        """Split text into chunks while preserving sentence boundaries"""
-        sentences = text.replace('\n', ' ').split('. ')
-        chunks = []
-        current_chunk = []
-        current_length = 0
-
-        for sentence in sentences:
-            sentence = sentence.strip() + '. '
-            sentence_length = len(sentence)
-
-            if current_length + sentence_length > self.chunk_size:
-                if current_chunk:
-                    chunks.append(''.join(current_chunk))
-                current_chunk = [sentence]
-                current_length = sentence_length
-            else:
-                current_chunk.append(sentence)
-                current_length += sentence_length
-
-        if current_chunk:
-            chunks.append(''.join(current_chunk))
-
-        return chunks
+        async with response["body"] as stream:
+            raw_response = await stream.read()
+        return self._embed_response(body, request_body, raw_response)
+
+    @staticmethod
+    def _embed_response(body: Dict[str, Any], request_body: str, raw_response: bytes) -> List[List[float]]:
+        """Count an embed request's payload and inputs, and return its float embeddings"""
+        BEDROCK_BYTES.inc(len(request_body), model=EMBEDDING_MODEL_ID, direction='sent')
+        BEDROCK_BYTES.inc(len(raw_response), model=EMBEDDING_MODEL_ID, direction='received')
+        if 'texts' in body:
+            BEDROCK_INPUTS.inc(len(body['texts']), model=EMBEDDING_MODEL_ID, kind='text')
+            BEDROCK_TOKENS.inc(sum(approx_token_count(text) for text in body['texts']),
+                               model=EMBEDDING_MODEL_ID, direction='input')
+        else:
+            BEDROCK_INPUTS.inc(len(body.get('images', [])), model=EMBEDDING_MODEL_ID, kind='image')
+        response_body = json.loads(raw_response)
+        return response_body["embeddings"][EMBEDDING_TYPE]
+
+    def _cached_texts(self, texts: List[str], input_type: str
+                      ) -> Tuple[List[Optional[np.ndarray]], Dict[str, List[int]], Dict[str, Any]]:
+        """
+        Cached embeddings of texts, None where missing, plus the positions of the missing
+        texts by cache key and the embed request for them
+        """
+        keys = [embedding_cache_key(EMBEDDING_MODEL_ID, input_type, EMBEDDING_TYPE, 'text', text)
+                for text in texts]
+        embeddings = [self.embedding_cache.get(key) for key in keys]
+
+        missing = {}
+        for idx, embedding in enumerate(embeddings):
+            if embedding is None:
+                missing.setdefault(keys[idx], []).append(idx)
+        request = {
+          "texts": [texts[positions[0]] for positions in missing.values()],
+          "input_type": input_type,
+          "embedding_types": [EMBEDDING_TYPE]
+        }
+        return embeddings, missing, request
+
+    def _fill_texts(self, embeddings: List[Optional[np.ndarray]], missing: Dict[str, List[int]],
+                    computed: List[List[float]]) -> List[np.ndarray]:
+        """Cache the computed embeddings and put them in their positions"""
+        stored = self.embedding_cache.put_many(zip(missing, computed))
+        for key, embedding in zip(missing, stored):
+            for idx in missing[key]:
+                embeddings[idx] = embedding
+        return embeddings
+
+    def embed_texts(self, texts: List[str], input_type: str = "search_document") -> List[np.ndarray]:
+        """Compute embeddings for a batch of texts, sending only cache misses in one request"""
+        embeddings, missing, request = self._cached_texts(texts, input_type)
+        if missing:
+            self._fill_texts(embeddings, missing, self._invoke_embed(request))
+        return embeddings
+
+    async def aembed_texts(self, texts: List[str], input_type: str = "search_document") -> List[np.ndarray]:
+        """Async variant of embed_texts"""
+        embeddings, missing, request = self._cached_texts(texts, input_type)
+        if missing:
+            self._fill_texts(embeddings, missing, await self._ainvoke_embed(request))
+        return embeddings
+
+    @staticmethod
+    def _image_request(image_format: str, base64_data: str) -> Tuple[str, Dict[str, Any]]:
+        """Cache key and embed request of one image"""
+        key = embedding_cache_key(EMBEDDING_MODEL_ID, "search_document", EMBEDDING_TYPE,
+                                  f"image/{image_format}", base64_data)
+        image_uri = f"data:image/{image_format};base64,{base64_data}"
+        return key, {
+          "images": [image_uri],
+          "input_type": "search_document",
+          "embedding_types": [EMBEDDING_TYPE]
+        }
+
+    def embed_image(self, image_format: str, base64_data: str) -> np.ndarray:
+        """Compute the embedding for a single image"""
+        key, request = self._image_request(image_format, base64_data)
+        embedding = self.embedding_cache.get(key)
+        if embedding is not None:
+            return embedding
+
+        # Image embeddings have their own, smaller budget
+        embedding = self._invoke_embed(request, budget=IMAGE_EMBEDDING_BUDGET)[0]
+        return self.embedding_cache.put(key, embedding)
+
+    async def aembed_image(self, image_format: str, base64_data: str) -> np.ndarray:
+        """Async variant of embed_image"""
+        key, request = self._image_request(image_format, base64_data)
+        embedding = self.embedding_cache.get(key)
+        if embedding is not None:
+            return embedding
+        embedding = (await self._ainvoke_embed(request, budget=IMAGE_EMBEDDING_BUDGET))[0]
+        return self.embedding_cache.put(key, embedding)
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """Embed a search query with input_type search_query, reusing recent query vectors"""
+        with stage('embed_query') as span:
+            query_embedding = self.query_cache.get(query)
+            span['cached'] = query_embedding is not None
+            if query_embedding is None:
+                query_embedding = self.embed_texts([query], input_type="search_query")[0]
+                self.query_cache.put(query, query_embedding)
+            return query_embedding
+
+    async def aembed_query(self, query: str) -> np.ndarray:
+        """Async variant of embed_query"""
+        with stage('embed_query') as span:
+            query_embedding = self.query_cache.get(query)
+            span['cached'] = query_embedding is not None
+            if query_embedding is None:
+                query_embedding = (await self.aembed_texts([query], input_type="search_query"))[0]
+                self.query_cache.put(query, query_embedding)
+            return query_embedding
 
     def compute_embeddings(self, content_item: Dict[str, Any]) -> Optional[dict]:
         """Compute embeddings for a single content item"""
         try:
-            if content_item['type'] == 'text':
-                body = json.dumps({
-                  "texts": [content_item['content']],
-                  "input_type": "search_document",
-                  "embedding_types": ["float"]
-                })
-                response = self.bedrock_runtime.invoke_model(
-                  body=body,
-                  modelId=EMBEDDING_MODEL_ID,
-                  contentType="application/json",
-                  accept="*/*"
-                )
-                response_body = json.loads(response["body"].read())
-                embedding_values = response_body["embeddings"]["float"][0]
-
-                return {
-                    'embedding': embedding_values,
-                    'type': 'text'
-                }
-            else:  # image
-                # Apply rate limiting for image embeddings
-                self.rate_limiter.wait_if_needed()
-
-                image_uri = f"data:image/{content_item['format']};base64,{content_item['base64_data']}"
-                body = json.dumps({
-                  "images": [image_uri],
-                  "input_type": "search_document",
-                  "embedding_types": ["float"]
-                })
-                response = self.bedrock_runtime.invoke_model(
-                  body=body,
-                  modelId=EMBEDDING_MODEL_ID,
-                  accept="*/*",
-                  contentType="application/json"
-                )
-
-                response_body = json.loads(response["body"].read())
-                embedding_values = response_body["embeddings"]["float"][0]
-                return {
-                    'embedding': embedding_values,
-                    'type': 'image'
-                }
+            with stage('compute_embeddings', type=content_item['type']):
+                if content_item['type'] == 'text':
+                    embedding_values = self.embed_texts([content_item['content']])[0]
+                    return {
+                        'embedding': embedding_values,
+                        'type': 'text'
+                    }
+                else:  # image
+                    with stage('encode_image'):
+                        base64_data = self._image_base64(content_item)
+                    embedding_values = self.embed_image(content_item['format'], base64_data)
+                    return {
+                        'embedding': embedding_values,
+                        'type': 'image'
+                    }
+        except ThrottlingRetriesExhausted:
+            # Never drop content because of throttling; fail loudly instead
+            raise
         except Exception as e:
             logger.error(f"Error computing embedding for {content_item['type']}: {str(e)}")
             return None
 
-    def process_pdf(self, pdf_path: str) -> List[Dict[str, Any]]:
-        """Process PDF with chunked text processing and image extraction"""
-        doc = fitz.open(pdf_path)
-        logger.info(f"Processing PDF: {pdf_path}")
+    def _image_base64(self, item: Dict[str, Any]) -> str:
+        return base64.b64encode(self.blob_store.get(item['blob_key'])).decode('utf-8')
+
+    def _embed_text_batch(self, batch: List[Dict[str, Any]]) -> None:
+        """Embed a batch of text items in place"""
+        try:
+            embeddings = self.embed_texts([item['content'] for item in batch])
+            for item, embedding in zip(batch, embeddings):
+                item['embedding'] = embedding
+        except ThrottlingRetriesExhausted:
+            raise
+        except Exception as e:
+            logger.error(f"Error computing embeddings for {len(batch)} text chunks: {str(e)}")
 
+    async def _aembed_text_batch(self, batch: List[Dict[str, Any]]) -> None:
+        """Async variant of _embed_text_batch"""
         try:
-            total_pages = len(doc)
-            chunk_id = 0
-            for page_num in range(total_pages):
-                page = doc[page_num]
-                logger.info(f"Processing page {page_num + 1}/{total_pages}")
-
-                # Get text blocks with their coordinates
-                text = page.get_text()
-                if text.strip():
-                    chunks = self.chunk_text(text)
-                    for chunk_idx, chunk in enumerate(chunks):
-                        if chunk.strip():
-                            content_item = {
-                                'page': page_num + 1,
-                                'chunk': chunk_idx + 1,
-                                'content': chunk.strip(),
-                                'type': 'text',
-                                'bbox': tuple(page.bound()),
-                                'chunk_id': chunk_id
-                            }
-                            chunk_id += 1
-
-                            embedding_data = self.compute_embeddings(content_item)
-                            if embedding_data:
-                                content_item['embedding'] = embedding_data['embedding']
-                                self.content_sequence.append(content_item)
-
-                # Enhanced image and vector graphic processing
-                try:
-                    # Extract images using get_images()
-                    images = page.get_images(full=True)
-                    for img_index, img in enumerate(images):
-                        xref = img[0]  # Get the image reference
-                        base_image = doc.extract_image(xref)
-
-                        if base_image and base_image["image"]:
-                            image_bytes = base_image["image"]
-                            image_format = base_image["ext"].lower()
-                            image_base64 = base64.b64encode(image_bytes).decode('utf-8')
-
-                            image_item = {
-                                'page': page_num + 1,
-                                'index': img_index,
-                                'type': 'image',
-                                'format': image_format,
-                                'base64_data': image_base64,
-                                'chunk_id': chunk_id
-                            }
-                            chunk_id += 1
-
-                            embedding_data = self.compute_embeddings(image_item)
-                            if embedding_data:
-                                image_item['embedding'] = embedding_data['embedding']
-                                self.content_sequence.append(image_item)
-
-                    # Render vector graphics to images
-                    pix = page.get_pixmap()
-                    img_bytes = pix.tobytes()
-
-                    if img_bytes:
-                        image_base64 = base64.b64encode(img_bytes).decode('utf-8')
-                        image_item = {
-                            'page': page_num + 1,
-                            'index': 0,
-                            'type': 'image',
-                            'format': 'png',
-                            'base64_data': image_base64,
-                            'chunk_id': chunk_id
-                        }
-                        chunk_id += 1
-
-                        embedding_data = self.compute_embeddings(image_item)
-                        if embedding_data:
-                            image_item['embedding'] = embedding_data['embedding']
-                            self.content_sequence.append(image_item)
-
-                except Exception as e:
-                    logger.error(f"Error processing images on page {page_num + 1}: {str(e)}")
-
-        finally:
-            doc.close()
+            embeddings = await self.aembed_texts([item['content'] for item in batch])
+            for item, embedding in zip(batch, embeddings):
+                item['embedding'] = embedding
+        except ThrottlingRetriesExhausted:
+            raise
+        except Exception as e:
+            logger.error(f"Error computing embeddings for {len(batch)} text chunks: {str(e)}")
 
-        logger.info(f"Completed processing PDF with {len(self.content_sequence)} items")
-        return self.content_sequence
+    def _embed_image_item(self, item: Dict[str, Any]) -> None:
+        """Embed a single image item in place"""
+        embedding_data = self.compute_embeddings(item)
+        if embedding_data:
+            item['embedding'] = embedding_data['embedding']
 
-    def search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
-        """Search through embedded content using a text query"""
+    async def _aembed_image_item(self, item: Dict[str, Any]) -> None:
+        """Async variant of _embed_image_item"""
         try:
-            body = json.dumps({
-                  "texts": [query],
-                  "input_type": "search_document",
-                  "embedding_types": ["float"]
+            with stage('compute_embeddings', type=item['type']):
+                with stage('encode_image'):
+                    base64_data = await asyncio.to_thread(self._image_base64, item)
+                item['embedding'] = await self.aembed_image(item['format'], base64_data)
+        except ThrottlingRetriesExhausted:
+            raise
+        except Exception as e:
+            logger.error(f"Error computing embedding for {item['type']}: {str(e)}")
+
+    def embed_content_items(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Embed content items with batched, concurrent requests
+        Text items are packed into requests of up to embed_batch_size texts, images are
+        sent one per request, and at most max_workers requests are in flight at once.
+        Returns the items that were embedded successfully, in their original order.
+        """
+        text_batches, image_items = self._embed_batches(items)
+
+        with stage('embed', texts=len(items) - len(image_items), images=len(image_items)), \
+                ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(propagate(self._embed_text_batch), batch) for batch in text_batches]
+            futures += [executor.submit(propagate(self._embed_image_item), item) for item in image_items]
+            for future in futures:
+                future.result()
+
+        return [item for item in items if 'embedding' in item]
+
+    async def aembed_content_items(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Async variant of embed_content_items, with at most max_workers requests in flight"""
+        text_batches, image_items = self._embed_batches(items)
+        slots = asyncio.Semaphore(self.max_workers)
+
+        async def embed(fn, arg) -> None:
+            async with slots:
+                await fn(arg)
+
+        with stage('embed', texts=len(items) - len(image_items), images=len(image_items)):
+            await asyncio.gather(*[embed(self._aembed_text_batch, batch) for batch in text_batches],
+                                 *[embed(self._aembed_image_item, item) for item in image_items])
+
+        return [item for item in items if 'embedding' in item]
+
+    def _embed_batches(self, items: List[Dict[str, Any]]) -> Tuple[List[List[Dict[str, Any]]], List[Dict[str, Any]]]:
+        """Text items in requests of up to embed_batch_size, and the image items"""
+        text_items = [item for item in items if item['type'] == 'text']
+        image_items = [item for item in items if item['type'] != 'text']
+        text_batches = [text_items[i:i + self.embed_batch_size]
+                        for i in range(0, len(text_items), self.embed_batch_size)]
+        return text_batches, image_items
+
+    def add_items(self, items: List[Dict[str, Any]]) -> None:
+        """Append embedded items to the content sequence and move their vectors into the index"""
+        with stage('index', items=len(items)):
+            start = len(self.content_sequence)
+            embeddings = [item.pop('embedding') for item in items]
+            self.content_sequence.extend(items)
+            self.index.add(embeddings,
+                           [item['type'] for item in items],
+                           [item['page'] for item in items],
+                           range(start, start + len(items)))
+            texts = [(item_id, item['content']) for item_id, item in enumerate(items, start) if item['type'] == 'text']
+            self.lexical.add([item_id for item_id, _ in texts], [text for _, text in texts])
+            self._content_changed()
+
+    def _content_changed(self) -> None:
+        """Start a new content version, dropping rerank results computed for the previous one"""
+        self.version = uuid.uuid4().hex
+        self.rerank_cache.clear()
+
+    def memory_usage(self) -> int:
+        """Approximate bytes held in RAM by this document's content and vectors"""
+        return self.index.memory_bytes() + self.lexical.memory_bytes() + self.content_sequence.memory_bytes()
+
+    def _page_items(self, record: Dict[str, Any], chunk_id: int,
+                    images: Optional[ImageDeduplicator] = None) -> List[Dict[str, Any]]:
+        """
+        Turn an extracted page record into content items, numbering them from chunk_id
+        images: images already kept from this document; duplicates of them are dropped
+        """
+        images = images or ImageDeduplicator(self.image_max_distance)
+        for reason, count in record['skipped'].items():
+            self.image_stats[f"skipped_{reason}"] += count
+        content_items = []
+        for chunk_idx, chunk in enumerate(record['chunks']):
+            content_items.append({
+                'page': record['page'],
+                'chunk': chunk_idx + 1,
+                'content': chunk['text'],
+                'type': 'text',
+                'bbox': chunk['bbox'],
+                'chunk_id': chunk_id + len(content_items)
+            })
+
+        for img_index, image_format, image_bytes, phash in record['images']:
+            if images.is_duplicate(image_bytes, phash):
+                self.image_stats['skipped_duplicate'] += 1
+                continue
+            self.image_stats['images'] += 1
+            content_items.append({
+                'page': record['page'],
+                'index': img_index,
+                'type': 'image',
+                'format': image_format,
+                'blob_key': self.blob_store.put(image_bytes, image_format),
+                'chunk_id': chunk_id + len(content_items)
             })
-            query_response = self.bedrock_runtime.invoke_model(
-                  body=body,
-                  modelId=EMBEDDING_MODEL_ID,
-                  contentType="application/json",
-                  accept="*/*"
-            )
-            response_body = json.loads(query_response["body"].read())
-            query_embedding = response_body["embeddings"]["float"][0]
-
-            similarities = []
-            for idx, item in enumerate(self.content_sequence):
-                if 'embedding' in item:
-                    similarity = np.dot(query_embedding, item['embedding'])
-                    similarities.append((similarity, idx))
-
-            similarities.sort(reverse=True)
+
+        if record['render'] and not images.is_duplicate(record['render']):
+            self.image_stats['renders'] += 1
+            content_items.append({
+                'page': record['page'],
+                'index': 0,
+                'type': 'image',
+                'format': 'png',
+                'blob_key': self.blob_store.put(record['render'], 'png'),
+                'chunk_id': chunk_id + len(content_items)
+            })
+
+        return content_items
+
+    def _snapshot(self) -> Tuple[VectorIndex, LexicalIndex, ContentStore]:
+        """The current index, lexical index and content sequence, consistent with each other"""
+        with self.lock:
+            return self.index, self.lexical, self.content_sequence
+
+    def _page_windows(self, pdf_path: str, page_numbers: Optional[List[int]] = None,
+                      fingerprints: Optional[List[str]] = None
+                      ) -> Iterator[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]]:
+        """
+        Extract pages and group their items in windows of about embed_batch_size * max_workers texts
+        page_numbers: sorted 0-based pages to extract, or None for every page
+        fingerprints: already computed fingerprints of every page, so extraction does not hash them again
+        Yields (pages, items) per window, where pages holds each page's number and fingerprint.
+        """
+        window_size = self.embed_batch_size * self.max_workers
+        images = ImageDeduplicator(self.image_max_distance)
+        chunk_id = 0
+        pages = []
+        pending = []
+        pending_texts = 0
+        records = iter_page_records(pdf_path, self.chunker, self.extract_workers, EXTRACT_PAGES_PER_SHARD,
+                                    page_numbers=page_numbers, fingerprints=fingerprints)
+        for record in records:
+            logger.info(f"Processing page {record['page']}")
+            # Measured in the extraction worker
+            STAGE_SECONDS.observe(record['seconds'], stage='extract_page')
+            with stage('page_items'):
+                page_items = self._page_items(record, chunk_id, images)
+            chunk_id += len(page_items)
+            pending.extend(page_items)
+            pending_texts += len(record['chunks'])
+            pages.append({'page': record['page'], 'fingerprint': record['fingerprint']})
+
+            if pending_texts >= window_size:
+                yield pages, pending
+                pages = []
+                pending = []
+                pending_texts = 0
+
+        if pages:
+            yield pages, pending
+
+    def _embedded_windows(self, pdf_path: str, page_numbers: Optional[List[int]] = None,
+                          fingerprints: Optional[List[str]] = None
+                          ) -> Iterator[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]]:
+        """_page_windows with each window's items embedded; items that failed to embed are dropped"""
+        for pages, items in self._page_windows(pdf_path, page_numbers, fingerprints):
+            yield pages, self.embed_content_items(items)
+
+    def process_pdf(self, pdf_path: str,
+                    progress_callback: Optional[Callable[[int, int, int], None]] = None) -> ContentStore:
+        """
+        Process PDF with chunked text processing and image extraction
+        PyMuPDF extraction runs in up to extract_workers processes (see pdf_extraction);
+        pages are embedded and indexed here in windows of about embed_batch_size * max_workers
+        text chunks, so earlier pages are searchable while later ones are still processing.
+        progress_callback: called as (pages_done, total_pages, items_embedded) after each window
+        """
+        logger.info(f"Processing PDF: {pdf_path}")
+
+        items_embedded = 0
+        total_pages = page_count(pdf_path)
+        self.page_fingerprints = []
+        with stage('process_pdf', pages=total_pages):
+            for pages, embedded in self._embedded_windows(pdf_path):
+                self.add_items(embedded)
+                self.page_fingerprints.extend(page['fingerprint'] for page in pages)
+                items_embedded += len(embedded)
+                if progress_callback:
+                    progress_callback(pages[-1]['page'], total_pages, items_embedded)
+
+        self._log_processed()
+        return self.content_sequence
+
+    async def aprocess_pdf(self, pdf_path: str,
+                           progress_callback: Optional[Callable[[int, int, int], None]] = None
+                           ) -> ContentStore:
+        """
+        Async variant of process_pdf
+        Embed requests are sent from the event loop; extraction and indexing, which are
+        CPU-bound, run in worker threads so they do not stall it.
+        """
+        logger.info(f"Processing PDF: {pdf_path}")
+
+        items_embedded = 0
+        total_pages = await asyncio.to_thread(page_count, pdf_path)
+        self.page_fingerprints = []
+        windows = self._page_windows(pdf_path)
+        with stage('process_pdf', pages=total_pages):
+            while True:
+                window = await asyncio.to_thread(next, windows, None)
+                if window is None:
+                    break
+                pages, items = window
+                embedded = await self.aembed_content_items(items)
+                await asyncio.to_thread(self.add_items, embedded)
+                self.page_fingerprints.extend(page['fingerprint'] for page in pages)
+                items_embedded += len(embedded)
+                if progress_callback:
+                    progress_callback(pages[-1]['page'], total_pages, items_embedded)
+
+        self._log_processed()
+        return self.content_sequence
+
+    def _log_processed(self) -> None:
+        logger.info(f"Completed processing PDF with {len(self.content_sequence)} items")
+        logger.info(f"Image stats: {dict(self.image_stats)}")
+        logger.info(f"Embedding cache stats: {self.embedding_cache.stats()}")
+
+    def revise_pdf(self, pdf_path: str,
+                   progress_callback: Optional[Callable[[int, int, int], None]] = None) -> Dict[str, Any]:
+        """
+        Re-ingest a revised version of this document, embedding only pages that changed
+        Pages are matched by fingerprint, so unchanged pages keep their items and vectors
+        even if they moved. The rebuilt content sequence and index replace the current
+        ones in one swap, so searches see either the old or the new version.
+        progress_callback: called as (pages_done, pages_to_process, items_embedded)
+        Returns a report of pages added, removed, changed and reused, and embed requests made and saved.
+        """
+        started = time.time()
+        requests_before = self.embed_requests
+        with stage('fingerprint_pages'):
+            new_fingerprints = page_fingerprints(pdf_path)
+        index, _, content_sequence = self._snapshot()
+        old_fingerprints = self.page_fingerprints
+        if content_sequence and not old_fingerprints:
+            logger.warning("No page fingerprints saved for this document, processing every page")
+
+        # Match each new page to an unused old page with the same fingerprint
+        old_pages_by_fingerprint = defaultdict(deque)
+        for page, fingerprint in enumerate(old_fingerprints, 1):
+            old_pages_by_fingerprint[fingerprint].append(page)
+        reused = {}
+        for page, fingerprint in enumerate(new_fingerprints, 1):
+            if old_pages_by_fingerprint[fingerprint]:
+                reused[page] = old_pages_by_fingerprint[fingerprint].popleft()
+        to_process = [page for page in range(1, len(new_fingerprints) + 1) if page not in reused]
+        unmatched_old = set(range(1, len(old_fingerprints) + 1)) - set(reused.values())
+        changed = [page for page in to_process if page in unmatched_old]
+        added = [page for page in to_process if page not in unmatched_old]
+        removed = sorted(unmatched_old - set(changed))
+
+        # Old items with their index rows, by page
+        row_of = {int(item_id): row for row, item_id in enumerate(index.ids)}
+        old_items = defaultdict(list)
+        for item_id, item in enumerate(content_sequence):
+            if item_id in row_of:
+                old_items[item['page']].append((item, row_of[item_id]))
+
+        new_items = defaultdict(list)
+        pages_done = 0
+        items_embedded = 0
+        for pages, embedded in self._embedded_windows(pdf_path, [page - 1 for page in to_process],
+                                                      new_fingerprints):
+            for item in embedded:
+                new_items[item['page']].append(item)
+            pages_done += len(pages)
+            items_embedded += len(embedded)
+            if progress_callback:
+                progress_callback(pages_done, len(to_process), items_embedded)
+
+        # Assemble the new version in page order
+        items = []
+        vectors = []
+        reused_texts = 0
+        reused_images = 0
+        old_vectors = index.vectors
+        for page in range(1, len(new_fingerprints) + 1):
+            if page in reused:
+                for item, row in old_items[reused[page]]:
+                    item = dict(item, page=page)
+                    items.append(item)
+                    vectors.append(old_vectors[row])
+                    if item['type'] == 'text':
+                        reused_texts += 1
+                    else:
+                        reused_images += 1
+            else:
+                for item in new_items[page]:
+                    vectors.append(item.pop('embedding'))
+                    items.append(item)
+        for chunk_id, item in enumerate(items):
+            item['chunk_id'] = chunk_id
+
+        new_index = self._new_index(index.dim)
+        new_index.add(vectors, [item['type'] for item in items], [item['page'] for item in items],
+                      range(len(items)))
+        lexical = LexicalIndex.from_items(enumerate(items))
+        with self.lock:
+            self.index = new_index
+            self.lexical = lexical
+            self.content_sequence = ContentStore(items)
+            self.page_fingerprints = new_fingerprints
+            self._content_changed()
+
+        report = {
+            'pages': len(new_fingerprints),
+            'previous_pages': len(old_fingerprints),
+            'pages_added': added,
+            'pages_removed': removed,
+            'pages_changed': changed,
+            'pages_reused': len(reused),
+            'items_reused': reused_texts + reused_images,
+            'items_embedded': items_embedded,
+            'embed_requests': self.embed_requests - requests_before,
+            # Requests a full re-ingestion would have needed for the reused items, without the cache
+            'embed_requests_saved': math.ceil(reused_texts / self.embed_batch_size) + reused_images,
+            'seconds': time.time() - started
+        }
+        STAGE_SECONDS.observe(report['seconds'], stage='revise_pdf')
+        logger.info(f"Revised document: {len(added)} pages added, {len(removed)} removed, "
+                    f"{len(changed)} changed, {len(reused)} reused")
+        return report
+
+    def search(self, query: str, top_k: int = 5, content_type: Optional[str] = None,
+               pages: Optional[List[int]] = None,
+               query_embedding: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """
+        Search through embedded content using a text query
+        content_type: optionally restrict results to 'text' or 'image' items
+        pages: optionally restrict results to these page numbers
+        query_embedding: precomputed query vector from embed_query
+        """
+        try:
+            if query_embedding is None:
+                query_embedding = self.embed_query(query)
+
+            index, _, content_sequence = self._snapshot()
             top_results = []
-            for similarity, idx in similarities[:top_k]:
-                result = self.content_sequence[idx].copy()
-                result.pop('embedding', None)
-                result['similarity_score'] = float(similarity)
+            with stage('vector_search', vectors=len(index)):
+                matches = index.search(query_embedding, top_k, content_type, pages)
+            for similarity, idx in matches:
+                result = content_sequence[idx]
+                result['similarity_score'] = similarity
                 top_results.append(result)
 
             return top_results
@@ -273,111 +803,284 @@ class PDFProcessorCohere:
             logger.error(f"Error during search: {str(e)}")
             return []
 
-    def rerank_search(self, query: str, top_k: int = 5, candidate_k: int = 30) -> List[Dict[str, Any]]:
-      """
-      Perform rerank using top candidate_k documents from embeddings
-      top_k: number of rerank results to return
-      candidate_k: number of top embedding candidates to rerank (must be <=1000)
-      """
-      try:
-        # 1️⃣ Embed the query
-        body = json.dumps({
-            "texts": [query],
-            "input_type": "search_document",
-            "embedding_types": ["float"]
-        })
-        query_response = self.bedrock_runtime.invoke_model(
-            body=body,
-            modelId=EMBEDDING_MODEL_ID,
-            contentType="application/json",
-            accept="*/*"
-        )
-        response_body = json.loads(query_response["body"].read())
-        query_embedding = response_body["embeddings"]["float"][0]
-
-        # 2️⃣ Compute similarity with all content chunks
-        similarities = []
-        for idx, item in enumerate(self.content_sequence):
-            if item['type'] == 'text' and 'embedding' in item:
-                similarity = np.dot(query_embedding, item['embedding'])
-                similarities.append((similarity, idx))
-
-        # 3️⃣ Pick top candidate_k chunks for rerank
-        similarities.sort(reverse=True)
-        top_candidates = similarities[:candidate_k]
+    async def asearch(self, query: str, top_k: int = 5, content_type: Optional[str] = None,
+                      pages: Optional[List[int]] = None,
+                      query_embedding: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """
+        Async variant of search
+        The vector search runs in a worker thread, so large indexes do not stall the event loop.
+        """
+        if query_embedding is None:
+            try:
+                query_embedding = await self.aembed_query(query)
+            except Exception as e:
+                logger.error(f"Error during search: {str(e)}")
+                return []
+        return await asyncio.to_thread(self.search, query, top_k, content_type, pages, query_embedding)
+
+    def rerank_items(self, query: str, items: List[Dict[str, Any]], top_k: int = 5,
+                     version: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Rerank text items with the Bedrock rerank model
+        Returns copies of the top_k items with a relevance_score, best first.
+        Every candidate is ranked and the ranking cached per query and ordered candidate
+        list, so a repeat with any top_k reuses it; identical concurrent requests share one call.
+        version: content version the items come from; defaults to this processor's
+        """
+        if not items:
+            return []
 
-        documents = [self.content_sequence[idx]['content'] for _, idx in top_candidates]
-        doc_mapping = [idx for _, idx in top_candidates]
+        rerank_package_arn = f"arn:aws:bedrock:{AWS_REGION}::foundation-model/{RERANK_MODEL_ID}"
+        with stage('rerank', candidates=len(items)) as span:
+            key = rerank_cache_key(query, rerank_package_arn, version or self.version, items)
+            ranking = self.rerank_cache.get(key)
+            span['cached'] = ranking is not None
+            if ranking is None:
+                ranking, span['shared'] = self.rerank_flight.do(
+                    key, lambda: self._rerank(query, items, rerank_package_arn, key))
+            return [item.copy() for item in ranking[:top_k]]
+
+    async def arerank_items(self, query: str, items: List[Dict[str, Any]], top_k: int = 5,
+                            version: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Async variant of rerank_items, sharing its cache"""
+        if not items:
+            return []
 
-        # 4️⃣ Build sources for rerank
+        rerank_package_arn = f"arn:aws:bedrock:{AWS_REGION}::foundation-model/{RERANK_MODEL_ID}"
+        with stage('rerank', candidates=len(items)) as span:
+            key = rerank_cache_key(query, rerank_package_arn, version or self.version, items)
+            ranking = self.rerank_cache.get(key)
+            span['cached'] = ranking is not None
+            if ranking is None:
+                ranking, span['shared'] = await self.rerank_flight.ado(
+                    key, lambda: self._arerank(query, items, rerank_package_arn, key))
+            return [item.copy() for item in ranking[:top_k]]
+
+    def _rerank(self, query: str, items: List[Dict[str, Any]], rerank_package_arn: str,
+                key: str) -> List[Dict[str, Any]]:
+        response = self.rate_limiter.call(RERANK_MODEL_ID, self.bedrock_agent_runtime.rerank,
+                                          **self._rerank_request(query, items, rerank_package_arn))
+        return self._rerank_ranking(items, response, key)
+
+    async def _arerank(self, query: str, items: List[Dict[str, Any]], rerank_package_arn: str,
+                       key: str) -> List[Dict[str, Any]]:
+        agent_runtime = await self._async_agent_runtime()
+        response = await self.rate_limiter.acall(RERANK_MODEL_ID, agent_runtime.rerank,
+                                                 **self._rerank_request(query, items, rerank_package_arn))
+        return self._rerank_ranking(items, response, key)
+
+    @staticmethod
+    def _rerank_request(query: str, items: List[Dict[str, Any]], rerank_package_arn: str) -> Dict[str, Any]:
+        """Arguments of a rerank call ranking every item, counted into the Bedrock metrics"""
+        # Build sources for rerank
         text_sources = [{"type": "INLINE",
                          "inlineDocumentSource": {"type": "TEXT",
-                                                  "textDocument": {"text": doc}}}
-                        for doc in documents]
-
-        # 5️⃣ Call rerank
-        rerank_package_arn = f"arn:aws:bedrock:{AWS_REGION}::foundation-model/{RERANK_MODEL_ID}"
-        response = self.bedrock_agent_runtime.rerank(
+                                                  "textDocument": {"text": item['content']}}}
+                        for item in items]
+
+        # Count the request
+        BEDROCK_INPUTS.inc(len(items), model=RERANK_MODEL_ID, kind='document')
+        BEDROCK_INPUTS.inc(model=RERANK_MODEL_ID, kind='query')
+        BEDROCK_TOKENS.inc(approx_token_count(query) + sum(approx_token_count(item['content']) for item in items),
+                           model=RERANK_MODEL_ID, direction='input')
+        BEDROCK_BYTES.inc(len(query) + sum(len(item['content']) for item in items),
+                          model=RERANK_MODEL_ID, direction='sent')
+        return dict(
             queries=[{"type": "TEXT", "textQuery": {"text": query}}],
             sources=text_sources,
             rerankingConfiguration={
                 "type": "BEDROCK_RERANKING_MODEL",
                 "bedrockRerankingConfiguration": {
-                    "numberOfResults": min(top_k, len(documents)),
+                    "numberOfResults": len(items),
                     "modelConfiguration": {"modelArn": rerank_package_arn}
                 }
             }
         )
 
-        # 6️⃣ Format results
+    def _rerank_ranking(self, items: List[Dict[str, Any]], response: Dict[str, Any],
+                        key: str) -> List[Dict[str, Any]]:
+        """Copies of items in the order of a rerank response, cached under key"""
+        # Format results
         results = []
         for result in response['results']:
-            idx = doc_mapping[result['index']]
-            item = self.content_sequence[idx].copy()
-            item.pop('embedding', None)
+            item = items[result['index']].copy()
             item['relevance_score'] = float(result['relevanceScore'])
             results.append(item)
 
+        self.rerank_cache.put(key, results)
         return results
 
+    def lexical_search(self, query: str, top_k: int = 5,
+                       pages: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+        """
+        Search text items by BM25 over their terms, without calling Bedrock
+        pages: optionally restrict results to these page numbers
+        """
+        try:
+            _, lexical, content_sequence = self._snapshot()
+            allowed = None
+            if pages is not None:
+                pages = set(pages)
+                allowed = lambda idx: content_sequence.page(idx) in pages
+            results = []
+            with stage('lexical_search', chunks=len(lexical)):
+                matches = lexical.search(query, top_k, allowed)
+            for score, idx in matches:
+                result = content_sequence[idx]
+                result['bm25_score'] = score
+                results.append(result)
+            return results
+        except Exception as e:
+            logger.error(f"Error during lexical search: {str(e)}")
+            return []
+
+    def hybrid_candidates(self, query: str, candidate_k: int = 30,
+                          query_embedding: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """
+        Top candidate_k text items by reciprocal rank fusion of vector and BM25 rankings
+        Each ranking contributes its top candidate_k; items carry similarity_score,
+        bm25_score or both, and their fusion_score.
+        """
+        dense = self.search(query, candidate_k, content_type='text', query_embedding=query_embedding)
+        lexical = self.lexical_search(query, candidate_k)
+        return reciprocal_rank_fusion([dense, lexical], key=lambda item: item['chunk_id'], limit=candidate_k)
+
+    async def ahybrid_candidates(self, query: str, candidate_k: int = 30,
+                                 query_embedding: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """Async variant of hybrid_candidates, running the vector and BM25 searches concurrently"""
+        dense, lexical = await asyncio.gather(
+            self.asearch(query, candidate_k, content_type='text', query_embedding=query_embedding),
+            asyncio.to_thread(self.lexical_search, query, candidate_k))
+        return reciprocal_rank_fusion([dense, lexical], key=lambda item: item['chunk_id'], limit=candidate_k)
+
+    def rerank_search(self, query: str, top_k: int = 5, candidate_k: int = 30,
+                      query_embedding: Optional[np.ndarray] = None,
+                      hybrid: Optional[bool] = None) -> List[Dict[str, Any]]:
+      """
+      Perform rerank using top candidate_k documents from embeddings
+      top_k: number of rerank results to return
+      candidate_k: number of top embedding candidates to rerank (must be <=1000)
+      query_embedding: precomputed query vector from embed_query
+      hybrid: fuse BM25 candidates with the embedding candidates; defaults to hybrid_search
+      """
+      try:
+        # 1️⃣ Embed the query
+        if query_embedding is None:
+            query_embedding = self.embed_query(query)
+
+        # 2️⃣ Pick top candidate_k text chunks by embedding similarity, fused with BM25 matches
+        if self.hybrid_search if hybrid is None else hybrid:
+            candidates = self.hybrid_candidates(query, candidate_k, query_embedding)
+        else:
+            candidates = self.search(query, candidate_k, content_type='text', query_embedding=query_embedding)
+
+        # 3️⃣ Rerank the candidates
+        return self.rerank_items(query, candidates, top_k)
+
       except Exception as e:
         logger.error(f"Error during rerank search: {str(e)}")
         logger.exception("Full traceback:")
         return []
 
-    def chat_query(self, query: str, context_results: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
-        """Enhanced chat query that returns answer with relevant images"""
+    async def arerank_search(self, query: str, top_k: int = 5, candidate_k: int = 30,
+                             query_embedding: Optional[np.ndarray] = None,
+                             hybrid: Optional[bool] = None) -> List[Dict[str, Any]]:
+        """Async variant of rerank_search"""
         try:
-            # Use rerank results for context if not provided
-            if context_results is None:
-                search_results = self.search_with_toggle(query, use_rerank=True)
-                context_results = search_results['rerank_results']
-                embed_results = search_results['embed_results']
+            if query_embedding is None:
+                query_embedding = await self.aembed_query(query)
+            if self.hybrid_search if hybrid is None else hybrid:
+                candidates = await self.ahybrid_candidates(query, candidate_k, query_embedding)
             else:
-                embed_results = self.search(query)
+                candidates = await self.asearch(query, candidate_k, content_type='text',
+                                                query_embedding=query_embedding)
+            return await self.arerank_items(query, candidates, top_k)
 
-            text_context = []
-            images = []
+        except Exception as e:
+            logger.error(f"Error during rerank search: {str(e)}")
+            logger.exception("Full traceback:")
+            return []
 
-            for item in context_results:
-                if item['type'] == 'text':
-                    text_context.append(f"Content from page {item['page']}: {item['content']}")
+    def get_chat_client(self):
+        """Return the client used for chat"""
+        if self.chat_client is not None:
+            return self.chat_client
+        # Shares the process-wide bedrock-runtime client
+        return get_bedrock_clients().chat()
+
+    def _prepare_chat(self, query: str, context_results: Optional[List[Dict[str, Any]]] = None,
+                      embed_results: Optional[List[Dict[str, Any]]] = None):
+        """Retrieve context for a chat query and build the prompt, related images and sources"""
+        # Use rerank results for context if not provided
+        if context_results is None:
+            search_results = self.search_with_toggle(query, use_rerank=True)
+            context_results = search_results['rerank_results']
+            embed_results = search_results['embed_results']
+        elif embed_results is None:
+            embed_results = self.search(query, query_embedding=self.embed_query(query))
+        return self._chat_prompt(query, context_results, embed_results)
+
+    async def _aprepare_chat(self, query: str, context_results: Optional[List[Dict[str, Any]]] = None,
+                             embed_results: Optional[List[Dict[str, Any]]] = None):
+        """Async variant of _prepare_chat; the rerank context and the image search run concurrently"""
+        lookups = {}
+        if context_results is None or embed_results is None:
+            query_embedding = await self.aembed_query(query)
+            if context_results is None:
+                lookups['context'] = self.arerank_search(query, query_embedding=query_embedding)
+            if embed_results is None:
+                lookups['images'] = self.asearch(query, query_embedding=query_embedding)
+        found = dict(zip(lookups, await asyncio.gather(*lookups.values())))
+        return self._chat_prompt(query, found.get('context', context_results), found.get('images', embed_results))
+
+    @staticmethod
+    def _chat_prompt(query: str, context_results: List[Dict[str, Any]], embed_results: List[Dict[str, Any]]):
+        """The chat prompt from the context items, plus related images and sources"""
+        text_context = []
+        images = []
+
+        for item in context_results:
+            if item['type'] == 'text':
+                text_context.append(f"Content from page {item['page']}: {item['content']}")
+
+        for item in embed_results:
+            if item['type'] == 'image':
+                images.append({
+                    'page': item['page'],
+                    'format': item['format'],
+                    'blob_key': item['blob_key'],
+                    'similarity_score': item.get('similarity_score', 0)
+                })
+
+        context = "\n\n".join(text_context)
+        message = f"Based on the following context, please answer this question: {query}\n\nContext:\n{context}"
 
-            for item in embed_results:
-                if item['type'] == 'image':
-                    images.append({
-                        'page': item['page'],
-                        'format': item['format'],
-                        'base64_data': item['base64_data'],
-                        'similarity_score': item.get('similarity_score', 0)
-                    })
+        sources = [
+            {
+                'page': item['page'],
+                'type': item['type'],
+                'content': item.get('content', '[Image]') if item['type'] == 'text' else '[Image]',
+                'similarity_score': item.get('similarity_score', 0)
+            }
+            for item in context_results
+        ]
+        return message, images, sources
 
-            context = "\n\n".join(text_context)
-            message = f"Based on the following context, please answer this question: {query}\n\nContext:\n{context}"
+    def chat_query(self, query: str, context_results: Optional[List[Dict[str, Any]]] = None,
+                   embed_results: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """
+        Enhanced chat query that returns answer with relevant images
+        context_results: text items to answer from; retrieved from this document if omitted
+        embed_results: embedding search results to take related images from
+        """
+        try:
+            with stage('chat_retrieval'):
+                message, images, sources = self._prepare_chat(query, context_results, embed_results)
 
-            ## Using Cohere's AWS SDK
-            co = cohere_aws.Client(mode=cohere_aws.Mode.BEDROCK)
-            response = co.chat(message=message, model_id=CHAT_MODEL_ID, stream=False)
+            co = self.get_chat_client()
+            with stage('chat'):
+                response = self.rate_limiter.call(CHAT_MODEL_ID, co.chat,
+                                                  message=message, model_id=CHAT_MODEL_ID, stream=False)
 
             # Process the response
             answer_text = "No response generated"
@@ -387,19 +1090,12 @@ class PDFProcessorCohere:
                     answer_text = ' '.join(item.text for item in content if hasattr(item, 'text'))
                 else:
                     answer_text = str(content)
+            self._count_chat(message, answer_text)
 
             result = {
                 'answer': answer_text,
                 'images': images,
-                'sources': [
-                    {
-                        'page': item['page'],
-                        'type': item['type'],
-                        'content': item.get('content', '[Image]') if item['type'] == 'text' else '[Image]',
-                        'similarity_score': item.get('similarity_score', 0)
-                    }
-                    for item in context_results
-                ]
+                'sources': sources
             }
 
             logger.info(f"Chat query completed successfully")
@@ -413,25 +1109,184 @@ class PDFProcessorCohere:
                 'sources': []
             }
 
+    async def achat_query(self, query: str, context_results: Optional[List[Dict[str, Any]]] = None,
+                          embed_results: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """
+        Async variant of chat_query
+        The chat request goes straight to the model through the async bedrock-runtime
+        client, so chat_client is not used.
+        """
+        try:
+            with stage('chat_retrieval'):
+                message, images, sources = await self._aprepare_chat(query, context_results, embed_results)
+
+            runtime = await self._async_runtime()
+            with stage('chat'):
+                response = await self.rate_limiter.acall(CHAT_MODEL_ID, runtime.invoke_model,
+                                                         body=json.dumps({"message": message}),
+                                                         modelId=CHAT_MODEL_ID,
+                                                         contentType="application/json",
+                                                         accept="*/*")
+                async with response["body"] as stream:
+                    response_body = json.loads(await stream.read())
+
+            answer_text = response_body.get('text') or "No response generated"
+            self._count_chat(message, answer_text)
+
+            logger.info(f"Chat query completed successfully")
+            return {
+                'answer': answer_text,
+                'images': images,
+                'sources': sources
+            }
+
+        except Exception as e:
+            logger.error(f"Error during chat query: {str(e)}")
+            return {
+                'answer': f"Error processing query: {str(e)}",
+                'images': [],
+                'sources': []
+            }
+
+    @staticmethod
+    def _count_chat(message: str, answer: str) -> None:
+        BEDROCK_BYTES.inc(len(message.encode('utf-8')), model=CHAT_MODEL_ID, direction='sent')
+        BEDROCK_BYTES.inc(len(answer.encode('utf-8')), model=CHAT_MODEL_ID, direction='received')
+        BEDROCK_TOKENS.inc(approx_token_count(message), model=CHAT_MODEL_ID, direction='input')
+        BEDROCK_TOKENS.inc(approx_token_count(answer), model=CHAT_MODEL_ID, direction='output')
+
+    def chat_query_stream(self, query: str,
+                          context_results: Optional[List[Dict[str, Any]]] = None,
+                          embed_results: Optional[List[Dict[str, Any]]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Streaming variant of chat_query
+        Yields a 'context' event with images and sources as soon as retrieval finishes,
+        then one 'token' event per generated text fragment and a final 'done' event
+        with the full answer. Failures are reported as an 'error' event.
+        """
+        try:
+            message, images, sources = self._prepare_chat(query, context_results, embed_results)
+            yield {'event': 'context', 'images': images, 'sources': sources}
+
+            co = self.get_chat_client()
+            answer_parts = []
+            started = time.perf_counter()
+            stream = self.rate_limiter.call(CHAT_MODEL_ID, co.chat,
+                                            message=message, model_id=CHAT_MODEL_ID, stream=True)
+            for event in stream:
+                # Only text-generation events carry answer tokens
+                if getattr(event, 'event_type', 'text-generation') != 'text-generation':
+                    continue
+                text = getattr(event, 'text', None)
+                if text:
+                    if not answer_parts:
+                        STAGE_SECONDS.observe(time.perf_counter() - started, stage='chat_first_token')
+                    answer_parts.append(text)
+                    yield {'event': 'token', 'text': text}
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage='chat_stream')
+
+            answer_text = ''.join(answer_parts) or "No response generated"
+            self._count_chat(message, answer_text)
+            logger.info(f"Streaming chat query completed successfully")
+            yield {'event': 'done', 'answer': answer_text}
+
+        except Exception as e:
+            logger.error(f"Error during streaming chat query: {str(e)}")
+            yield {'event': 'error', 'error': f"Error processing query: {str(e)}"}
+
     def save_results(self, output_dir: str):
-        """Save processed content and embeddings"""
+        """
+        Save processed content and embeddings
+        Writes content_sequence.jsonl (one item per line), the embedding matrix as
+        embeddings.npy, the index metadata columns and the page fingerprints, so
+        load_results can restore the document without calling Bedrock again.
+        """
         try:
             os.makedirs(output_dir, exist_ok=True)
-            sequence_for_save = []
-            for item in self.content_sequence:
-                item_copy = item.copy()
-                item_copy.pop('embedding', None)
-                sequence_for_save.append(item_copy)
-
-            with open(os.path.join(output_dir, 'content_sequence.json'), 'w') as f:
-                import json
-                json.dump(sequence_for_save, f, indent=2)
+            index, lexical, content_sequence = self._snapshot()
+            content_path = os.path.join(output_dir, CONTENT_FILE)
+            with open(content_path + '.tmp', 'w') as f:
+                for item in content_sequence:
+                    f.write(json.dumps(item, separators=(',', ':')))
+                    f.write('\n')
+            os.replace(content_path + '.tmp', content_path)
+
+            index.save(output_dir)
+            if self.vector_precision != 'float32':
+                # Only rescoring reads the float vectors, so leave them on disk
+                index.map_vectors(output_dir)
+            lexical.save(output_dir)
+
+            with open(os.path.join(output_dir, FINGERPRINTS_FILE), 'w') as f:
+                json.dump(self.page_fingerprints, f)
+
+            with open(os.path.join(output_dir, MANIFEST_FILE), 'w') as f:
+                json.dump({
+                    'version': STORE_VERSION,
+                    'embedding_model_id': EMBEDDING_MODEL_ID,
+                    'items': len(content_sequence),
+                    'vectors': len(index),
+                    'dim': index.dim
+                }, f)
 
             logger.info(f"Results saved successfully to {output_dir}")
 
         except Exception as e:
             logger.error(f"Error saving results: {str(e)}")
 
+    def load_results(self, input_dir: str, mmap: bool = True) -> ContentStore:
+        """
+        Load content and embeddings written by save_results
+        mmap: memory-map the embedding matrix instead of reading it into RAM
+        """
+        try:
+            with open(os.path.join(input_dir, MANIFEST_FILE)) as f:
+                manifest = json.load(f)
+            if manifest.get('version') not in (1, STORE_VERSION):
+                raise ValueError(f"Unsupported store version: {manifest.get('version')}")
+            if manifest.get('embedding_model_id') != EMBEDDING_MODEL_ID:
+                raise ValueError(f"Store was built with {manifest.get('embedding_model_id')}, "
+                                 f"expected {EMBEDDING_MODEL_ID}")
+
+            with open(os.path.join(input_dir, CONTENT_FILE)) as f:
+                content_sequence = [json.loads(line) for line in f]
+            for item in content_sequence:
+                if 'bbox' in item:
+                    item['bbox'] = tuple(item['bbox'])
+                if 'base64_data' in item:
+                    # Version 1 stores inlined image bytes; move them to the blob store
+                    item['blob_key'] = self.blob_store.put(base64.b64decode(item.pop('base64_data')),
+                                                           item['format'])
+
+            # Stores written before revisions were supported have no fingerprints
+            fingerprints_path = os.path.join(input_dir, FINGERPRINTS_FILE)
+            fingerprints = []
+            if os.path.exists(fingerprints_path):
+                with open(fingerprints_path) as f:
+                    fingerprints = json.load(f)
+
+            index = self.index_class.load(input_dir, mmap=mmap, precision=self.vector_precision,
+                                          rescore_factor=self.rescore_factor, **self.index_options)
+            try:
+                lexical = LexicalIndex.load(input_dir)
+            except FileNotFoundError:
+                # Saved before hybrid search; index the text items that have vectors
+                indexed = set(int(item_id) for item_id in index.ids)
+                lexical = LexicalIndex.from_items((item_id, item) for item_id, item in enumerate(content_sequence)
+                                                  if item_id in indexed)
+            with self.lock:
+                self.index = index
+                self.lexical = lexical
+                self.content_sequence = ContentStore(content_sequence)
+                self.page_fingerprints = fingerprints
+                self._content_changed()
+            logger.info(f"Loaded {len(content_sequence)} items from {input_dir}")
+            return self.content_sequence
+
+        except Exception as e:
+            logger.error(f"Error loading results: {str(e)}")
+            raise
+
     def search_with_toggle(self, query: str, use_rerank: bool = False, top_k: int = 5) -> Dict[str, Any]:
         """
         Search through content with toggle for rerank
@@ -441,15 +1296,17 @@ class PDFProcessorCohere:
             top_k: Number of top results to return
         """
         try:
+            # Embed the query once and share the vector between both retrievals
+            query_embedding = self.embed_query(query)
             results = {
-                'embed_results': self.search(query, top_k),
+                'embed_results': self.search(query, top_k, query_embedding=query_embedding),
                 'rerank_results': None,  # Default to None when rerank is not used
                 'search_type': 'embedding' if not use_rerank else 'both'
             }
 
             # If rerank is toggled on, include rerank results
             if use_rerank:
-                results['rerank_results'] = self.rerank_search(query, top_k)
+                results['rerank_results'] = self.rerank_search(query, top_k, query_embedding=query_embedding)
 
             # Add summary stats
             results['stats'] = {
@@ -479,7 +1336,18 @@ class PDFProcessorCohere:
             for idx, item in enumerate(content_sequence):
                 item['chunk_id'] = idx
 
-            self.content_sequence = content_sequence
-            # Rest of the processing code remains the same
+            # Rebuild the index from items that carry embeddings
+            index = self._new_index()
+            indexed = [idx for idx, item in enumerate(content_sequence) if 'embedding' in item]
+            index.add([content_sequence[idx].pop('embedding') for idx in indexed],
+                      [content_sequence[idx]['type'] for idx in indexed],
+                      [content_sequence[idx]['page'] for idx in indexed],
+                      indexed)
+            lexical = LexicalIndex.from_items((idx, content_sequence[idx]) for idx in indexed)
+            with self.lock:
+                self.index = index
+                self.lexical = lexical
+                self.content_sequence = ContentStore(content_sequence)
+                self._content_changed()
         except Exception as e:
             logger.error(f"Error processing content: {str(e)}")
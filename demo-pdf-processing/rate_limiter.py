@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from metrics import BEDROCK_CALL_SECONDS, RATE_LIMIT_BACKOFF_SECONDS, RATE_LIMIT_WAIT_SECONDS, THROTTLES
+
+logger = logging.getLogger(__name__)
+
+# Error codes Bedrock and botocore use for throttling
+THROTTLING_ERROR_CODES = {
+    'ThrottlingException',
+    'TooManyRequestsException',
+    'ServiceUnavailableException',
+    'ModelNotReadyException',
+}
+
+
+class ThrottlingRetriesExhausted(Exception):
+    """A call was still throttled after every retry"""
+
+
+def is_throttling_error(error: Exception) -> bool:
+    """True for botocore throttling errors and HTTP 429 responses"""
+    response = getattr(error, 'response', None)
+    if isinstance(response, dict):
+        code = response.get('Error', {}).get('Code')
+        status = response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+        if code in THROTTLING_ERROR_CODES or status == 429:
+            return True
+    if getattr(error, 'status_code', None) == 429:
+        return True
+    return type(error).__name__ in THROTTLING_ERROR_CODES
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket with an adaptive rate
+    Callers reserve tokens and sleep off any deficit, so waiting callers are served in
+    arrival order without polling. The rate halves on every throttle and recovers
+    additively on success, up to the configured maximum.
+    """
+
+    def __init__(self, rate: float, burst_seconds: float = 10.0, min_rate: Optional[float] = None):
+        """
+        rate: maximum sustained requests per second
+        burst_seconds: how many seconds of requests may be sent back to back
+        min_rate: floor for the adaptive rate
+        """
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate or rate / 20
+        self.capacity = max(1.0, rate * burst_seconds)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.throttles = 0
+        self.wait_seconds = 0.0
+
+    def _reserve(self, tokens: float) -> float:
+        """Take tokens, going into debt if necessary, and return how long to wait"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= tokens
+            self.requests += 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            self.wait_seconds += wait
+            return wait
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Block until tokens are available; returns the seconds waited"""
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, tokens: float = 1.0) -> float:
+        """Like acquire, but yields to the event loop while waiting"""
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def on_throttle(self) -> None:
+        with self.lock:
+            self.throttles += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            # Drop any burst allowance so the lower rate applies immediately
+            self.tokens = min(self.tokens, 0.0)
+
+    def on_success(self) -> None:
+        with self.lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 50)
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            return {
+                'rate_per_minute': self.rate * 60,
+                'max_rate_per_minute': self.max_rate * 60,
+                'requests': self.requests,
+                'throttles': self.throttles,
+                'wait_seconds': self.wait_seconds
+            }
+
+
+class BedrockRateLimiter:
+    """
+    Per-model request budgets shared by every Bedrock call site
+    call/acall wait for a token from the key's bucket, then retry throttling errors with
+    full-jitter exponential backoff while the bucket adapts its rate. Keys without a
+    budget are not rate limited but still retried.
+    """
+
+    def __init__(self, budgets: Dict[str, float], max_retries: int = 8,
+                 base_backoff: float = 0.5, max_backoff: float = 30.0):
+        """
+        budgets: requests per minute for each key (usually a model ID)
+        max_retries: retries of a throttled call before giving up
+        """
+        self.buckets = {key: TokenBucket(per_minute / 60) for key, per_minute in budgets.items()}
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+    def bucket(self, key: str) -> Optional[TokenBucket]:
+        return self.buckets.get(key)
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+
+    def _throttled(self, key: str, bucket: Optional[TokenBucket], attempt: int, error: Exception) -> float:
+        """Record a throttle and return the backoff delay, or raise once retries run out"""
+        THROTTLES.inc(budget=key)
+        if bucket:
+            bucket.on_throttle()
+        if attempt >= self.max_retries:
+            raise ThrottlingRetriesExhausted(f"{key} still throttled after {attempt} retries") from error
+        delay = self._backoff(attempt)
+        RATE_LIMIT_BACKOFF_SECONDS.inc(delay, budget=key)
+        logger.warning(f"Throttled by {key}, retrying in {delay:.2f} seconds")
+        return delay
+
+    def call(self, key: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Call fn under the key's budget, retrying throttling errors"""
+        bucket = self.bucket(key)
+        attempt = 0
+        while True:
+            if bucket:
+                RATE_LIMIT_WAIT_SECONDS.observe(bucket.acquire(), budget=key)
+            started = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                throttled = is_throttling_error(e)
+                BEDROCK_CALL_SECONDS.observe(time.perf_counter() - started, budget=key,
+                                             outcome='throttled' if throttled else 'error')
+                if not throttled:
+                    raise
+                time.sleep(self._throttled(key, bucket, attempt, e))
+                attempt += 1
+                continue
+            BEDROCK_CALL_SECONDS.observe(time.perf_counter() - started, budget=key, outcome='ok')
+            if bucket:
+                bucket.on_success()
+            return result
+
+    async def acall(self, key: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Async variant of call for coroutine functions"""
+        bucket = self.bucket(key)
+        attempt = 0
+        while True:
+            if bucket:
+                RATE_LIMIT_WAIT_SECONDS.observe(await bucket.acquire_async(), budget=key)
+            started = time.perf_counter()
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                throttled = is_throttling_error(e)
+                BEDROCK_CALL_SECONDS.observe(time.perf_counter() - started, budget=key,
+                                             outcome='throttled' if throttled else 'error')
+                if not throttled:
+                    raise
+                await asyncio.sleep(self._throttled(key, bucket, attempt, e))
+                attempt += 1
+                continue
+            BEDROCK_CALL_SECONDS.observe(time.perf_counter() - started, budget=key, outcome='ok')
+            if bucket:
+                bucket.on_success()
+            return result
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {key: bucket.stats() for key, bucket in self.buckets.items()}
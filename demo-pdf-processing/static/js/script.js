@@ -8,9 +8,13 @@ document.addEventListener('DOMContentLoaded', function() {
     const loading = document.getElementById('loading');
     
     let currentFile = null;
+    let currentDocumentId = null;
+    let searchInitialized = false;
     let chunkSize = 1024 * 1024 * 5; // 5MB chunks
-    let currentChunk = 0;
+    let currentUpload = null;
+    let pendingChunks = [];
     let totalChunks = 0;
+    const maxChunkRetries = 3;
 
     // Drag and drop handlers
     dropZone.addEventListener('dragover', (e) => {
@@ -49,48 +53,94 @@ document.addEventListener('DOMContentLoaded', function() {
         }
 
         currentFile = file;
-        totalChunks = Math.ceil(file.size / chunkSize);
-        currentChunk = 0;
         
         showProgress();
-        uploadNextChunk();
+        openUpload();
     }
 
-    function uploadNextChunk() {
-        const start = currentChunk * chunkSize;
-        const end = Math.min(start + chunkSize, currentFile.size);
-        const chunk = currentFile.slice(start, end);
-        const formData = new FormData();
-        
-        formData.append('file', chunk);
-        formData.append('chunk', currentChunk);
-        formData.append('totalChunks', totalChunks);
-        formData.append('filename', currentFile.name);
-
-        fetch('/upload-chunk', {
+    // Open or resume an upload session; only chunks the server does not have are sent
+    function openUpload() {
+        fetch('/uploads', {
             method: 'POST',
-            body: formData
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+                filename: currentFile.name,
+                fileSize: currentFile.size,
+                chunkSize: chunkSize,
+                lastModified: currentFile.lastModified
+            })
         })
         .then(response => response.json())
         .then(data => {
             if (data.error) {
                 throw new Error(data.error);
             }
-            
-            updateProgress((currentChunk + 1) / totalChunks * 100);
-            
-            if (currentChunk < totalChunks - 1) {
-                currentChunk++;
-                uploadNextChunk();
-            } else {
-                finalizeMerge();
+            currentUpload = data;
+            totalChunks = data.total_chunks;
+            const received = new Set(data.received_chunks);
+            pendingChunks = [];
+            for (let i = 0; i < totalChunks; i++) {
+                if (!received.has(i)) {
+                    pendingChunks.push(i);
+                }
             }
+            updateProgress(received.size / totalChunks * 100);
+            uploadNextChunk(0);
         })
         .catch(error => {
             showError('Upload failed: ' + error.message);
         });
     }
 
+    function chunkChecksum(chunk) {
+        // crypto.subtle is only available on secure origins such as localhost
+        if (!window.crypto || !window.crypto.subtle) {
+            return Promise.resolve(null);
+        }
+        return chunk.arrayBuffer()
+            .then(buffer => crypto.subtle.digest('SHA-256', buffer))
+            .then(hash => Array.from(new Uint8Array(hash))
+                .map(b => b.toString(16).padStart(2, '0')).join(''));
+    }
+
+    function uploadNextChunk(attempt) {
+        if (pendingChunks.length === 0) {
+            finalizeMerge();
+            return;
+        }
+
+        const chunkNumber = pendingChunks[0];
+        const start = chunkNumber * chunkSize;
+        const end = Math.min(start + chunkSize, currentFile.size);
+        const chunk = currentFile.slice(start, end);
+
+        chunkChecksum(chunk)
+        .then(checksum => fetch(`/uploads/${currentUpload.upload_id}/chunks/${chunkNumber}`, {
+            method: 'PUT',
+            headers: checksum ? { 'X-Chunk-Checksum': checksum } : {},
+            body: chunk
+        }))
+        .then(response => response.json())
+        .then(data => {
+            if (data.error) {
+                throw new Error(data.error);
+            }
+            pendingChunks.shift();
+            updateProgress((totalChunks - pendingChunks.length) / totalChunks * 100);
+            uploadNextChunk(0);
+        })
+        .catch(error => {
+            // Chunks are idempotent, so a failed one is simply sent again
+            if (attempt < maxChunkRetries) {
+                setTimeout(() => uploadNextChunk(attempt + 1), 1000 * (attempt + 1));
+                return;
+            }
+            showError('Upload failed: ' + error.message);
+        });
+    }
+
     function finalizeMerge() {
         fetch('/finalize-upload', {
             method: 'POST',
@@ -98,10 +148,53 @@ document.addEventListener('DOMContentLoaded', function() {
                 'Content-Type': 'application/json'
             },
             body: JSON.stringify({
-                filename: currentFile.name
+                upload_id: currentUpload.upload_id
             })
         })
         .then(response => response.json())
+        .then(data => {
+            if (data.error) {
+                throw new Error(data.error);
+            }
+            currentDocumentId = data.document_id;
+            updateProgress(0);
+            pollJob(data.status_url, false);
+        })
+        .catch(error => {
+            showError('Processing failed: ' + error.message);
+        });
+    }
+
+    // Poll ingestion progress; search opens as soon as the first pages are indexed
+    function pollJob(statusUrl, searchShown) {
+        fetch(statusUrl)
+        .then(response => response.json())
+        .then(job => {
+            if (job.error) {
+                throw new Error(job.error);
+            }
+            if (job.total_pages) {
+                updateProgress(job.pages_done / job.total_pages * 100);
+            }
+            if (job.status === 'done') {
+                loadDocument();
+                return;
+            }
+            if (!searchShown && job.items_embedded > 0) {
+                searchSection.classList.remove('hidden');
+                initializeSearch();
+                searchShown = true;
+            }
+            setTimeout(() => pollJob(statusUrl, searchShown), 1000);
+        })
+        .catch(error => {
+            showError('Processing failed: ' + error.message);
+        });
+    }
+
+    function loadDocument() {
+        fetch(`/documents/${currentDocumentId}`)
+        .then(response => response.json())
         .then(data => {
             if (data.error) {
                 throw new Error(data.error);
@@ -154,6 +247,11 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     function initializeSearch() {
+        // Listeners are attached once, even when search opens before processing finishes
+        if (searchInitialized) {
+            return;
+        }
+        searchInitialized = true;
         const searchForm = document.getElementById('searchForm');
         const chatForm = document.getElementById('chatForm');
 
@@ -188,7 +286,8 @@ document.addEventListener('DOMContentLoaded', function() {
             },
             body: JSON.stringify({ 
                 query,
-                use_rerank: useRerank 
+                use_rerank: useRerank,
+                document_ids: [currentDocumentId]
             })
         })
         .then(response => response.json())
@@ -207,16 +306,20 @@ document.addEventListener('DOMContentLoaded', function() {
         const loading = document.getElementById('loading');
         loading.classList.remove('hidden');
         
-        fetch('/chat', {
+        fetch('/chat/stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
             },
-            body: JSON.stringify({ query })
+            body: JSON.stringify({ query, document_ids: [currentDocumentId] })
         })
-        .then(response => response.json())
-        .then(data => {
-            displayChatResponse(data);
+        .then(response => {
+            if (!response.ok || !response.body) {
+                return response.json().then(data => {
+                    throw new Error(data.error || 'Streaming not available');
+                });
+            }
+            return readEventStream(response.body, handleChatEvent);
         })
         .catch(error => {
             showError('Chat query failed: ' + error.message);
@@ -226,7 +329,53 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
+    // Parse a server-sent event stream and pass each event's JSON payload to onEvent
+    async function readEventStream(body, onEvent) {
+        const reader = body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) {
+                break;
+            }
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                const dataLines = rawEvent.split('\n')
+                    .filter(line => line.startsWith('data: '))
+                    .map(line => line.slice(6));
+                if (dataLines.length > 0) {
+                    onEvent(JSON.parse(dataLines.join('\n')));
+                }
+            }
+        }
+    }
+
+    function handleChatEvent(event) {
+        if (event.event === 'context') {
+            // Sources and images arrive before generation starts
+            loading.classList.add('hidden');
+            displayChatResponse({ answer: '', images: event.images, sources: event.sources });
+        } else if (event.event === 'token') {
+            document.getElementById('chatAnswerText').textContent += event.text;
+        } else if (event.event === 'done') {
+            document.getElementById('chatAnswerText').textContent = event.answer;
+        } else if (event.event === 'error') {
+            showError('Chat query failed: ' + event.error);
+        }
+    }
+
     // Display Functions
+    function blobUrl(key, size) {
+        // Images are served by content key; size requests a cached thumbnail
+        return `/blobs/${encodeURIComponent(key)}` + (size ? `?size=${size}` : '');
+    }
+
     function displayContentSequence(sequence) {
         const container = document.getElementById('contentSequence');
         container.innerHTML = '';
@@ -243,7 +392,7 @@ document.addEventListener('DOMContentLoaded', function() {
             } else if (item.type === 'image') {
                 itemDiv.innerHTML = `
                     <p class="text-sm text-gray-500">Page ${item.page} - Image</p>
-                    <img src="data:image/${item.format};base64,${item.base64_data}" 
+                    <img src="${blobUrl(item.blob_key)}" loading="lazy"
                          class="mt-2 max-w-full h-auto" 
                          alt="Page ${item.page} Image ${item.index}">
                 `;
@@ -286,7 +435,7 @@ document.addEventListener('DOMContentLoaded', function() {
                                     <td class="px-4 py-4 whitespace-nowrap text-sm text-gray-500">${result.chunk_id}</td>
                                     <td class="px-4 py-4 whitespace-nowrap text-sm text-gray-500">${result.page}</td>
                                     <td class="px-4 py-4 text-sm text-gray-900">${result.type === 'text' ? result.content : 
-                                        `<img src="data:image/${result.format};base64,${result.base64_data}" class="max-h-32 w-auto">`}</td>
+                                        `<a href="${blobUrl(result.blob_key)}" target="_blank"><img src="${blobUrl(result.blob_key, 256)}" loading="lazy" class="max-h-32 w-auto"></a>`}</td>
                                 </tr>
                             `).join('')}
                         </tbody>
@@ -337,7 +486,7 @@ document.addEventListener('DOMContentLoaded', function() {
             <div class="space-y-4">
                 <!-- Answer -->
                 <div class="prose max-w-none">
-                    <p>${response.answer}</p>
+                    <p id="chatAnswerText">${response.answer}</p>
                 </div>
 
                 <!-- Related Images (if any) -->
@@ -347,9 +496,11 @@ document.addEventListener('DOMContentLoaded', function() {
                         <div class="grid grid-cols-1 sm:grid-cols-2 md:grid-cols-3 gap-4">
                             ${response.images.map(img => `
                                 <div class="border rounded-lg p-2">
-                                    <img src="data:image/${img.format};base64,${img.base64_data}" 
+                                    <a href="${blobUrl(img.blob_key)}" target="_blank">
+                                    <img src="${blobUrl(img.blob_key, 512)}" loading="lazy"
                                          class="max-h-48 w-auto mx-auto"
                                          alt="Related image from page ${img.page}">
+                                    </a>
                                     <p class="text-sm text-gray-500 mt-1 text-center">Page ${img.page}</p>
                                 </div>
                             `).join('')}
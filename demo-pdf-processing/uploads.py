@@ -0,0 +1,282 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Any, BinaryIO, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PDF_MAGIC = b'%PDF-'
+COPY_BLOCK_SIZE = 1024 * 1024  # Bytes copied from the request stream at a time
+
+
+class UploadError(ValueError):
+    """A chunk or upload was rejected; maps to HTTP 400"""
+
+
+class UploadSession:
+    """
+    One file being uploaded in chunks
+    Chunks are written straight to their offset in a single preallocated part file, so
+    they may arrive out of order, be retried, or be resumed after a dropped connection.
+    The file's SHA-256 is advanced as chunks become contiguous, so it is known as soon
+    as the last chunk lands.
+    """
+
+    def __init__(self, upload_id: str, filename: str, path: str, total_chunks: int,
+                 chunk_size: int, file_size: Optional[int], timeout: float,
+                 expected_sha256: Optional[str] = None, revises: Optional[str] = None):
+        self.upload_id = upload_id
+        self.filename = filename
+        self.path = path
+        self.total_chunks = total_chunks
+        self.chunk_size = chunk_size
+        self.file_size = file_size
+        self.timeout = timeout
+        self.expected_sha256 = expected_sha256.lower() if expected_sha256 else None
+        self.revises = revises  # Document ID this file is a new version of
+        self.received = set()
+        self.chunk_lengths = {}
+        # Reentrant so callers can hold it across finalize and job submission
+        self.lock = threading.RLock()
+        self._digest = hashlib.sha256()
+        self._digested = 0  # Chunks folded into the file digest, in order
+        self.document_id = None
+        self.job_id = None
+        self.touch()
+
+        with open(path, 'ab') as f:
+            if file_size is not None:
+                # Sparse on most filesystems; chunks fill it in place
+                f.truncate(file_size)
+
+    def touch(self) -> None:
+        self.expires_at = time.time() + self.timeout
+
+    def offset(self, index: int) -> int:
+        return index * self.chunk_size
+
+    def max_chunk_length(self, index: int) -> int:
+        """Most bytes chunk index may hold; the last chunk ends at file_size when it is known"""
+        if self.file_size is None:
+            return self.chunk_size
+        return min(self.chunk_size, self.file_size - self.offset(index))
+
+    def _check_chunk(self, index: int, length: int) -> None:
+        if not 0 <= index < self.total_chunks:
+            raise UploadError(f"Chunk {index} out of range for {self.total_chunks} chunks")
+        last = index == self.total_chunks - 1
+        if self.file_size is not None:
+            expected = self.file_size - self.offset(index) if last else self.chunk_size
+            if length != expected:
+                raise UploadError(f"Chunk {index} has {length} bytes, expected {expected}")
+        elif length > self.chunk_size or (not last and length != self.chunk_size):
+            raise UploadError(f"Chunk {index} has {length} bytes, expected {self.chunk_size}")
+
+    def write_chunk(self, index: int, stream: BinaryIO, checksum: Optional[str] = None) -> None:
+        """
+        Copy a chunk from stream to its offset in the part file
+        checksum: optional SHA-256 hex digest of the chunk; on mismatch the chunk is rejected
+        and must be sent again
+        """
+        if not 0 <= index < self.total_chunks:
+            raise UploadError(f"Chunk {index} out of range for {self.total_chunks} chunks")
+        if self.document_id is not None:
+            raise UploadError('Upload already finalized')
+        with self.lock:
+            if index in self.received:
+                # A retry of a chunk that already arrived intact; keep the verified bytes
+                self.touch()
+                return
+        digest = hashlib.sha256()
+        length = 0
+        max_length = self.max_chunk_length(index)
+        with open(self.path, 'r+b') as f:
+            f.seek(self.offset(index))
+            while True:
+                block = stream.read(COPY_BLOCK_SIZE)
+                if not block:
+                    break
+                if length == 0 and index == 0 and not block.startswith(PDF_MAGIC):
+                    # Reject non-PDF uploads before the rest of the file is sent
+                    raise UploadError('File is not a PDF')
+                # Checked before writing, so an oversized chunk never lands past the end of the file
+                if length + len(block) > max_length:
+                    raise UploadError(f"Chunk {index} is larger than {max_length} bytes")
+                f.write(block)
+                digest.update(block)
+                length += len(block)
+
+        self._check_chunk(index, length)
+        if checksum and checksum.lower() != digest.hexdigest():
+            raise UploadError(f"Checksum mismatch for chunk {index}")
+
+        with self.lock:
+            self.received.add(index)
+            self.chunk_lengths[index] = length
+            self.touch()
+            self._advance_digest()
+
+    def _advance_digest(self) -> None:
+        """Fold newly contiguous chunks into the file digest (reads hit the page cache)"""
+        if self._digested not in self.received:
+            return
+        with open(self.path, 'rb') as f:
+            while self._digested in self.received:
+                f.seek(self.offset(self._digested))
+                remaining = self.chunk_lengths[self._digested]
+                while remaining:
+                    block = f.read(min(COPY_BLOCK_SIZE, remaining))
+                    if not block:
+                        break
+                    self._digest.update(block)
+                    remaining -= len(block)
+                self._digested += 1
+
+    @property
+    def complete(self) -> bool:
+        with self.lock:
+            return len(self.received) == self.total_chunks
+
+    def missing_chunks(self) -> List[int]:
+        with self.lock:
+            return [index for index in range(self.total_chunks) if index not in self.received]
+
+    def sha256(self) -> str:
+        """Digest of the whole file; only valid once every chunk has arrived"""
+        with self.lock:
+            if self._digested != self.total_chunks:
+                raise UploadError(f"Upload incomplete: {self.total_chunks - self._digested} chunks missing")
+            return self._digest.hexdigest()
+
+    def size(self) -> int:
+        with self.lock:
+            return sum(self.chunk_lengths.values())
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self.lock:
+            received = sorted(self.received)
+        return {
+            'upload_id': self.upload_id,
+            'filename': self.filename,
+            'total_chunks': self.total_chunks,
+            'chunk_size': self.chunk_size,
+            'file_size': self.file_size,
+            'received_chunks': received,
+            'complete': len(received) == self.total_chunks,
+            'document_id': self.document_id,
+            'revises': self.revises,
+            'job_id': self.job_id,
+            'expires_at': self.expires_at
+        }
+
+
+class UploadManager:
+    """
+    In-memory index of upload sessions
+    A session's ID is derived from the file name, size and a client key (for example
+    the file's modification time), so re-sending the same file resumes its session.
+    """
+
+    def __init__(self, temp_folder: str, session_timeout: float = 3600,
+                 max_file_size: Optional[int] = None):
+        self.temp_folder = temp_folder
+        self.session_timeout = session_timeout
+        self.max_file_size = max_file_size
+        self.sessions = {}
+        self.lock = threading.Lock()
+        os.makedirs(temp_folder, exist_ok=True)
+
+    @staticmethod
+    def session_id(filename: str, file_size: Optional[int], client_key: str = '') -> str:
+        return hashlib.sha256(f"{filename}\0{file_size}\0{client_key}".encode('utf-8')).hexdigest()[:32]
+
+    def open_session(self, filename: str, total_chunks: int, chunk_size: int,
+                     file_size: Optional[int] = None, client_key: str = '',
+                     sha256: Optional[str] = None, revises: Optional[str] = None) -> UploadSession:
+        """
+        Return the matching session, creating it (and its part file) if needed
+        sha256: expected digest of the whole file, verified by finalize
+        revises: ID of a registered document this file replaces
+        """
+        if total_chunks < 1 or chunk_size < 1:
+            raise UploadError('totalChunks and chunkSize must be positive')
+        if file_size is not None:
+            if self.max_file_size and file_size > self.max_file_size:
+                raise UploadError(f"File exceeds {self.max_file_size} bytes")
+            if not (total_chunks - 1) * chunk_size < file_size <= total_chunks * chunk_size:
+                raise UploadError('fileSize does not match totalChunks and chunkSize')
+
+        upload_id = self.session_id(filename, file_size, client_key)
+        with self.lock:
+            session = self.sessions.get(upload_id)
+            # Finalized sessions are not reused; sending the file again starts a new upload
+            if session is not None and session.document_id is None and os.path.exists(session.path) and \
+                    (session.total_chunks, session.chunk_size) == (total_chunks, chunk_size):
+                if revises:
+                    session.revises = revises
+                session.touch()
+                return session
+            path = os.path.join(self.temp_folder, f"{upload_id}.part")
+            if os.path.exists(path):
+                os.remove(path)
+            session = UploadSession(upload_id, filename, path, total_chunks, chunk_size,
+                                    file_size, self.session_timeout, expected_sha256=sha256,
+                                    revises=revises)
+            self.sessions[upload_id] = session
+            logger.info(f"Opened upload session {upload_id} for {filename} ({total_chunks} chunks)")
+            return session
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.sessions)
+
+    def paths(self) -> List[str]:
+        """Part files owned by live sessions"""
+        with self.lock:
+            return [session.path for session in self.sessions.values()]
+
+    def get(self, upload_id: str) -> Optional[UploadSession]:
+        with self.lock:
+            return self.sessions.get(upload_id)
+
+    def finalize(self, session: UploadSession, destination_folder: str) -> str:
+        """
+        Move a complete upload into destination_folder as <sha256>.pdf and return the digest
+        A rename, so the cost does not depend on the file size. Finalizing twice returns
+        the same digest. A digest that does not match the expected one discards the upload.
+        """
+        with session.lock:
+            if session.document_id is not None:
+                return session.document_id
+            if not session.complete:
+                raise UploadError(f"Upload incomplete, missing chunks {session.missing_chunks()}")
+            document_id = session.sha256()
+            if session.expected_sha256 and session.expected_sha256 != document_id:
+                self.discard(session.upload_id)
+                raise UploadError('File checksum mismatch, upload discarded')
+            # The file is exactly the bytes that were hashed, whatever rejected chunks left behind
+            with open(session.path, 'r+b') as f:
+                f.truncate(session.size())
+            os.replace(session.path, os.path.join(destination_folder, f"{document_id}.pdf"))
+            session.document_id = document_id
+            session.touch()
+            return document_id
+
+    def discard(self, upload_id: str) -> None:
+        with self.lock:
+            session = self.sessions.pop(upload_id, None)
+        if session is not None and os.path.exists(session.path):
+            os.remove(session.path)
+
+    def expire(self, now: Optional[float] = None) -> int:
+        """Drop sessions past their expiry time and delete their part files"""
+        now = now or time.time()
+        with self.lock:
+            expired = [upload_id for upload_id, session in self.sessions.items() if session.expires_at < now]
+        for upload_id in expired:
+            self.discard(upload_id)
+        if expired:
+            logger.info(f"Expired {len(expired)} upload sessions")
+        return len(expired)
@@ -0,0 +1,372 @@
+import numpy as np
+from typing import List, Optional, Sequence, Set, Tuple
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Content types stored in the index's type column
+CONTENT_TYPES = ('text', 'image')
+TYPE_CODES = {content_type: code for code, content_type in enumerate(CONTENT_TYPES)}
+
+# File names used by save/load
+VECTORS_FILE = 'embeddings.npy'
+COLUMNS_FILE = 'index_columns.npz'
+CODES_FILE = 'embeddings_{precision}.npy'
+
+# float32 scores the full vectors; int8 and binary score compact codes first
+PRECISIONS = ('float32', 'int8', 'binary')
+RESCORE_FACTOR = 4  # Quantized candidates per result that are rescored with the float vectors
+RESCORE_MIN_CANDIDATES = 100  # Rescored candidates at least; cheap, and keeps recall up for small top_k
+SCORE_BLOCK_ROWS = 16384  # int8 rows converted to float32 at a time while scoring
+
+# Bits set in each byte value, for numpy versions without bitwise_count
+_POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+
+def quantize(vectors: np.ndarray, precision: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Compact codes for normalized vectors
+    int8: each row scaled so its largest component maps to 127, returned with the per-row scales;
+    binary: sign bits packed 8 per byte, rows padded to whole 64-bit words, and no scales
+    """
+    if precision == 'int8':
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1.0
+        codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    if precision == 'binary':
+        codes = np.packbits(vectors > 0, axis=1)
+        padding = -codes.shape[1] % 8
+        if padding:
+            codes = np.pad(codes, ((0, 0), (0, padding)))
+        return codes, None
+    raise ValueError(f"Unsupported precision {precision}, use one of {PRECISIONS}")
+
+
+def hamming_distances(codes: np.ndarray, query_code: np.ndarray) -> np.ndarray:
+    """Bits that differ between each row of packed codes and a packed query"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(codes.view(np.uint64) ^ query_code.view(np.uint64)).sum(axis=1, dtype=np.int32)
+    return _POPCOUNT[codes ^ query_code].sum(axis=1, dtype=np.int32)
+
+
+class VectorIndex:
+    """
+    In-memory exact vector index
+    Embeddings are L2-normalized on insert and kept in one contiguous float32 matrix,
+    with parallel arrays for each row's content type, page and item id. A query is a
+    single matrix-vector product followed by an argpartition top-k.
+    With int8 or binary precision the index also keeps compact codes (4x and 32x smaller
+    than float32) and scores those instead: int8 by dot product, binary by Hamming
+    distance. The best top_k * rescore_factor candidates (at least RESCORE_MIN_CANDIDATES)
+    are then rescored with the float vectors, which are usually memory-mapped from disk
+    so only those rows are read.
+    Removed rows are skipped by searches and dropped when the index is saved.
+    Subclasses can narrow the rows a query scores by overriding _probe (see ann_index).
+    """
+
+    # Per-row metadata columns: attribute name and dtype; saved without the leading underscore
+    COLUMNS = (('_types', np.int8), ('_pages', np.int32), ('_ids', np.int64), ('_live', np.bool_))
+
+    def __init__(self, dim: Optional[int] = None, initial_capacity: int = 1024,
+                 precision: str = 'float32', rescore_factor: int = RESCORE_FACTOR):
+        """
+        precision: 'float32', 'int8' or 'binary' (see PRECISIONS)
+        rescore_factor: candidates per result rescored in full precision; 0 returns quantized scores
+        """
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unsupported precision {precision}, use one of {PRECISIONS}")
+        self.dim = dim
+        self.precision = precision
+        self.rescore_factor = rescore_factor
+        self.size = 0
+        self._capacity = 0
+        self._vectors = np.empty((0, dim or 0), dtype=np.float32)
+        self._codes = None
+        self._scales = None
+        for name, dtype in self.COLUMNS:
+            setattr(self, name, np.empty(0, dtype=dtype))
+        self.removed = 0
+        self._initial_capacity = initial_capacity
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """Normalized embeddings for the rows currently in the index"""
+        return self._vectors[:self.size]
+
+    @property
+    def codes(self) -> Optional[np.ndarray]:
+        """Quantized codes for the rows currently in the index, or None at float32 precision"""
+        return None if self._codes is None else self._codes[:self.size]
+
+    def memory_bytes(self) -> int:
+        """Bytes held in RAM; memory-mapped float vectors are not counted"""
+        total = sum(getattr(self, name).nbytes for name, _ in self.COLUMNS)
+        if not isinstance(self._vectors, np.memmap):
+            total += self._vectors.nbytes
+        for array in (self._codes, self._scales):
+            if array is not None:
+                total += array.nbytes
+        return total
+
+    @property
+    def types(self) -> np.ndarray:
+        return self._types[:self.size]
+
+    @property
+    def pages(self) -> np.ndarray:
+        return self._pages[:self.size]
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._ids[:self.size]
+
+    def _reserve(self, capacity: int) -> None:
+        """Grow the backing arrays geometrically so appends are amortized O(1)"""
+        if capacity <= self._capacity:
+            return
+        new_capacity = max(capacity, self._capacity * 2, self._initial_capacity)
+        vectors = np.empty((new_capacity, self.dim), dtype=np.float32)
+        if self.size:
+            vectors[:self.size] = self._vectors[:self.size]
+        self._vectors = vectors
+        if self.precision != 'float32':
+            width = self.dim if self.precision == 'int8' else -(-self.dim // 64) * 8
+            codes = np.empty((new_capacity, width), dtype=np.int8 if self.precision == 'int8' else np.uint8)
+            if self.size:
+                codes[:self.size] = self._codes[:self.size]
+            self._codes = codes
+        if self.precision == 'int8':
+            scales = np.empty(new_capacity, dtype=np.float32)
+            if self.size:
+                scales[:self.size] = self._scales[:self.size]
+            self._scales = scales
+        for name, dtype in self.COLUMNS:
+            column = np.empty(new_capacity, dtype=dtype)
+            column[:self.size] = getattr(self, name)[:self.size]
+            setattr(self, name, column)
+        self._capacity = new_capacity
+
+    def add(self, embeddings: Sequence[Sequence[float]], content_types: Sequence[str],
+            pages: Sequence[int], ids: Sequence[int]) -> None:
+        """Append embeddings with their content type, page number and item id"""
+        if len(embeddings) == 0:
+            return
+        vectors = np.array(embeddings, dtype=np.float32)
+        if vectors.ndim != 2:
+            raise ValueError("embeddings must be a 2D sequence")
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected embeddings of dimension {self.dim}, got {vectors.shape[1]}")
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors /= norms
+
+        # Rows are written before size is bumped, so concurrent searches that snapshot
+        # size first only ever see fully written rows
+        with self.lock:
+            count = len(vectors)
+            self._reserve(self.size + count)
+            end = self.size + count
+            self._vectors[self.size:end] = vectors
+            if self.precision != 'float32':
+                codes, scales = quantize(vectors, self.precision)
+                self._codes[self.size:end] = codes
+                if scales is not None:
+                    self._scales[self.size:end] = scales
+            self._types[self.size:end] = [TYPE_CODES[content_type] for content_type in content_types]
+            self._pages[self.size:end] = pages
+            self._ids[self.size:end] = ids
+            self._live[self.size:end] = True
+            self._added(self.size, end)
+            self.size = end
+
+    def _added(self, start: int, end: int) -> None:
+        """Hook for subclasses, called under the lock once rows start:end are written"""
+
+    def remove(self, ids: Sequence[int]) -> int:
+        """Remove the rows with these item ids; returns how many were removed"""
+        with self.lock:
+            rows = np.flatnonzero(np.isin(self._ids[:self.size], np.asarray(list(ids), dtype=np.int64))
+                                  & self._live[:self.size])
+            self._live[rows] = False
+            self.removed += len(rows)
+            return len(rows)
+
+    def _filter_mask(self, size: int, content_type: Optional[str],
+                     pages: Optional[Sequence[int]]) -> Optional[np.ndarray]:
+        mask = None
+        if content_type is not None:
+            mask = self._types[:size] == TYPE_CODES[content_type]
+        if pages is not None:
+            page_mask = np.isin(self._pages[:size], np.asarray(list(pages), dtype=np.int32))
+            mask = page_mask if mask is None else mask & page_mask
+        if self.removed:
+            mask = self._live[:size] if mask is None else mask & self._live[:size]
+        return mask
+
+    def _probe(self, query_vector: np.ndarray, size: int, top_k: int) -> Optional[np.ndarray]:
+        """Rows worth scoring for this query, preferably at least top_k; None scores every row"""
+        return None
+
+    def search(self, query: Sequence[float], top_k: int = 5, content_type: Optional[str] = None,
+               pages: Optional[Sequence[int]] = None) -> List[Tuple[float, int]]:
+        """
+        Return up to top_k (score, id) pairs ordered by descending cosine similarity
+        content_type: restrict results to 'text' or 'image' rows
+        pages: restrict results to these page numbers
+        """
+        size = self.size
+        if size == 0 or top_k <= 0:
+            return []
+        query_vector = np.asarray(query, dtype=np.float32)
+        norm = np.linalg.norm(query_vector)
+        if norm > 0:
+            query_vector = query_vector / norm
+
+        mask = self._filter_mask(size, content_type, pages)
+        candidates = self._probe(query_vector, size, top_k)
+        if candidates is None:
+            # One contiguous product over every row is faster than gathering the filtered ones
+            scores = self._scores(query_vector, size)
+            if mask is not None:
+                candidates = np.flatnonzero(mask)
+                scores = scores[candidates]
+        else:
+            if mask is not None:
+                candidates = candidates[mask[candidates]]
+            scores = self._scores(query_vector, size, candidates)
+        if len(scores) == 0:
+            return []
+
+        rescore = self.precision != 'float32' and self.rescore_factor > 0
+        k = min(max(top_k * self.rescore_factor, RESCORE_MIN_CANDIDATES) if rescore else top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        rows = top if candidates is None else candidates[top]
+        if rescore:
+            # Sorted rows keep reads from a memory-mapped matrix sequential
+            order = np.argsort(rows)
+            top, rows = top[order], rows[order]
+            scores = self._vectors[rows] @ query_vector
+            top = np.arange(len(rows))
+        order = np.argsort(-scores[top], kind='stable')[:top_k]
+        top, rows = top[order], rows[order]
+        return [(float(score), int(item_id)) for score, item_id in zip(scores[top], self._ids[rows])]
+
+    def _scores(self, query_vector: np.ndarray, size: int, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Cosine similarity of the given rows (every row if None), approximate when quantized"""
+        if self.precision == 'float32':
+            return (self._vectors[:size] if rows is None else self._vectors[rows]) @ query_vector
+        codes = self._codes[:size] if rows is None else self._codes[rows]
+        if self.precision == 'binary':
+            query_code, _ = quantize(query_vector[None, :], 'binary')
+            distances = hamming_distances(codes, query_code[0])
+            return 1 - 2 * distances.astype(np.float32) / self.dim
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_BLOCK_ROWS):
+            end = min(start + SCORE_BLOCK_ROWS, len(codes))
+            scores[start:end] = codes[start:end].astype(np.float32) @ query_vector
+        return scores * (self._scales[:size] if rows is None else self._scales[rows])
+
+    def save(self, output_dir: str) -> None:
+        """
+        Write the vectors as a raw .npy array and the metadata columns as .npz
+        Quantized codes are written alongside, so loading does not recompute them.
+        Removed rows are left out.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        vectors_path = os.path.join(output_dir, VECTORS_FILE)
+        columns_path = os.path.join(output_dir, COLUMNS_FILE)
+        keep = self._live[:self.size] if self.removed else slice(None)
+        # Write to temporary files first so a crash never leaves a half-written index
+        with open(vectors_path + '.tmp', 'wb') as f:
+            np.save(f, self.vectors[keep])
+        columns = {name[1:]: getattr(self, name)[:self.size][keep] for name, _ in self.COLUMNS}
+        if self._scales is not None:
+            columns['scales'] = self._scales[:self.size][keep]
+        with open(columns_path + '.tmp', 'wb') as f:
+            np.savez(f, **columns)
+        for precision in PRECISIONS[1:]:
+            codes_path = os.path.join(output_dir, CODES_FILE.format(precision=precision))
+            if precision == self.precision:
+                with open(codes_path + '.tmp', 'wb') as f:
+                    np.save(f, self.codes[keep])
+                os.replace(codes_path + '.tmp', codes_path)
+            elif os.path.exists(codes_path):
+                # Codes from an earlier save no longer match the vectors
+                os.remove(codes_path)
+        self._saved(output_dir)
+        os.replace(vectors_path + '.tmp', vectors_path)
+        os.replace(columns_path + '.tmp', columns_path)
+
+    def _saved(self, output_dir: str) -> None:
+        """Hook for subclasses to write their own files next to the index"""
+
+    def map_vectors(self, input_dir: str) -> None:
+        """
+        Swap the in-memory float vectors for a read-only mapping of those saved in input_dir
+        Used at int8 and binary precision, where only rescoring reads the float vectors.
+        """
+        vectors = np.load(os.path.join(input_dir, VECTORS_FILE), mmap_mode='r')
+        with self.lock:
+            if len(vectors) != self.size:
+                return
+            self._vectors = vectors
+            # The next add reallocates every column, copying the mapping back into memory
+            self._capacity = self.size
+
+    @classmethod
+    def load(cls, input_dir: str, mmap: bool = True, precision: str = 'float32',
+             rescore_factor: int = RESCORE_FACTOR, **options) -> 'VectorIndex':
+        """
+        Load an index written by save
+        mmap: memory-map the vectors read-only instead of reading them into RAM.
+        Searches run directly on the mapping; the first add copies it into memory.
+        Quantized codes are read into RAM, or computed from the vectors if the index
+        was saved at another precision.
+        options: passed to the constructor of subclasses
+        """
+        vectors = np.load(os.path.join(input_dir, VECTORS_FILE), mmap_mode='r' if mmap else None)
+        index = cls(dim=vectors.shape[1] if len(vectors) else None, precision=precision,
+                    rescore_factor=rescore_factor, **options)
+        index._vectors = vectors
+        index.size = len(vectors)
+        index._capacity = len(vectors)
+        with np.load(os.path.join(input_dir, COLUMNS_FILE)) as columns:
+            saved_columns = set(columns.files)
+            for name, dtype in cls.COLUMNS:
+                if name[1:] in columns:
+                    setattr(index, name, columns[name[1:]])
+                elif name == '_live':
+                    # Saved before rows could be removed
+                    index._live = np.ones(len(vectors), dtype=np.bool_)
+                else:
+                    setattr(index, name, np.zeros(len(vectors), dtype=dtype))
+            scales = columns['scales'] if 'scales' in columns else None
+
+        if precision != 'float32' and len(vectors):
+            codes_path = os.path.join(input_dir, CODES_FILE.format(precision=precision))
+            if os.path.exists(codes_path) and (precision == 'binary' or scales is not None):
+                index._codes = np.load(codes_path)
+                index._scales = scales if precision == 'int8' else None
+            else:
+                logger.info(f"Quantizing {len(vectors)} vectors to {precision}")
+                # In blocks, so a memory-mapped matrix is never read into RAM all at once
+                blocks = [quantize(np.asarray(vectors[start:start + SCORE_BLOCK_ROWS]), precision)
+                          for start in range(0, len(vectors), SCORE_BLOCK_ROWS)]
+                index._codes = np.concatenate([codes for codes, _ in blocks])
+                if precision == 'int8':
+                    index._scales = np.concatenate([block_scales for _, block_scales in blocks])
+        index._loaded(input_dir, saved_columns)
+        return index
+
+    def _loaded(self, input_dir: str, saved_columns: Set[str]) -> None:
+        """Hook for subclasses to read their own files once the columns are loaded"""